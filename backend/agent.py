@@ -2,15 +2,30 @@ import asyncio
 import json
 from typing import Dict, List, TypedDict, Annotated, AsyncGenerator, Optional
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.tools import tool
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 import logging
 import os
+import re
+import time
+from contextlib import asynccontextmanager
 
 from config import settings
+from resilience import ResilientCaller
+from text_analysis import key_themes, score_response, text_structure
+from offload import offloader
+from retrieval import build_continuation_context, head_within
+from prompts import PromptLibrary, token_counter
+from replay import wrap_for_mode
+from document_store import DocumentStore, load_embedder
+from response_cache import ResponseCache
+from usage import UsageLedger, UsageTracker, current_tenant
+from rate_limits import AdaptiveRateLimiter
+from scheduler import Priority, PriorityScheduler
 
 # Initialize LangSmith tracing
 if settings.langsmith_api_key and settings.langsmith_tracing:
@@ -21,36 +36,48 @@ if settings.langsmith_api_key and settings.langsmith_tracing:
 
 logger = logging.getLogger(__name__)
 
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt exceeds every configured model's context limit"""
+
+
+class AgentResponseError(RuntimeError):
+    """Raised by complete_text when the agent run ended in an error response"""
+
+
+# Word-sized streaming pieces that together reproduce the text exactly
+WORD_CHUNK = re.compile(r"\S+\s*|\s+")
+
 # Define the state structure
 class WritingState(TypedDict):
-    messages: Annotated[List[BaseMessage], "The conversation messages"]
+    messages: Annotated[List[BaseMessage], add_messages]  # Nodes return only new messages
     content: str
     context: Dict
     action: str
     iterations: int
     max_iterations: int
+    references: List[str]
+
+def compact_tool_output(text: str) -> str:
+    """Cap tool output kept in the conversation state"""
+    limit = settings.tool_output_max_chars
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"... [{len(text) - limit} characters truncated]"
+
+# Text analysis of large documents runs off the event loop
+for analysis_function in (text_structure, key_themes, score_response):
+    offloader.register(analysis_function, settings.offload_min_chars)
 
 # Define writing tools
 @tool
-def analyze_text_structure(text: str) -> str:
+async def analyze_text_structure(text: str) -> str:
     """Analyze the structure and organization of text content."""
     if not text.strip():
         return "Empty text provided"
     
-    lines = text.split('\n')
-    paragraphs = [p for p in text.split('\n\n') if p.strip()]
-    words = len(text.split())
-    chars = len(text)
-    
-    analysis = {
-        "word_count": words,
-        "character_count": chars,
-        "line_count": len(lines),
-        "paragraph_count": len(paragraphs),
-        "structure": "multi-paragraph" if len(paragraphs) > 1 else "single-block"
-    }
-    
-    return f"Text Analysis: {json.dumps(analysis, indent=2)}"
+    analysis = await offloader.run(text_structure, text)
+    return compact_tool_output(f"Text Analysis: {json.dumps(analysis, separators=(',', ':'))}")
 
 @tool
 def suggest_improvements(text: str, focus: str = "general") -> str:
@@ -82,30 +109,17 @@ def suggest_improvements(text: str, focus: str = "general") -> str:
             "Remove unnecessary words and phrases"
         ])
     
-    return f"Improvement suggestions for {focus}: " + "; ".join(suggestions)
+    return compact_tool_output(f"Improvement suggestions for {focus}: " + "; ".join(suggestions))
 
 @tool
-def extract_key_themes(text: str) -> str:
+async def extract_key_themes(text: str) -> str:
     """Extract and identify key themes and topics from the text."""
     if not text.strip():
         return "No themes found in empty text"
     
     # Simple keyword extraction (in production, you'd use more sophisticated NLP)
-    words = text.lower().split()
-    word_freq = {}
-    
-    # Count word frequency (excluding common words)
-    common_words = {'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those'}
-    
-    for word in words:
-        clean_word = ''.join(c for c in word if c.isalnum())
-        if len(clean_word) > 3 and clean_word not in common_words:
-            word_freq[clean_word] = word_freq.get(clean_word, 0) + 1
-    
-    # Get top themes
-    top_themes = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    return f"Key themes identified: {[theme[0] for theme in top_themes]}"
+    themes = await offloader.run(key_themes, text)
+    return compact_tool_output(f"Key themes identified: {themes}")
 
 # Create tools list
 tools = [analyze_text_structure, suggest_improvements, extract_key_themes]
@@ -113,33 +127,120 @@ tools = [analyze_text_structure, suggest_improvements, extract_key_themes]
 class WritingAgent:
     def __init__(self):
         self.llm = None
+        self.draft_llm = None
         self.graph = None
+        self.resilience = ResilientCaller.from_settings()
+        self.draft_resilience = ResilientCaller.from_settings(hedge=False)
+        self.document_store = None
+        self.response_cache = ResponseCache(
+            max_entries=settings.response_cache_max_entries,
+            ttl_seconds=settings.response_cache_ttl_seconds,
+            threshold=settings.near_duplicate_threshold,
+            verify_rate=settings.near_duplicate_verify_rate
+        ) if settings.response_cache_enabled else None
+        self.usage = UsageTracker(
+            ledger=UsageLedger(settings.usage_ledger_path) if settings.usage_ledger_path else None,
+            default_budget=settings.tenant_token_budget,
+            budgets=settings.tenant_token_budgets,
+            window_seconds=settings.tenant_budget_window_seconds,
+            max_concurrent=settings.tenant_max_concurrent_requests
+        )
+        # Providers report a separate quota per model, so each model gets its own limiter
+        self.rate_limiters: Dict[str, AdaptiveRateLimiter] = {}
+        self.rate_limiter = self.rate_limiter_for(settings.openai_model)
+        self.scheduler = PriorityScheduler(
+            slots=settings.llm_scheduler_slots,
+            mode=settings.scheduler_mode,
+            weights={
+                Priority.INTERACTIVE: settings.scheduler_interactive_weight,
+                Priority.BACKGROUND: settings.scheduler_background_weight
+            },
+            slo_p95={
+                Priority.INTERACTIVE: settings.slo_interactive_p95_ms / 1000,
+                Priority.BACKGROUND: settings.slo_background_p95_ms / 1000
+            }
+        )
+        # Load the tokenizer and compile the static prompts once
+        token_counter.load()
+        self.prompts = PromptLibrary(token_counter)
+        self.long_llm = None
         self._initialize_agent()
     
     def _initialize_agent(self):
         """Initialize the LangGraph agent with proper configuration"""
         try:
             # Initialize the LLM
-            if not settings.openai_api_key:
+            if settings.llm_mode == "replay":
+                # Recorded traffic stands in for the provider; no key or network needed
+                logger.info(f"Replaying LLM traffic from {settings.llm_cassette_dir}")
+                self.llm = self._apply_llm_mode(None, settings.openai_model)
+                if settings.long_context_model:
+                    self.long_llm = self._apply_llm_mode(None, settings.long_context_model)
+                if settings.draft_model:
+                    self.draft_llm = self._apply_llm_mode(None, settings.draft_model)
+            elif not settings.openai_api_key:
                 logger.warning("OpenAI API key not provided - agent will use mock responses")
                 self.llm = None
             else:
+                # Retries and timeouts are handled by the resilience layer
                 self.llm = ChatOpenAI(
-                    model="gpt-4-turbo-preview",
+                    model=settings.openai_model,
                     temperature=0.7,
                     streaming=True,
+                    stream_usage=True,
+                    include_response_headers=True,
+                    max_retries=0,
                     api_key=settings.openai_api_key
                 )
+                
+                # Larger-context model for prompts over the main model's limit
+                if settings.long_context_model:
+                    self.long_llm = ChatOpenAI(
+                        model=settings.long_context_model,
+                        temperature=0.7,
+                        streaming=True,
+                        stream_usage=True,
+                        include_response_headers=True,
+                        max_retries=0,
+                        api_key=settings.openai_api_key
+                    )
+                
+                # Small, fast model used for speculative drafts
+                if settings.draft_model:
+                    self.draft_llm = ChatOpenAI(
+                        model=settings.draft_model,
+                        temperature=0.7,
+                        streaming=True,
+                        stream_usage=True,
+                        include_response_headers=True,
+                        max_retries=0,
+                        api_key=settings.openai_api_key
+                    )
+                
+                # In record mode, capture traffic to cassettes
+                self.llm = self._apply_llm_mode(self.llm, settings.openai_model)
+                self.long_llm = self._apply_llm_mode(self.long_llm, settings.long_context_model)
+                self.draft_llm = self._apply_llm_mode(self.draft_llm, settings.draft_model)
+            
+            # Open the local document store used for retrieval
+            if settings.document_store_path:
+                self.document_store = DocumentStore(
+                    settings.document_store_path,
+                    load_embedder(settings.document_store_embedder, settings.document_store_embedding_dim),
+                    settings.document_store_embedding_dim
+                )
             
             # Create the state graph
             workflow = StateGraph(WritingState)
             
             # Add nodes
+            workflow.add_node("retrieve", self.retrieve_node)
             workflow.add_node("agent", self.agent_node)
             workflow.add_node("tools", ToolNode(tools))
             
             # Set entry point
-            workflow.set_entry_point("agent")
+            workflow.set_entry_point("retrieve")
+            workflow.add_edge("retrieve", "agent")
             
             # Add conditional edges
             workflow.add_conditional_edges(
@@ -163,101 +264,131 @@ class WritingAgent:
             logger.error(f"Failed to initialize writing agent: {str(e)}")
             self.graph = None
 
+    def _apply_llm_mode(self, llm, model: str):
+        """Wrap a chat model for the configured record/replay mode"""
+        return wrap_for_mode(llm, model, settings.llm_mode, settings.llm_cassette_dir, settings.llm_replay_time_scale)
+
     def is_ready(self) -> bool:
         """Check if the agent is ready to process requests"""
         return self.graph is not None
 
+    def _build_messages(self, action: str, content: str, context: Dict, references: List[str] = None) -> List[BaseMessage]:
+        """Build the initial system and user messages for an action"""
+        
+        # Create the user message for the action
+        if action == "generate" and context.get("type") == "continuation":
+            user_message = self._continuation_message(context)
+            if context.get("style"):
+                user_message += f"\n\n**Style:** {context['style']}"
+            if context.get("length"):
+                user_message += f"\n**Length:** {context['length']}"
+        elif action == "generate":
+            user_message = f"Please help me generate text based on this prompt: {content}"
+            if context.get("precedingText"):
+                _, window = build_continuation_context(
+                    context["precedingText"],
+                    settings.continuation_window_tokens,
+                    0,
+                    0
+                )
+                if window:
+                    user_message += f"\n\n**Text before the cursor:**\n\n{window}"
+            if context.get("style"):
+                user_message += f"\n\n**Style:** {context['style']}"
+            if context.get("length"):
+                user_message += f"\n**Length:** {context['length']}"
+        elif action == "edit":
+            user_message = f"Please help me edit and improve this text:\n\n{content}"
+            if context.get("focus"):
+                user_message += f"\n\n**Focus on:** {context['focus']}"
+        else:  # improve
+            user_message = f"Please help me improve this text:\n\n{content}"
+            if context.get("aspect"):
+                user_message += f"\n\n**Specific aspect:** {context['aspect']}"
+        
+        if context.get("variant"):
+            variant = context["variant"]
+            user_message += (
+                f"\n\n**Alternative {variant['index'] + 1} of {variant['count']}:** "
+                "take a distinct approach in wording and structure."
+            )
+        
+        if references:
+            user_message += "\n\n**Reference passages from earlier documents (match their terminology and style):**\n\n"
+            user_message += "\n\n".join(f"> {reference}" for reference in references)
+        
+        # System messages are compiled once; only the user message is built per call
+        return [
+            self.prompts.system(action),
+            HumanMessage(content=user_message)
+        ]
+
+    def _continuation_message(self, context: Dict) -> str:
+        """Build a continuation request from a token-budgeted window around the cursor"""
+        preceding = context.get("precedingText") or context.get("continueFrom", "")
+        retrieved, window = build_continuation_context(
+            preceding,
+            settings.continuation_window_tokens,
+            settings.continuation_retrieval_tokens,
+            settings.continuation_top_k
+        )
+        
+        user_message = "Continue the document from the cursor. Write only the new text that follows, matching the existing voice and style."
+        if retrieved:
+            user_message += "\n\n**Relevant earlier passages:**\n\n" + "\n\n".join(retrieved)
+        user_message += f"\n\n**Text before the cursor:**\n\n{window}"
+        if context.get("followingText"):
+            following = head_within(context["followingText"], settings.continuation_following_tokens)
+            user_message += f"\n\n**Text after the cursor:**\n\n{following}"
+        return user_message
+
+    async def retrieve_node(self, state: WritingState) -> Dict:
+        """Look up related passages from the document store for edit and improve"""
+        if self.document_store is None or state.get("action") not in ("edit", "improve"):
+            return {"references": []}
+        
+        try:
+            context = state.get("context", {})
+            results = await asyncio.to_thread(
+                self.document_store.search,
+                state.get("content", ""),
+                settings.document_store_top_k,
+                context.get("documentId")
+            )
+            return {"references": [result["text"] for result in results]}
+        except Exception as e:
+            logger.error(f"Retrieval error: {str(e)}")
+            return {"references": []}
+
     async def agent_node(self, state: WritingState) -> Dict:
         """The main agent reasoning node"""
+        # Only new messages are returned; the add_messages reducer appends them to the state
+        new_messages: List[BaseMessage] = []
+        iterations = state.get("iterations", 0)
         try:
             # Get the latest messages
             messages = state.get("messages", [])
             content = state.get("content", "")
             context = state.get("context", {})
             action = state.get("action", "generate")
-            iterations = state.get("iterations", 0)
-            
-            # Create system message based on action
-            system_prompts = {
-                "generate": """You are an expert writing assistant. When asked to generate text, provide ONLY the clean, well-written content that should be inserted directly into the document. 
-
-DO NOT include:
-- Explanatory text like "Here's a draft" or "Based on your prompt"
-- Meta-commentary about the writing process
-- Markdown headers or formatting (the editor will handle formatting)
-- References to the prompt or instructions
-
-DO provide:
-- Clean, polished prose that directly fulfills the request
-- Natural paragraph breaks using double line breaks
-- Content that flows seamlessly as if written by the user
-
-Available tools:
-- analyze_text_structure: Analyze text structure and organization
-- suggest_improvements: Get specific improvement suggestions  
-- extract_key_themes: Identify key themes and topics
-
-Focus on producing clean, insertable content only.""",
-                
-                "edit": """You are an expert editor. Help users improve and refine their existing text.
-                
-Available tools:
-- analyze_text_structure: Analyze current text structure
-- suggest_improvements: Get targeted improvement suggestions
-- extract_key_themes: Understand content themes
-
-Focus on clarity, coherence, and effective communication. Format your responses using markdown for better readability.""",
-                
-                "improve": """You are an expert writing improvement specialist. When asked to improve text, provide ONLY the improved version of the content that should replace the original text in the document.
-
-DO NOT include:
-- Explanatory text about what you changed or why
-- Meta-commentary about the improvement process
-- Markdown headers or formatting (the editor will handle formatting)
-- Analysis or suggestions - just the improved content
-
-DO provide:
-- Clean, polished prose that improves upon the original
-- Natural paragraph breaks using double line breaks
-- Content that flows seamlessly as if written by the user
-- Enhanced clarity, engagement, and readability
-
-Available tools:
-- analyze_text_structure: Analyze text structure and organization
-- suggest_improvements: Get specific improvement suggestions  
-- extract_key_themes: Identify key themes and topics
-
-Focus on producing clean, improved content only."""
-            }
-            
-            system_prompt = system_prompts.get(action, system_prompts["generate"])
             
             # Create the conversation messages if not already present
             if not messages:
-                if action == "generate":
-                    user_message = f"Please help me generate text based on this prompt: {content}"
-                    if context.get("style"):
-                        user_message += f"\n\n**Style:** {context['style']}"
-                    if context.get("length"):
-                        user_message += f"\n**Length:** {context['length']}"
-                elif action == "edit":
-                    user_message = f"Please help me edit and improve this text:\n\n{content}"
-                    if context.get("focus"):
-                        user_message += f"\n\n**Focus on:** {context['focus']}"
-                else:  # improve
-                    user_message = f"Please help me improve this text:\n\n{content}"
-                    if context.get("aspect"):
-                        user_message += f"\n\n**Specific aspect:** {context['aspect']}"
-                
-                messages = [
-                    SystemMessage(content=system_prompt),
-                    HumanMessage(content=user_message)
-                ]
+                new_messages = self._build_messages(action, content, context, state.get("references"))
+                messages = new_messages
             
             # Generate response
             if self.llm:
-                response = await self.llm.ainvoke(messages)
-                messages.append(response)
+                # Pick a model that fits the prompt before paying for a call
+                prompt_tokens = self.prompts.count_messages(messages)
+                llm, model = self._route(prompt_tokens)
+                started = time.monotonic()
+                async with self._llm_slot(model, prompt_tokens):
+                    # Only the provider call is timed, retried and hedged, not the wait for a slot
+                    response = await self.resilience.invoke(lambda: llm.ainvoke(messages))
+                # Headers are only needed here; don't keep them in the graph state
+                self.rate_limiter_for(model).update(response.response_metadata.pop("headers", None))
+                self.usage.record(action, model, response.usage_metadata, time.monotonic() - started)
             else:
                 # Mock response for development without API key
                 if action == "generate":
@@ -279,21 +410,53 @@ This improved version showcases the writing assistant's ability to transform goo
                     mock_response = f"**Mock Response for {action}**\n\nThis is a simulated writing assistant response with *proper markdown formatting* for development purposes.\n\n### Key Features\n- ✅ Proper message structure\n- ✅ Markdown formatting\n- ✅ SystemMessage usage\n\n> This demonstrates how responses will be formatted when the API is configured."
                 
                 response = AIMessage(content=mock_response)
-                messages.append(response)
             
             return {
-                "messages": messages,
+                "messages": new_messages + [response],
                 "iterations": iterations + 1
             }
             
         except Exception as e:
             logger.error(f"Agent node error: {str(e)}")
-            error_message = AIMessage(content=f"I encountered an error: {str(e)}")
+            error_message = AIMessage(content=f"I encountered an error: {str(e)}", additional_kwargs={"error": True})
             return {
-                "messages": messages + [error_message],
+                "messages": new_messages + [error_message],
                 "iterations": iterations + 1
             }
 
+    def rate_limiter_for(self, model: str) -> AdaptiveRateLimiter:
+        """The adaptive limiter tracking one model's quota"""
+        limiter = self.rate_limiters.get(model)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(
+                max_concurrency=settings.llm_max_concurrency,
+                background_reserve=settings.rate_limit_background_reserve
+            )
+            self.rate_limiters[model] = limiter
+        return limiter
+
+    def _route(self, prompt_tokens: int):
+        """Choose the (llm, model name) for a prompt size, rejecting prompts no model can take"""
+        if prompt_tokens <= settings.prompt_token_limit:
+            return self.llm, settings.openai_model
+        if self.long_llm is not None and prompt_tokens <= settings.long_context_token_limit:
+            logger.info(f"Routing {prompt_tokens}-token prompt to {settings.long_context_model}")
+            return self.long_llm, settings.long_context_model
+        raise PromptTooLongError(
+            f"Content is too long ({prompt_tokens} tokens, limit {settings.prompt_token_limit}). "
+            "Select a shorter passage."
+        )
+
+    @asynccontextmanager
+    async def _llm_slot(self, model: str, prompt_tokens: int):
+        """Admit one call to a model: wait for its quota first, then for a scheduler slot.
+
+        A call the rate limiter is holding back must not occupy a scheduler slot
+        that an interactive call could use.
+        """
+        async with self.rate_limiter_for(model).slot(prompt_tokens), self.scheduler.slot():
+            yield
+
     def should_continue(self, state: WritingState) -> str:
         """Determine whether to continue with tools or end"""
         messages = state.get("messages", [])
@@ -310,34 +473,63 @@ This improved version showcases the writing assistant's ability to transform goo
         
         return "end"
 
+    def stream_action(self, action: str, content: str, context: Dict = None) -> AsyncGenerator:
+        """Return the streaming generator for an action name"""
+        handlers = {
+            "generate": self.generate_text,
+            "edit": self.edit_text,
+            "improve": self.improve_text,
+        }
+        if action not in handlers:
+            raise ValueError(f"Unknown action: {action}")
+        return handlers[action](content, context or {})
+
+    async def _agent_responses(self, action: str, content: str, context: Dict) -> AsyncGenerator[AIMessage, None]:
+        """Run the agent graph and yield each AI message it produces"""
+        initial_state = WritingState(
+            messages=[],
+            content=content,
+            context=context,
+            action=action,
+            iterations=0,
+            max_iterations=3
+        )
+        
+        async for output in self.graph.astream(initial_state):
+            for node_name, node_output in output.items():
+                if node_name == "agent" and "messages" in node_output:
+                    messages = node_output["messages"]
+                    if messages and isinstance(messages[-1], AIMessage) and messages[-1].content:
+                        yield messages[-1]
+
+    def _is_cacheable(self, action: str) -> bool:
+        return self.response_cache is not None and action in settings.response_cache_actions
+
+    async def _stream_action(self, action: str, content: str, context: Dict) -> AsyncGenerator[str, None]:
+        """Stream an action's response, serving identical or near-identical requests from the cache"""
+        if self._is_cacheable(action):
+            cached = self.response_cache.lookup(current_tenant.get(), action, content, context)
+            if cached is not None:
+                for piece in WORD_CHUNK.findall(cached):
+                    yield piece
+                return
+        
+        final_message = None
+        async for message in self._agent_responses(action, content, context):
+            final_message = message
+            # The message is already complete; word pieces keep whitespace and paragraph
+            # breaks, and the SSE writer coalesces them into frames without any delay
+            for piece in WORD_CHUNK.findall(message.content):
+                yield piece
+        
+        if self._is_cacheable(action) and final_message and not final_message.additional_kwargs.get("error"):
+            self.response_cache.store(current_tenant.get(), action, content, context, final_message.content)
+
     async def generate_text(self, prompt: str, context: Dict = None) -> AsyncGenerator[str, None]:
         """Generate text based on prompt with streaming"""
         try:
-            if context is None:
-                context = {}
-                
-            initial_state = WritingState(
-                messages=[],
-                content=prompt,
-                context=context,
-                action="generate",
-                iterations=0,
-                max_iterations=3
-            )
-            
-            # Stream the results
-            async for output in self.graph.astream(initial_state):
-                for node_name, node_output in output.items():
-                    if node_name == "agent" and "messages" in node_output:
-                        messages = node_output["messages"]
-                        if messages and isinstance(messages[-1], AIMessage):
-                            content = messages[-1].content
-                            if content:
-                                # Simulate streaming by yielding chunks
-                                words = content.split()
-                                for word in words:
-                                    yield word + " "
-                                    await asyncio.sleep(0.05)  # Small delay for streaming effect
+            async for chunk in self._stream_action("generate", prompt, context or {}):
+                yield chunk
                                     
         except Exception as e:
             logger.error(f"Generate text error: {str(e)}")
@@ -346,29 +538,8 @@ This improved version showcases the writing assistant's ability to transform goo
     async def edit_text(self, content: str, context: Dict = None) -> AsyncGenerator[str, None]:
         """Edit existing text with streaming"""
         try:
-            if context is None:
-                context = {}
-                
-            initial_state = WritingState(
-                messages=[],
-                content=content,
-                context=context,
-                action="edit",
-                iterations=0,
-                max_iterations=3
-            )
-            
-            async for output in self.graph.astream(initial_state):
-                for node_name, node_output in output.items():
-                    if node_name == "agent" and "messages" in node_output:
-                        messages = node_output["messages"]
-                        if messages and isinstance(messages[-1], AIMessage):
-                            content = messages[-1].content
-                            if content:
-                                words = content.split()
-                                for word in words:
-                                    yield word + " "
-                                    await asyncio.sleep(0.05)
+            async for chunk in self._stream_action("edit", content, context or {}):
+                yield chunk
                                     
         except Exception as e:
             logger.error(f"Edit text error: {str(e)}")
@@ -377,30 +548,140 @@ This improved version showcases the writing assistant's ability to transform goo
     async def improve_text(self, content: str, context: Dict = None) -> AsyncGenerator[str, None]:
         """Improve existing text with streaming"""
         try:
-            if context is None:
-                context = {}
-                
-            initial_state = WritingState(
-                messages=[],
-                content=content,
-                context=context,
-                action="improve",
-                iterations=0,
-                max_iterations=3
-            )
-            
-            async for output in self.graph.astream(initial_state):
-                for node_name, node_output in output.items():
-                    if node_name == "agent" and "messages" in node_output:
-                        messages = node_output["messages"]
-                        if messages and isinstance(messages[-1], AIMessage):
-                            content = messages[-1].content
-                            if content:
-                                words = content.split()
-                                for word in words:
-                                    yield word + " "
-                                    await asyncio.sleep(0.05)
+            async for chunk in self._stream_action("improve", content, context or {}):
+                yield chunk
                                     
         except Exception as e:
             logger.error(f"Improve text error: {str(e)}")
-            yield f"Error improving text: {str(e)}" 
\ No newline at end of file
+            yield f"Error improving text: {str(e)}"
+
+    async def complete_text(self, action: str, content: str, context: Dict = None, prefetch: bool = False) -> str:
+        """Run the agent graph to completion and return the final response text.
+
+        Prefetch runs leave the cache hit statistics alone and mark their entry as prefetched.
+        Raises AgentResponseError when the run ended in an error response.
+        """
+        if context is None:
+            context = {}
+        
+        if self._is_cacheable(action):
+            cached = self.response_cache.lookup(current_tenant.get(), action, content, context, track=not prefetch)
+            if cached is not None:
+                return cached
+        
+        final_message = None
+        async for message in self._agent_responses(action, content, context):
+            final_message = message
+        
+        if final_message is None:
+            return ""
+        if final_message.additional_kwargs.get("error"):
+            raise AgentResponseError(final_message.content)
+        if self._is_cacheable(action):
+            self.response_cache.store(
+                current_tenant.get(), action, content, context, final_message.content, prefetched=prefetch
+            )
+        return final_message.content
+
+    async def stream_variants(self, action: str, content: str, context: Dict = None, count: int = 2) -> AsyncGenerator:
+        """Stream several alternative responses concurrently, then rank them.
+
+        Chunk events carry their variant index and interleave as they arrive; a
+        final ranking event orders the variants by a local score, best first.
+        """
+        context = context or {}
+        queue: asyncio.Queue = asyncio.Queue()
+        texts = [""] * count
+        errors = [False] * count
+        
+        async def run(index: int):
+            variant_context = {**context, "variant": {"index": index, "count": count}}
+            try:
+                async for message in self._agent_responses(action, content, variant_context):
+                    errors[index] = bool(message.additional_kwargs.get("error"))
+                    texts[index] += message.content
+                    for piece in WORD_CHUNK.findall(message.content):
+                        await queue.put({"event": "chunk", "content": piece, "variant": index})
+            except Exception as e:
+                logger.error(f"Variant {index} error: {str(e)}")
+                errors[index] = True
+                await queue.put({"event": "chunk", "content": f"Error: {str(e)}", "variant": index})
+            finally:
+                await queue.put(index)  # Marks the variant as finished
+        
+        tasks = [asyncio.create_task(run(index)) for index in range(count)]
+        try:
+            running = count
+            while running:
+                item = await queue.get()
+                if isinstance(item, int):
+                    running -= 1
+                    continue
+                yield item
+            
+            scores = await asyncio.gather(*(
+                offloader.run(score_response, texts[index], content, action, errors[index])
+                for index in range(count)
+            ))
+            ranking = [{"variant": index, **score} for index, score in enumerate(scores)]
+            ranking.sort(key=lambda entry: entry["score"], reverse=True)
+            yield {"event": "ranking", "variants": ranking}
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate_text_speculative(self, prompt: str, context: Dict = None) -> AsyncGenerator:
+        """Stream a fast draft from the draft model, then replace it with the main model's text.
+        
+        Draft chunks are yielded as provisional chunk events while the full agent graph
+        runs in parallel; a final replace event carries the authoritative text.
+        """
+        if context is None:
+            context = {}
+        
+        # Without both models there is nothing to speculate with, and long prompts skip the draft
+        draft_messages = self._build_messages("generate", prompt, context) if self.draft_llm else None
+        draft_tokens = self.prompts.count_messages(draft_messages) if draft_messages else 0
+        if not self.llm or not self.draft_llm or draft_tokens > settings.draft_prompt_token_limit:
+            async for chunk in self.generate_text(prompt, context):
+                yield chunk
+            return
+        
+        final_task = asyncio.create_task(self.complete_text("generate", prompt, context))
+        try:
+            try:
+                # The draft is admitted like any other call, and gives its slot back when it stops
+                async with self._llm_slot(settings.draft_model, draft_tokens):
+                    started = time.monotonic()
+                    draft = self.draft_resilience.stream(lambda: self.draft_llm.astream(draft_messages))
+                    try:
+                        async for chunk in draft:
+                            # The first draft chunk carries the response headers, the last one token usage
+                            self.rate_limiter_for(settings.draft_model).update(chunk.response_metadata.get("headers"))
+                            if chunk.usage_metadata:
+                                self.usage.record("generate_draft", settings.draft_model, chunk.usage_metadata, time.monotonic() - started)
+                            # Stop drafting as soon as the main model has finished
+                            if final_task.done():
+                                break
+                            if chunk.content:
+                                yield {"event": "chunk", "content": chunk.content, "provisional": True}
+                    finally:
+                        # Breaking out does not close the provider stream
+                        await draft.aclose()
+            except Exception as e:
+                logger.warning(f"Draft generation failed, waiting for main model: {str(e)}")
+            
+            try:
+                final_text = await final_task
+            except AgentResponseError as e:
+                # The error text replaces the draft, as in a non-speculative stream
+                final_text = str(e)
+            yield {"event": "replace", "content": final_text}
+            
+        except Exception as e:
+            logger.error(f"Speculative generate error: {str(e)}")
+            yield f"Error generating text: {str(e)}"
+        finally:
+            if not final_task.done():
+                final_task.cancel()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+Batch processing for offline bulk document jobs.
+Reads JSONL records of {id, action, content, context}, runs them through the
+WritingAgent with bounded parallelism and streams JSONL results.
+
+Usage:
+    python batch.py input.jsonl -o results.jsonl --concurrency 8
+
+Re-running with the same output file skips records that already succeeded.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterable, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+from config import settings
+from scheduler import Priority, current_priority
+from usage import DEFAULT_TENANT, current_tenant
+
+logger = logging.getLogger(__name__)
+
+VALID_ACTIONS = {"generate", "edit", "improve"}
+
+
+class BatchStats:
+    """Counters and throughput for a batch run"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed
+
+    def records_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> Dict:
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "records_per_second": round(self.records_per_second(), 3),
+        }
+
+
+def parse_record(line_number: int, line: str) -> Optional[Dict]:
+    """Parse one JSONL line into a record, defaulting the id to the line number"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": str(line_number), "error": f"Invalid JSON: {str(e)}"}
+    if not isinstance(record, dict):
+        return {"id": str(line_number), "error": "Record must be a JSON object"}
+    record["id"] = str(record.get("id") or line_number)
+    return record
+
+
+def parse_records(lines: Iterable[str]) -> Iterator[Dict]:
+    """Parse JSONL lines into records"""
+    for line_number, line in enumerate(lines, start=1):
+        record = parse_record(line_number, line)
+        if record is not None:
+            yield record
+
+
+async def read_lines(chunks: AsyncIterable[bytes]) -> AsyncGenerator[str, None]:
+    """Split a byte stream into text lines as it arrives"""
+    pending: List[bytes] = []
+    async for chunk in chunks:
+        if b"\n" not in chunk:
+            pending.append(chunk)
+            continue
+        lines = chunk.split(b"\n")
+        lines[0] = b"".join(pending) + lines[0]
+        pending = [lines.pop()]
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    tail = b"".join(pending)
+    if tail:
+        yield tail.decode("utf-8", errors="replace")
+
+
+async def parse_record_stream(lines: AsyncIterable[str], skip_ids: Set[str]) -> AsyncGenerator[Dict, None]:
+    """Parse streamed JSONL lines into records.
+
+    Result lines from an earlier run may precede the records; those that
+    succeeded add their ids to skip_ids, so a job resumes by sending its
+    previous output ahead of its input.
+    """
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        record = parse_record(line_number, line)
+        if record is None:
+            continue
+        if "status" in record:
+            if record["status"] == "ok":
+                skip_ids.add(record["id"])
+            continue
+        yield record
+
+
+def load_completed_ids(path: Path) -> Set[str]:
+    """Collect ids of records that already succeeded in a previous run's output"""
+    completed = set()
+    if not path.exists():
+        return completed
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written last line from an interrupted run
+            if result.get("status") == "ok" and "id" in result:
+                completed.add(str(result["id"]))
+    return completed
+
+
+async def _iterate(records: Iterable[Dict]) -> AsyncGenerator[Dict, None]:
+    for record in records:
+        yield record
+
+
+async def process_record(agent, record: Dict) -> Dict:
+    """Run a single record through the agent"""
+    record_id = record["id"]
+    if "error" in record:
+        return {"id": record_id, "status": "error", "error": record["error"]}
+
+    action = record.get("action", "improve")
+    if action not in VALID_ACTIONS:
+        return {"id": record_id, "status": "error", "error": f"Unknown action: {action}"}
+
+    start = time.monotonic()
+    try:
+        text = await agent.complete_text(action, record.get("content", ""), record.get("context") or {})
+    except Exception as e:
+        logger.error(f"Batch record {record_id} failed: {str(e)}")
+        return {"id": record_id, "status": "error", "error": str(e)}
+
+    return {
+        "id": record_id,
+        "action": action,
+        "status": "ok",
+        "result": text,
+        "latency_ms": round((time.monotonic() - start) * 1000, 1),
+    }
+
+
+async def run_batch(
+    agent,
+    records: Union[Iterable[Dict], AsyncIterable[Dict]],
+    concurrency: int,
+    skip_ids: Optional[Set[str]] = None,
+    stats: Optional[BatchStats] = None,
+) -> AsyncGenerator[Dict, None]:
+    """Process records with bounded parallelism, yielding results as they finish.
+
+    Records are pulled lazily from the iterable, which may be async, so
+    arbitrarily large inputs run in constant memory. skip_ids is checked as
+    each record is pulled, so ids may be added while the batch runs. Results
+    are not in input order; use the id.
+    """
+    skip_ids = skip_ids if skip_ids is not None else set()
+    stats = stats or BatchStats()
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    iterator = records.__aiter__() if hasattr(records, "__aiter__") else _iterate(records)
+    # An async generator can only be advanced by one worker at a time
+    pulling = asyncio.Lock()
+
+    async def worker():
+        # Batch work yields LLM capacity to interactive requests
+        current_priority.set(Priority.BACKGROUND)
+        while True:
+            async with pulling:
+                try:
+                    record = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            if record["id"] in skip_ids:
+                stats.skipped += 1
+                continue
+            result = await process_record(agent, record)
+            if result["status"] == "ok":
+                stats.succeeded += 1
+            else:
+                stats.failed += 1
+            await results.put(result)
+
+    async def close_when_done():
+        try:
+            await asyncio.gather(*workers)
+        except Exception as e:
+            # Records are all caught by process_record; this is the input failing
+            logger.error(f"Batch input failed: {str(e)}")
+        finally:
+            await results.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    closer = asyncio.create_task(close_when_done())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        closer.cancel()
+
+
+async def run_to_file(
+    input_path: Path,
+    output_path: Path,
+    concurrency: int,
+    report_every: float = 10.0,
+    tenant: str = DEFAULT_TENANT,
+) -> BatchStats:
+    """Process an input JSONL file, appending results to the output file"""
+    from agent import WritingAgent
+
+    agent = WritingAgent()
+    if not agent.is_ready():
+        raise RuntimeError("Writing agent failed to initialize")
+
+    skip_ids = load_completed_ids(output_path)
+    if skip_ids:
+        print(f"Resuming: {len(skip_ids)} records already completed", file=sys.stderr)
+
+    stats = BatchStats()
+    last_report = time.monotonic()
+    # Usage is accounted to the tenant, but the CLI is not subject to budgets
+    current_tenant.set(tenant)
+    try:
+        with open(input_path) as source, open(output_path, "a") as sink:
+            async for result in run_batch(agent, parse_records(source), concurrency, skip_ids, stats):
+                sink.write(json.dumps(result) + "\n")
+                sink.flush()
+                if time.monotonic() - last_report >= report_every:
+                    last_report = time.monotonic()
+                    print(f"Processed {stats.processed} records ({stats.records_per_second():.2f}/s)", file=sys.stderr)
+    finally:
+        agent.usage.close()
+
+    return stats
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Run writing agent actions over a JSONL file")
+    parser.add_argument("input", type=Path, help="JSONL file of {id, action, content, context} records")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="JSONL file to append results to")
+    parser.add_argument("-c", "--concurrency", type=int, default=settings.batch_concurrency, help="Records processed in parallel")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Tenant the usage is recorded under")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    stats = asyncio.run(run_to_file(args.input, args.output, args.concurrency, tenant=args.tenant))
+    print(json.dumps(stats.summary()), file=sys.stderr)
+    if stats.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
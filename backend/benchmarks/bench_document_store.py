@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Latency benchmark for the local document store.
+Builds synthetic corpora of the given paragraph counts and reports upsert
+throughput and top-k search latency, lexical-only and hybrid.
+
+Usage:
+    python benchmarks/bench_document_store.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from document_store import DocumentStore, hashing_embedder, np
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+def make_paragraph(vocabulary, rng: random.Random, words: int = 40) -> str:
+    # Zipf-like skew so some terms are common and most are rare
+    return " ".join(vocabulary[min(int(rng.paretovariate(1.1)) - 1, len(vocabulary) - 1)] for _ in range(words))
+
+
+def percentile(samples, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def run(size: int, embed: bool, queries: int, query_words: int, top_k: int, rng: random.Random):
+    vocabulary = make_vocabulary(50000, rng)
+    paragraphs_per_doc = 10
+    with tempfile.TemporaryDirectory() as path:
+        embedder = hashing_embedder(256) if embed else None
+        store = DocumentStore(Path(path), embedder, 256)
+
+        start = time.perf_counter()
+        batch = []
+        for doc in range(size // paragraphs_per_doc):
+            content = "\n\n".join(make_paragraph(vocabulary, rng) for _ in range(paragraphs_per_doc))
+            batch.append((f"doc-{doc}", content))
+            if len(batch) == 100:
+                store.upsert_many(batch)
+                batch = []
+        if batch:
+            store.upsert_many(batch)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        for _ in range(queries):
+            query = make_paragraph(vocabulary, rng, words=query_words)
+            start = time.perf_counter()
+            store.search(query, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        mode = "hybrid" if embed else "lexical"
+        print(
+            f"{size:>9} paragraphs {mode:>7}: "
+            f"upsert {len(store) / build_seconds:>9.0f} para/s | "
+            f"search p50 {statistics.median(latencies):7.2f} ms "
+            f"p95 {percentile(latencies, 95):7.2f} ms "
+            f"p99 {percentile(latencies, 99):7.2f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local document store")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-words", type=int, default=12, help="Words per query; edits send whole passages")
+    parser.add_argument("--lexical-only", action="store_true", help="Skip the hybrid run")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        run(size, False, args.queries, args.query_words, args.top_k, rng)
+        if np is not None and not args.lexical_only:
+            run(size, True, args.queries, args.query_words, args.top_k, rng)
+
+
+if __name__ == "__main__":
+    main()
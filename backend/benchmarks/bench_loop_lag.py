@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Event-loop lag benchmark for CPU offload.
+Scores large synthetic documents on the event loop, in the thread pool and
+in the process pool while a ticker stands in for other streams on the same
+worker, and reports how late the ticker fired.
+
+Usage:
+    python benchmarks/bench_loop_lag.py --doc-kb 16 256 1024 --documents 8
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from offload import Offloader
+from text_analysis import score_response
+
+WORDS = ["harbor", "quiet", "boats", "anchor", "gulls", "circle", "morning", "tide", "fog", "lifts", "the", "and", "slowly"]
+TICK = 0.01
+
+
+def percentile(samples, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def make_document(rng: random.Random, kb: int) -> str:
+    words = []
+    size = 0
+    while size < kb * 1024:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words) + "."
+
+
+async def ticker(lags, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def measure(offloader: Offloader, documents):
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(TICK * 2)
+    start = time.perf_counter()
+    for document in documents:
+        await offloader.run(score_response, document, document, "improve")
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+    return elapsed, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doc-kb", type=int, nargs="+", default=[16, 256, 1024])
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    modes = {"inline": Offloader(), "thread": Offloader(pool="thread"), "process": Offloader(pool="process")}
+    for pool in ("thread", "process"):
+        modes[pool].register(score_response, 1)
+
+    async def run_all():
+        for kb in args.doc_kb:
+            documents = [make_document(rng, kb) for _ in range(args.documents)]
+            for label, offloader in modes.items():
+                elapsed, lags = await measure(offloader, documents)
+                print(
+                    f"{kb:>5} KB {label:>8}: {elapsed / len(documents) * 1000:8.1f} ms/doc  "
+                    f"loop lag p50 {percentile(lags, 50) * 1000:6.1f} ms  "
+                    f"p95 {percentile(lags, 95) * 1000:6.1f} ms  max {max(lags) * 1000:6.1f} ms"
+                )
+
+    try:
+        asyncio.run(run_all())
+    finally:
+        for offloader in modes.values():
+            offloader.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Latency benchmark for the streaming meta-commentary filter.
+Streams synthetic responses (clean, and with a preamble, headers and a
+postamble) through the filter in token-sized chunks and reports the CPU
+cost per chunk and the delay added to kept text at a given token rate.
+
+Usage:
+    python benchmarks/bench_postprocess.py --responses 500 --tokens-per-second 50
+"""
+
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from postprocess import MetaFilter
+
+WORDS = ["harbor", "quiet", "boats", "anchor", "gulls", "circle", "morning", "tide", "fog", "lifts", "the", "and", "slowly"]
+PREAMBLES = ["Sure! Here's an improved version of your text:\n\n", "Here is the revised paragraph:\n\n", "# Improved Version\n\n"]
+POSTAMBLES = ["\n\nLet me know if you'd like any further changes!", "\n\nI hope this helps.", "\n\n---\n\nI've made the following changes:\n- Tightened wording\n- Improved flow"]
+
+TOKEN = re.compile(r"\s*\S{1,4}|\s+")
+
+
+def percentile(samples, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def make_body(rng: random.Random, paragraphs: int = 3) -> str:
+    def sentence() -> str:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+        return " ".join(words).capitalize() + rng.choice([".", ".", ".", "!", "?"])
+
+    return "\n\n".join(" ".join(sentence() for _ in range(rng.randint(2, 5))) for _ in range(paragraphs))
+
+
+def run(response: str, interval: float, delays, cpu):
+    """Feed one response chunk by chunk, recording how long text waited in the filter before each emit"""
+    chunks = TOKEN.findall(response)
+    meta_filter = MetaFilter()
+    held_since = None
+    for index, chunk in enumerate(chunks):
+        now = index * interval
+        if held_since is None:
+            held_since = now
+        start = time.perf_counter()
+        out = meta_filter.feed(chunk)
+        cpu.append(time.perf_counter() - start)
+        if out:
+            delays.append(now - held_since)
+            held_since = now if meta_filter.pending else None
+    start = time.perf_counter()
+    meta_filter.finish()
+    cpu.append(time.perf_counter() - start)
+    return meta_filter.stripped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=500)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    interval = 1.0 / args.tokens_per_second
+
+    for label, wrap in [
+        ("clean", lambda body: body),
+        ("with meta", lambda body: rng.choice(PREAMBLES) + body + rng.choice(POSTAMBLES)),
+    ]:
+        delays, cpu = [], []
+        stripped = {}
+        for _ in range(args.responses):
+            for kind, count in run(wrap(make_body(rng)), interval, delays, cpu).items():
+                stripped[kind] = stripped.get(kind, 0) + count
+        held = [delay for delay in delays if delay > 0]
+        print(
+            f"{label:>10}: added delay p50 {percentile(delays, 50) * 1000:6.1f} ms  "
+            f"p95 {percentile(delays, 95) * 1000:6.1f} ms  max {max(delays) * 1000:6.1f} ms  "
+            f"held {len(held) / len(delays):5.1%} of emits  "
+            f"cpu {statistics.mean(cpu) * 1e6:5.1f} us/chunk  stripped {stripped}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Memory-per-stream benchmark for the agent graph.
+Runs concurrent requests through the full retrieve -> agent -> tools ->
+agent loop against a scripted model (no network) and reports the peak
+traced memory per concurrent stream for each document size.
+
+Usage:
+    python benchmarks/bench_stream_memory.py --concurrency 50 200 --doc-kb 4 64
+    python benchmarks/bench_stream_memory.py --concurrency 200 --doc-kb 64 --ceiling-kb 512
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Keep the benchmark self-contained: no ledger file, no cached responses
+os.environ.setdefault("USAGE_LEDGER_PATH", "")
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+os.environ.setdefault("DOCUMENT_STORE_PATH", "")
+
+# Add the backend directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage
+
+from agent import WritingAgent
+
+
+class ScriptedModel:
+    """Asks for one tool call, then answers with a fixed-size response"""
+
+    def __init__(self, response_chars: int, latency: float):
+        self.response = ("Lorem ipsum dolor sit amet. " * (response_chars // 28 + 1))[:response_chars]
+        self.latency = latency
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        if messages[-1].type == "human":
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": "analyze_text_structure", "args": {"text": messages[-1].content}, "id": "call_1"}],
+            )
+        return AIMessage(content=self.response)
+
+
+def make_document(size_kb: int, rng: random.Random) -> str:
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa"]
+    paragraphs = []
+    length = 0
+    while length < size_kb * 1024:
+        paragraph = " ".join(rng.choice(words) for _ in range(60)) + "."
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+async def run(agent: WritingAgent, concurrency: int, size_kb: int, rng: random.Random):
+    documents = [make_document(size_kb, rng) for _ in range(concurrency)]
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(agent.complete_text("improve", document) for document in documents))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Documents are built before tracing starts; the ratio compares stream state to its input
+    document_bytes = sum(len(document) for document in documents)
+    per_stream_kb = (peak - baseline) / concurrency / 1024
+    failed = sum(1 for result in results if not result or result.startswith("I encountered an error"))
+    print(
+        f"{concurrency:>6} streams  {size_kb:>5} KB docs  "
+        f"peak {(peak - baseline) / 1024 / 1024:8.1f} MB  "
+        f"{per_stream_kb:8.1f} KB/stream  "
+        f"({per_stream_kb / (document_bytes / concurrency / 1024):4.1f}x doc)  "
+        f"{elapsed:6.2f} s  failed {failed}"
+    )
+    return per_stream_kb
+
+
+async def run_all(agent: WritingAgent, concurrencies, sizes, rng: random.Random) -> float:
+    worst = 0.0
+    for concurrency in concurrencies:
+        for size_kb in sizes:
+            worst = max(worst, await run(agent, concurrency, size_kb, rng))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--doc-kb", type=int, nargs="+", default=[4, 64])
+    parser.add_argument("--response-chars", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Scripted model latency in seconds")
+    parser.add_argument("--ceiling-kb", type=float, default=0, help="Fail if any run exceeds this many KB per stream")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    agent = WritingAgent()
+    if agent.graph is None:
+        sys.exit("Agent graph failed to initialize")
+    agent.llm = ScriptedModel(args.response_chars, args.latency)
+    # Give every stream its own slot so the run measures concurrent state
+    agent.scheduler.slots = agent.scheduler.available = max(args.concurrency)
+    agent.rate_limiter.max_concurrency = max(args.concurrency)
+
+    rng = random.Random(args.seed)
+    worst = asyncio.run(run_all(agent, args.concurrency, args.doc_kb, rng))
+
+    if args.ceiling_kb and worst > args.ceiling_kb:
+        print(f"FAIL: {worst:.1f} KB/stream exceeds the {args.ceiling_kb:.1f} KB ceiling")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List
 from pathlib import Path
 from pydantic_settings import BaseSettings
 
@@ -12,6 +12,44 @@ class Settings(BaseSettings):
     # API Keys
     openai_api_key: str = ""
     
+    # Models
+    openai_model: str = "gpt-4-turbo-preview"
+    draft_model: str = "gpt-3.5-turbo"
+    speculative_generation: bool = False
+    prompt_token_limit: int = 120000  # Prompt tokens the main model accepts
+    long_context_model: str = ""  # Optional model for prompts over prompt_token_limit
+    long_context_token_limit: int = 200000
+    draft_prompt_token_limit: int = 12000  # Longer prompts skip the speculative draft
+    tool_output_max_chars: int = 2000  # Tool results kept in the conversation state
+    max_variants: int = 4  # Upper bound for the variants field on generate and improve
+    postprocess_actions: List[str] = ["generate", "improve"]  # Responses stripped of preambles, headers and postambles
+    
+    # LLM traffic mode: "live", "record" (capture to cassettes) or "replay" (serve cassettes offline)
+    llm_mode: str = "live"
+    llm_cassette_dir: str = "cassettes"
+    llm_replay_time_scale: float = 1.0  # 0 replays without delays
+    
+    # LLM resilience (timeouts, retries, circuit breaker, hedging, rate limits)
+    llm_timeout_seconds: float = 60.0
+    llm_chunk_timeout_seconds: float = 20.0  # Longest gap between streamed chunks
+    llm_max_retries: int = 2
+    llm_retry_max_wait_seconds: float = 4.0
+    circuit_breaker_failure_threshold: int = 5
+    circuit_breaker_reset_seconds: float = 30.0
+    llm_hedging: bool = False
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_delay_seconds: float = 2.0
+    llm_max_concurrency: int = 16  # Upper bound on in-flight LLM calls; provider rate-limit headers lower it
+    rate_limit_background_reserve: float = 0.25  # Hold back background work below this fraction of remaining quota
+    
+    # Priority scheduling of LLM slots between interactive and background work
+    llm_scheduler_slots: int = 8
+    scheduler_mode: str = "weighted"  # "weighted" or "strict"
+    scheduler_interactive_weight: int = 4
+    scheduler_background_weight: int = 1
+    slo_interactive_p95_ms: float = 3000.0  # Time to first output
+    slo_background_p95_ms: float = 30000.0
+    
     # LangSmith Configuration
     langsmith_api_key: str = ""
     langsmith_tracing: bool = True
@@ -22,6 +60,73 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     
+    # SSE framing
+    sse_coalesce_ms: float = 16.0
+    sse_coalesce_bytes: int = 1024
+    sse_gzip: bool = False
+
+    # Resumable streams (recent stream events kept for reconnecting clients)
+    stream_resume_max_streams: int = 256
+    stream_resume_ttl_seconds: float = 300.0
+    stream_detach_grace_seconds: float = 10.0  # Cancel a stream no client has followed for this long
+    
+    # WebSocket transport
+    ws_max_concurrent_requests: int = 8
+    ws_send_queue_size: int = 256
+    
+    # Continuation context (token budgets around the cursor)
+    continuation_window_tokens: int = 1500
+    continuation_following_tokens: int = 200
+    continuation_retrieval_tokens: int = 600
+    continuation_top_k: int = 3
+    
+    # Local document store for retrieval-augmented edits (disabled when path is empty)
+    document_store_path: str = ""
+    document_store_embedder: str = ""  # "", "hashing" or "module:factory"
+    document_store_embedding_dim: int = 256
+    document_store_top_k: int = 3
+    
+    # Response cache with near-duplicate lookup (threshold 0 disables near matches)
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 2048
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_actions: List[str] = ["edit", "improve"]
+    near_duplicate_threshold: float = 0.85
+    near_duplicate_verify_rate: float = 0.1  # Share of served near hits re-checked with exact similarity
+    
+    # Idle-time prefetch into the response cache (opt-in)
+    prefetch_enabled: bool = False
+    prefetch_actions: List[str] = ["edit", "improve"]
+    prefetch_token_budget: int = 50000  # Estimated tokens per window across all prefetches; 0 disables the cap
+    prefetch_budget_window_seconds: int = 3600
+    prefetch_max_in_flight: int = 2
+    prefetch_min_chars: int = 80  # Shorter paragraphs are not worth prefetching
+    
+    # Health and load shedding; a limit of 0 is ignored
+    loop_lag_interval_ms: float = 500.0
+    shed_loop_lag_ms: float = 250.0  # Recent p95 event-loop lag
+    shed_queue_depth: int = 64  # LLM calls waiting for a scheduler slot
+    shed_max_in_flight: int = 512  # Admitted requests still streaming
+    shed_background_fraction: float = 0.5  # Batch and prefetch are shed from this share of any limit
+    shed_retry_after_seconds: int = 2
+    slow_callback_ms: float = 100.0  # Log the coroutine holding the event loop longer than this; 0 disables
+    
+    # CPU offload of text analysis; 0 keeps it on the event loop
+    offload_min_chars: int = 20000  # Input size from which registered functions leave the loop
+    offload_pool: str = "thread"  # "thread" or "process"
+    offload_workers: int = 2
+    
+    # Batch processing
+    batch_concurrency: int = 4
+    batch_max_concurrency: int = 32
+    
+    # Usage accounting and per-tenant budgets (tenant from the X-Tenant-ID header; 0 means unlimited)
+    usage_ledger_path: str = "usage.db"  # SQLite ledger; empty keeps totals in memory only
+    tenant_token_budget: int = 0
+    tenant_token_budgets: Dict[str, int] = {}
+    tenant_budget_window_seconds: int = 86400
+    tenant_max_concurrent_requests: int = 0
+    
     # CORS
     allowed_origins: List[str] = [
         "http://localhost:3000",
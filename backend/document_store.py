@@ -0,0 +1,221 @@
+"""
+Local document store for retrieval-augmented edits.
+Paragraphs are persisted in an append-only JSONL log and indexed in memory
+with BM25; optional embedding vectors live in a memory-mapped NumPy array.
+Runs fully offline, with pluggable embedding functions.
+"""
+
+import hashlib
+import importlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from retrieval import BM25Index, TOKEN_PATTERN, split_paragraphs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# An embedder maps a batch of texts to one vector per text
+Embedder = Callable[[List[str]], List[List[float]]]
+
+
+def hashing_embedder(dim: int = 256) -> Embedder:
+    """Offline feature-hashing embedder over word unigrams and bigrams"""
+    if np is None:
+        raise RuntimeError("numpy is required for embeddings")
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vectors
+
+    return embed
+
+
+def load_embedder(spec: str, dim: int) -> Optional[Embedder]:
+    """Resolve an embedder setting: "", "hashing" or a "module:function" factory"""
+    if not spec:
+        return None
+    if spec == "hashing":
+        return hashing_embedder(dim)
+    module_name, _, attribute = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return factory(dim)
+
+
+class DocumentStore:
+    """Disk-persisted paragraph store with BM25 and optional vector search"""
+
+    def __init__(self, path: Path, embedder: Optional[Embedder] = None, dim: int = 256):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.path / "paragraphs.jsonl"
+        self.vectors_path = self.path / "vectors.f32"
+        self.embedder = embedder if np is not None else None
+        self.dim = dim
+        if embedder is not None and np is None:
+            logger.warning("numpy not installed - document store will use lexical search only")
+
+        self.index = BM25Index()
+        self.rows: Dict[int, Tuple[str, str]] = {}  # row -> (document id, paragraph text)
+        self.documents: Dict[str, List[int]] = {}
+        self.next_row = 0
+        self.vectors = None
+        self.live = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _load(self):
+        """Replay the paragraph log and map the vector file"""
+        if self.embedder is not None:
+            self._map_vectors(max(1024, self._existing_vector_rows()))
+
+        if not self.log_path.exists():
+            return
+        with open(self.log_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn write from an interrupted process
+                self._remove_document(entry["doc"])
+                if entry["op"] == "upsert":
+                    for row, text in entry["paragraphs"]:
+                        self._add_row(entry["doc"], row, text)
+                    self.next_row = max(self.next_row, max((r for r, _ in entry["paragraphs"]), default=-1) + 1)
+        logger.info(f"Document store loaded {len(self.documents)} documents, {len(self.rows)} paragraphs")
+
+    def _existing_vector_rows(self) -> int:
+        if not self.vectors_path.exists():
+            return 0
+        return self.vectors_path.stat().st_size // (4 * self.dim)
+
+    def _map_vectors(self, capacity: int):
+        """(Re)map the vector file with room for capacity rows"""
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        size = capacity * self.dim * 4
+        current = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        if current < size:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(size)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        live = np.zeros(capacity, dtype=bool)
+        if self.live is not None:
+            live[:len(self.live)] = self.live
+        self.live = live
+
+    def _add_row(self, doc_id: str, row: int, text: str):
+        self.rows[row] = (doc_id, text)
+        self.documents.setdefault(doc_id, []).append(row)
+        self.index.add(row, text)
+        if self.live is not None and row < len(self.live):
+            self.live[row] = True
+
+    def _remove_document(self, doc_id: str):
+        for row in self.documents.pop(doc_id, []):
+            self.rows.pop(row, None)
+            self.index.remove(row)
+            if self.live is not None and row < len(self.live):
+                self.live[row] = False
+
+    def upsert(self, doc_id: str, content: str):
+        """Insert or replace a single document"""
+        self.upsert_many([(doc_id, content)])
+
+    def upsert_many(self, documents: Iterable[Tuple[str, str]]):
+        """Insert or replace documents with one log write and one embedding batch"""
+        with self._lock:
+            entries = []
+            texts: List[str] = []
+            rows: List[int] = []
+            for doc_id, content in documents:
+                paragraphs = []
+                for text in split_paragraphs(content):
+                    paragraphs.append((self.next_row, text))
+                    rows.append(self.next_row)
+                    texts.append(text)
+                    self.next_row += 1
+                entries.append({"op": "upsert", "doc": doc_id, "paragraphs": paragraphs})
+
+            if self.embedder is not None and texts:
+                if self.next_row > len(self.vectors):
+                    self._map_vectors(max(self.next_row, len(self.vectors) * 2))
+                vectors = np.asarray(self.embedder(texts), dtype=np.float32)
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                self.vectors[rows] = vectors / np.maximum(norms, 1e-12)
+
+            with open(self.log_path, "a") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+
+            for entry in entries:
+                self._remove_document(entry["doc"])
+                for row, text in entry["paragraphs"]:
+                    self._add_row(entry["doc"], row, text)
+
+    def delete(self, doc_id: str):
+        """Remove a document"""
+        with self._lock:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps({"op": "delete", "doc": doc_id}) + "\n")
+            self._remove_document(doc_id)
+
+    def search(self, query: str, top_k: int = 3, exclude_doc: Optional[str] = None) -> List[Dict]:
+        """Top-k paragraphs for a query, fusing BM25 and vector rankings when available"""
+        with self._lock:
+            pool = top_k * 4
+            exclude = set(self.documents.get(exclude_doc, [])) if exclude_doc else None
+            rankings = [[row for row, _ in self.index.search(query, pool, exclude)]]
+
+            # Rows logged before embeddings were enabled can lie past the mapped vectors
+            mapped = min(self.next_row, len(self.vectors)) if self.embedder is not None else 0
+            if mapped:
+                query_vector = np.asarray(self.embedder([query])[0], dtype=np.float32)
+                query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+                scores = self.vectors[:mapped] @ query_vector
+                scores[~self.live[:mapped]] = -np.inf
+                if exclude:
+                    scores[[row for row in exclude if row < mapped]] = -np.inf
+                count = min(pool, mapped)
+                candidates = np.argpartition(-scores, count - 1)[:count]
+                candidates = candidates[np.argsort(-scores[candidates])]
+                rankings.append([int(row) for row in candidates if scores[row] > 0])
+
+            # Reciprocal rank fusion across the available rankings
+            fused: Dict[int, float] = {}
+            for ranking in rankings:
+                for rank, row in enumerate(ranking):
+                    fused[row] = fused.get(row, 0.0) + 1.0 / (60 + rank)
+
+            best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            return [
+                {"doc_id": self.rows[row][0], "text": self.rows[row][1], "score": round(score, 6)}
+                for row, score in best if row in self.rows
+            ]
+
+    def compact(self):
+        """Rewrite the log with only live documents"""
+        with self._lock:
+            temp_path = self.log_path.with_suffix(".tmp")
+            with open(temp_path, "w") as f:
+                for doc_id, rows in self.documents.items():
+                    paragraphs = [(row, self.rows[row][1]) for row in rows]
+                    f.write(json.dumps({"op": "upsert", "doc": doc_id, "paragraphs": paragraphs}) + "\n")
+            temp_path.replace(self.log_path)
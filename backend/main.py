@@ -1,15 +1,26 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import json
 import asyncio
-from typing import Dict, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 import logging
 import os
 
 from config import settings
 from agent import WritingAgent
+from sse import accepts_gzip, create_sse_stream, gzip_stream
+from stream_structure import StreamRegistry, structure_stream
+from ws_session import WritingSession
+from batch import BatchStats, parse_record_stream, read_lines, run_batch
+from usage import DEFAULT_TENANT, BudgetExceededError, TenantSlot
+from scheduler import Priority
+from prefetch import Prefetcher
+from postprocess import filter_stream, filter_stats
+from monitoring import LoadMonitor, LoadSheddingMiddleware, LoopLagMonitor, LoopWatchdog
+from offload import offloader
 
 # Initialize LangSmith tracing
 if settings.langsmith_api_key and settings.langsmith_tracing:
@@ -45,37 +56,108 @@ else:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lag_monitor.start()
+    watchdog.start()
+    try:
+        yield
+    finally:
+        await lag_monitor.stop()
+        watchdog.stop()
+        offloader.shutdown()
+        # Flush buffered usage rows to the ledger
+        writing_agent.usage.close()
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
-    debug=settings.debug
+    debug=settings.debug,
+    lifespan=lifespan
+)
+
+# Initialize writing agent
+writing_agent = WritingAgent()
+
+# Recent streams, kept so clients can resume after a dropped connection
+stream_registry = StreamRegistry(
+    settings.stream_resume_max_streams,
+    settings.stream_resume_ttl_seconds,
+    settings.stream_detach_grace_seconds
+)
+
+# Idle-time prefetch into the response cache (opt-in)
+prefetcher = Prefetcher(
+    writing_agent,
+    actions=settings.prefetch_actions,
+    token_budget=settings.prefetch_token_budget,
+    window_seconds=settings.prefetch_budget_window_seconds,
+    max_in_flight=settings.prefetch_max_in_flight,
+    min_chars=settings.prefetch_min_chars
+) if settings.prefetch_enabled else None
+
+# Event-loop lag and load signals for health checks and load shedding
+lag_monitor = LoopLagMonitor(settings.loop_lag_interval_ms / 1000)
+watchdog = LoopWatchdog(settings.slow_callback_ms / 1000)
+load_monitor = LoadMonitor(
+    writing_agent,
+    lag_monitor,
+    max_loop_lag=settings.shed_loop_lag_ms / 1000,
+    max_queue_depth=settings.shed_queue_depth,
+    max_in_flight=settings.shed_max_in_flight,
+    background_fraction=settings.shed_background_fraction
+)
+
+# Paths shed under load; background work goes first
+INTERACTIVE_PATHS = {"/api/generate", "/api/edit", "/api/improve"}
+BACKGROUND_PATHS = {"/api/batch", "/api/prefetch"}
+
+app.add_middleware(
+    LoadSheddingMiddleware,
+    monitor=load_monitor,
+    interactive_paths=INTERACTIVE_PATHS,
+    background_paths=BACKGROUND_PATHS,
+    retry_after=settings.shed_retry_after_seconds
 )
 
-# Add CORS middleware
+# Add CORS middleware; added last so it also wraps shed responses
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
-# Initialize writing agent
-writing_agent = WritingAgent()
-
 # Request models
 class GenerateRequest(BaseModel):
     prompt: str
     context: Optional[Dict] = None
+    speculative: Optional[bool] = None
+    priority: Priority = Priority.INTERACTIVE
+    variants: int = Field(1, ge=1, le=settings.max_variants)
 
 class EditRequest(BaseModel):
     content: str
     context: Optional[Dict] = None
+    priority: Priority = Priority.INTERACTIVE
 
 class ImproveRequest(BaseModel):
     content: str
     context: Optional[Dict] = None
+    priority: Priority = Priority.INTERACTIVE
+    variants: int = Field(1, ge=1, le=settings.max_variants)
+
+class PrefetchRequest(BaseModel):
+    content: str
+    context: Optional[Dict] = None
+    actions: Optional[List[str]] = None
+
+class DocumentRequest(BaseModel):
+    id: str
+    content: str
 
 @app.get("/")
 async def root():
@@ -85,79 +167,282 @@ async def root():
 async def health_check():
     return {"status": "healthy", "agent_ready": writing_agent.is_ready()}
 
-async def create_sse_stream(generator, action_type: str):
-    """Create SSE formatted stream from async generator"""
+@app.get("/health/ready")
+async def readiness_check():
+    """Ready when the agent is up and the worker is under its load limits"""
+    reasons = load_monitor.overload_reasons()
+    if not writing_agent.is_ready():
+        reasons = ["agent_not_ready"] + reasons
+    if reasons:
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "reasons": reasons},
+            headers={"Retry-After": str(settings.shed_retry_after_seconds)}
+        )
+    return {"ready": True, "load": round(load_monitor.load(), 4)}
+
+@app.get("/health/load")
+async def load_report():
+    """Load score, in-flight work, queue depth, loop lag, cache and circuit-breaker state"""
+    return load_monitor.snapshot()
+
+@app.get("/api/loop/stats")
+async def loop_stats():
+    """Event-loop lag, stalls by the coroutine that caused them and offloaded calls"""
+    return {
+        "lag": lag_monitor.stats(),
+        "slow_callbacks": watchdog.stats(),
+        "offload": offloader.stats(),
+    }
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Response cache hit-rate and false-hit metrics"""
+    if writing_agent.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **writing_agent.response_cache.stats()}
+
+@app.post("/api/prefetch", status_code=202)
+async def prefetch(request: PrefetchRequest, raw_request: Request):
+    """Speculatively compute likely actions on a paragraph into the response cache"""
+    if prefetcher is None:
+        raise HTTPException(status_code=404, detail="Prefetch is not enabled")
+    outcomes = prefetcher.submit(tenant_of(raw_request), request.content, request.context or {}, request.actions)
+    return {"actions": outcomes}
+
+@app.get("/api/prefetch/stats")
+async def prefetch_stats():
+    """Prefetch activity, budget use and how many prefetched results were used"""
+    if prefetcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **prefetcher.stats()}
+
+@app.get("/api/postprocess/stats")
+async def postprocess_stats():
+    """Meta-commentary stripped from responses and the delay the filter added"""
+    return filter_stats.summary()
+
+@app.get("/api/rate-limits")
+async def rate_limit_stats():
+    """Provider quota headroom and adaptive concurrency per model and priority class"""
+    return {model: limiter.stats() for model, limiter in writing_agent.rate_limiters.items()}
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    """LLM slot usage, queue waits and latency against SLO per priority class"""
+    return writing_agent.scheduler.stats()
+
+@app.get("/api/usage")
+async def usage_report(raw_request: Request):
+    """Token usage and remaining budget for the calling tenant"""
+    return writing_agent.usage.report(tenant_of(raw_request))
+
+def tenant_of(request) -> str:
+    """Tenant identity from the X-Tenant-ID header"""
+    return request.headers.get("x-tenant-id") or DEFAULT_TENANT
+
+def admit_tenant(raw_request: Request) -> TenantSlot:
+    """Check the tenant's budget and concurrency before any work is scheduled"""
+    tenant = tenant_of(raw_request)
     try:
-        # Send start event
-        yield f"data: {json.dumps({'type': f'{action_type}_start', 'message': f'Starting {action_type}...'})}\n\n"
-        
-        # Stream content chunks
-        async for chunk in generator:
-            if chunk:
-                yield f"data: {json.dumps({'type': f'{action_type}_chunk', 'content': chunk})}\n\n"
-        
-        # Send completion event
-        yield f"data: {json.dumps({'type': f'{action_type}_complete', 'message': f'{action_type.title()} completed'})}\n\n"
-        
-    except Exception as e:
-        logger.error(f"{action_type} error: {str(e)}")
-        yield f"data: {json.dumps({'type': 'error', 'message': f'{action_type.title()} failed: {str(e)}'})}\n\n"
+        return writing_agent.usage.admit(tenant)
+    except BudgetExceededError as e:
+        logger.warning(f"Rejected request: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+class SlotStreamingResponse(StreamingResponse):
+    """Streaming response that frees the tenant's slot even when its body is never iterated"""
+
+    def __init__(self, content, slot: Optional[TenantSlot] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.slot is not None:
+                self.slot.release()
+
+class BodyStreamingResponse(SlotStreamingResponse):
+    """Streaming response that reads its request body while streaming.
+
+    Before ASGI spec 2.4, Starlette watches for a disconnect by reading receive(),
+    which would swallow body chunks; it only starts once the body has been read.
+    """
+
+    def __init__(self, content, body_read: asyncio.Event, slot: Optional[TenantSlot] = None, **kwargs):
+        super().__init__(content, slot, **kwargs)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive):
+        await self.body_read.wait()
+        await super().listen_for_disconnect(receive)
+
+def request_stream(generator, action: str, slot: TenantSlot, priority: Priority):
+    """Clean an agent generator's output and run it as the tenant at the request's priority"""
+    tracked = writing_agent.usage.track_stream(filter_stream(generator, action), slot)
+    return writing_agent.scheduler.track_stream(tracked, priority)
+
+def structured_sse_stream(generator, action_type: str):
+    """Structure an agent generator into offset-tagged events and register it for resumption.
+
+    The generator runs in a producer task, so it keeps going while the client reconnects;
+    the producer starts it right away, so its tenant slot is released when it ends.
+    """
+    record = stream_registry.create(action_type)
+    stream_registry.produce(record, generator)
+    return create_sse_stream(record.follow(0), action_type, record.stream_id)
+
+def variant_sse_stream(generator, action_type: str):
+    """Structure a multi-variant stream; interleaved variants are not registered for resumption"""
+    return create_sse_stream(structure_stream(generator), action_type)
+
+def sse_response(stream, raw_request: Request, slot: Optional[TenantSlot] = None) -> StreamingResponse:
+    """Wrap an SSE byte stream in a streaming response, gzipped when enabled and accepted"""
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if settings.sse_gzip and accepts_gzip(raw_request.headers.get("accept-encoding", "")):
+        stream = gzip_stream(stream)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    
+    return SlotStreamingResponse(
+        stream,
+        slot,
+        media_type="text/event-stream",
+        headers=headers
+    )
 
 @app.post("/api/generate")
-async def generate_text(request: GenerateRequest):
+async def generate_text(request: GenerateRequest, raw_request: Request):
     """Generate text with SSE streaming"""
     logger.info(f"Generate request: prompt length {len(request.prompt)}")
     
-    generator = writing_agent.generate_text(request.prompt, request.context or {})
-    stream = create_sse_stream(generator, "generation")
+    slot = admit_tenant(raw_request)
+    if request.variants > 1:
+        generator = writing_agent.stream_variants("generate", request.prompt, request.context or {}, request.variants)
+        stream = variant_sse_stream(request_stream(generator, "generate", slot, request.priority), "generation")
+        return sse_response(stream, raw_request, slot)
     
-    return StreamingResponse(
-        stream, 
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-        }
-    )
+    speculative = settings.speculative_generation if request.speculative is None else request.speculative
+    if speculative:
+        generator = writing_agent.generate_text_speculative(request.prompt, request.context or {})
+    else:
+        generator = writing_agent.generate_text(request.prompt, request.context or {})
+    stream = structured_sse_stream(request_stream(generator, "generate", slot, request.priority), "generation")
+    
+    return sse_response(stream, raw_request)
 
 @app.post("/api/edit")
-async def edit_text(request: EditRequest):
+async def edit_text(request: EditRequest, raw_request: Request):
     """Edit text with SSE streaming"""
     logger.info(f"Edit request: content length {len(request.content)}")
     
+    slot = admit_tenant(raw_request)
     generator = writing_agent.edit_text(request.content, request.context or {})
-    stream = create_sse_stream(generator, "edit")
+    stream = structured_sse_stream(request_stream(generator, "edit", slot, request.priority), "edit")
     
-    return StreamingResponse(
-        stream, 
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive", 
-            "Access-Control-Allow-Origin": "*",
-        }
-    )
+    return sse_response(stream, raw_request)
 
 @app.post("/api/improve")
-async def improve_text(request: ImproveRequest):
+async def improve_text(request: ImproveRequest, raw_request: Request):
     """Improve text with SSE streaming"""
     logger.info(f"Improve request: content length {len(request.content)}")
     
+    slot = admit_tenant(raw_request)
+    if request.variants > 1:
+        generator = writing_agent.stream_variants("improve", request.content, request.context or {}, request.variants)
+        stream = variant_sse_stream(request_stream(generator, "improve", slot, request.priority), "improve")
+        return sse_response(stream, raw_request, slot)
+
     generator = writing_agent.improve_text(request.content, request.context or {})
-    stream = create_sse_stream(generator, "improve")
+    stream = structured_sse_stream(request_stream(generator, "improve", slot, request.priority), "improve")
+
+    return sse_response(stream, raw_request)
+
+@app.get("/api/stream/{stream_id}")
+async def resume_stream(stream_id: str, raw_request: Request, offset: int = 0, block: int = -1):
+    """Resume a recent stream after a UTF-16 offset into its output and the last block received"""
+    record = stream_registry.get(stream_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    stream = create_sse_stream(record.follow(offset, block), record.action_type, record.stream_id)
     
-    return StreamingResponse(
-        stream, 
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-        }
-    )
+    return sse_response(stream, raw_request)
+
+@app.delete("/api/stream/{stream_id}")
+async def cancel_stream(stream_id: str):
+    """Stop a stream whose client gave up on it, freeing its LLM and tenant slots"""
+    record = stream_registry.get(stream_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return {"id": stream_id, "cancelled": record.cancel()}
 
+@app.post("/api/documents")
+async def upsert_document(request: DocumentRequest):
+    """Add or replace a document in the local retrieval store"""
+    if writing_agent.document_store is None:
+        raise HTTPException(status_code=404, detail="Document store is not configured")
+    await asyncio.to_thread(writing_agent.document_store.upsert, request.id, request.content)
+    return {"id": request.id, "paragraphs": len(writing_agent.document_store.documents.get(request.id, []))}
+
+@app.delete("/api/documents/{document_id}")
+async def delete_document(document_id: str):
+    """Remove a document from the local retrieval store"""
+    if writing_agent.document_store is None:
+        raise HTTPException(status_code=404, detail="Document store is not configured")
+    await asyncio.to_thread(writing_agent.document_store.delete, document_id)
+    return {"id": document_id, "deleted": True}
+
+@app.get("/api/documents/search")
+async def search_documents(q: str, k: int = 5):
+    """Top-k paragraphs from the local retrieval store"""
+    if writing_agent.document_store is None:
+        raise HTTPException(status_code=404, detail="Document store is not configured")
+    results = await asyncio.to_thread(writing_agent.document_store.search, q, k)
+    return {"results": results}
+
+@app.post("/api/batch")
+async def batch_process(raw_request: Request, concurrency: Optional[int] = None, skip_ids: Optional[str] = None):
+    """Process a JSONL body of {id, action, content, context} records, streaming JSONL results.
+
+    The body is parsed as it arrives. Result lines from an earlier run may precede
+    the records; the ids that succeeded there are skipped.
+    """
+    concurrency = min(concurrency or settings.batch_concurrency, settings.batch_max_concurrency)
+    completed = set(skip_ids.split(",")) if skip_ids else set()
+    logger.info(f"Batch request: concurrency {concurrency}")
+    slot = admit_tenant(raw_request)
+    body_read = asyncio.Event()
+    
+    async def body_lines():
+        try:
+            async for line in read_lines(raw_request.stream()):
+                yield line
+        finally:
+            body_read.set()
+    
+    async def stream():
+        stats = BatchStats()
+        records = parse_record_stream(body_lines(), completed)
+        results = run_batch(writing_agent, records, concurrency, completed, stats)
+        # Workers run at background priority; the job as a whole is not an SLO sample
+        async for result in writing_agent.usage.track_stream(results, slot):
+            yield json.dumps(result) + "\n"
+        # Final line reports throughput for the whole job
+        yield json.dumps({"summary": stats.summary()}) + "\n"
+    
+    return BodyStreamingResponse(stream(), body_read, slot, media_type="application/x-ndjson")
 
+@app.websocket("/ws/writing")
+async def writing_websocket(websocket: WebSocket):
+    """Multiplexed writing requests over a single WebSocket"""
+    session = WritingSession(websocket, writing_agent)
+    await session.run()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,276 @@
+"""
+Worker health, load and load shedding.
+Samples event-loop lag and combines it with in-flight requests, scheduler
+queue depth, cache and circuit-breaker state into a load score, so load
+balancers can route away from a busy worker and the worker can turn new
+work away before latency degrades. A watchdog thread names the coroutine
+whenever one callback holds the loop for too long.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires on the event loop"""
+
+    def __init__(self, interval: float = 0.5, window: int = 20):
+        self.interval = interval
+        self.lag = LatencyTracker(window=window)
+        self.last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - expected)
+            self.lag.record(self.last)
+
+    def recent(self) -> float:
+        """p95 lag over the recent window, in seconds"""
+        return self.lag.percentile(95) or 0.0
+
+    def stats(self) -> Dict:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000, 2)
+
+        return {
+            "interval_ms": ms(self.interval),
+            "samples": len(self.lag.samples),
+            "last_ms": ms(self.last),
+            "p50_ms": ms(self.lag.percentile(50)),
+            "p95_ms": ms(self.lag.percentile(95)),
+            "max_ms": ms(max(self.lag.samples)) if self.lag.samples else None,
+        }
+
+
+class LoopWatchdog:
+    """Logs the task and code holding the event loop when a callback runs too long.
+
+    A daemon thread pings the loop every threshold seconds. When a ping goes
+    unanswered for the threshold, the thread captures the loop's current
+    task and the stack of the loop thread, then logs them with the length of
+    the stall once the loop answers.
+    """
+
+    def __init__(self, threshold: float = 0.1):
+        self.threshold = threshold
+        self.stalls = 0
+        self.longest = 0.0
+        self.offenders: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Watch the running loop; call from the loop thread"""
+        if self._thread is not None or not self.threshold:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.threshold):
+            answered = threading.Event()
+            started = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                # The loop is closed
+                return
+            if answered.wait(self.threshold):
+                continue
+            culprit = self._culprit()
+            while not answered.wait(self.threshold):
+                if self._stopped.is_set():
+                    return
+            stall = time.monotonic() - started
+            self.stalls += 1
+            self.longest = max(self.longest, stall)
+            self.offenders[culprit["task"]] = self.offenders.get(culprit["task"], 0) + 1
+            logger.warning(
+                f"Event loop blocked for {stall * 1000:.0f} ms by {culprit['task']} in {culprit['code']}"
+            )
+
+    def _culprit(self) -> Dict[str, str]:
+        """The loop's current task and the innermost frame of this repo's code on the loop thread"""
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            name = "a callback"
+        else:
+            coro = task.get_coro()
+            name = f"{getattr(coro, '__qualname__', repr(coro))} ({task.get_name()})"
+
+        frame = sys._current_frames().get(self._thread_id)
+        innermost = frame
+        root = os.path.dirname(os.path.abspath(__file__))
+        while frame is not None and not frame.f_code.co_filename.startswith(root):
+            frame = frame.f_back
+        frame = frame or innermost
+        code = (
+            "unknown code" if frame is None
+            else f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+        )
+        return {"task": name, "code": code}
+
+    def stats(self) -> Dict:
+        return {
+            "threshold_ms": round(self.threshold * 1000, 2),
+            "stalls": self.stalls,
+            "longest_ms": round(self.longest * 1000, 2),
+            "offenders": dict(sorted(self.offenders.items(), key=lambda item: item[1], reverse=True)[:10]),
+        }
+
+
+class LoadMonitor:
+    """Load signals of one worker and the shedding decision derived from them.
+
+    The load score is the highest of loop lag, interactive queue depth and
+    in-flight requests relative to their limits; at 1.0 new interactive work
+    is shed, and background work is shed from background_fraction upward.
+    """
+
+    def __init__(
+        self,
+        agent,
+        lag_monitor: LoopLagMonitor,
+        max_loop_lag: float = 0.25,
+        max_queue_depth: int = 64,
+        max_in_flight: int = 512,
+        background_fraction: float = 0.5,
+    ):
+        self.agent = agent
+        self.lag_monitor = lag_monitor
+        self.max_loop_lag = max_loop_lag
+        self.max_queue_depth = max_queue_depth
+        self.max_in_flight = max_in_flight
+        self.background_fraction = background_fraction
+        self.shed: Dict[str, int] = {"interactive": 0, "background": 0}
+
+    def signals(self) -> Dict[str, float]:
+        """Each limited signal as a fraction of its limit (limits of 0 are ignored)"""
+        scheduler = self.agent.scheduler
+        waiting = sum(len(queue) for queue in scheduler.waiting.values())
+        in_flight = sum(self.agent.usage.active.values())
+        fractions = {}
+        if self.max_loop_lag:
+            fractions["loop_lag"] = self.lag_monitor.recent() / self.max_loop_lag
+        if self.max_queue_depth:
+            fractions["queue_depth"] = waiting / self.max_queue_depth
+        if self.max_in_flight:
+            fractions["in_flight"] = in_flight / self.max_in_flight
+        return fractions
+
+    def load(self) -> float:
+        return max(self.signals().values(), default=0.0)
+
+    def overload_reasons(self, background: bool = False) -> List[str]:
+        """Signals at or over their limit (or over background_fraction of it for background work)"""
+        threshold = self.background_fraction if background else 1.0
+        return [name for name, fraction in self.signals().items() if fraction >= threshold]
+
+    def should_shed(self, background: bool = False) -> bool:
+        if self.overload_reasons(background):
+            self.shed["background" if background else "interactive"] += 1
+            return True
+        return False
+
+    def snapshot(self) -> Dict:
+        """Current load, capacity and hot-path state"""
+        agent = self.agent
+        scheduler = agent.scheduler
+        cache = agent.response_cache.stats() if agent.response_cache is not None else None
+        return {
+            "load": round(self.load(), 4),
+            "signals": {name: round(fraction, 4) for name, fraction in self.signals().items()},
+            "in_flight_requests": sum(agent.usage.active.values()),
+            "scheduler": {
+                "slots": scheduler.slots,
+                "available": scheduler.available,
+                "waiting": {priority.value: len(queue) for priority, queue in scheduler.waiting.items()},
+            },
+            "loop_lag_ms": {
+                "last": round(self.lag_monitor.last * 1000, 1),
+                "p95": round(self.lag_monitor.recent() * 1000, 1),
+            },
+            "cache": None if cache is None else {"entries": cache["entries"], "hit_rate": cache["hit_rate"]},
+            "circuit_breaker": {
+                "main": agent.resilience.breaker.state,
+                "draft": agent.draft_resilience.breaker.state,
+            },
+            "shed": dict(self.shed),
+        }
+
+
+class LoadSheddingMiddleware:
+    """Pure ASGI middleware that answers 503 to new work while the worker is overloaded.
+
+    Requests that pass go straight to the app, so streaming bodies are neither
+    buffered nor cut off from cancellation.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        monitor: LoadMonitor,
+        interactive_paths: Set[str],
+        background_paths: Set[str],
+        retry_after: int = 2,
+    ):
+        self.app = app
+        self.monitor = monitor
+        self.interactive_paths = interactive_paths
+        self.background_paths = background_paths
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            path = scope["path"]
+            background = path in self.background_paths
+            if (background or path in self.interactive_paths) and self.monitor.should_shed(background):
+                logger.warning(f"Shedding {path}: load {self.monitor.load():.2f}")
+                response = JSONResponse(
+                    status_code=503,
+                    content={"detail": "Server is overloaded, retry shortly"},
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
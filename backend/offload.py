@@ -0,0 +1,109 @@
+"""
+Offload of CPU-heavy work from the event loop.
+Registered functions run inline on small inputs and in a thread or process
+pool once their input passes a size threshold, so analysing one large
+document does not stall every other stream on the worker.
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+POOLS = ("thread", "process")
+
+
+def input_size(*args, **kwargs) -> int:
+    """Total length of the string arguments of a call"""
+    return sum(len(value) for value in (*args, *kwargs.values()) if isinstance(value, str))
+
+
+class OffloadPolicy:
+    """When and where a registered function leaves the event loop"""
+
+    __slots__ = ("threshold", "pool", "size")
+
+    def __init__(self, threshold: int, pool: str, size: Callable[..., int]):
+        self.threshold = threshold
+        self.pool = pool
+        self.size = size
+
+
+class Offloader:
+    """Runs registered functions inline or in a worker pool depending on input size.
+
+    Threads keep the loop responsive because the interpreter switches away
+    from the worker every few milliseconds; processes also run the work in
+    parallel but pickle the arguments and need module-level functions.
+    """
+
+    def __init__(self, pool: str = "thread", workers: int = 2):
+        if pool not in POOLS:
+            raise ValueError(f"Unknown offload pool: {pool}")
+        self.pool = pool
+        self.workers = workers
+        self.policies: Dict[Callable, OffloadPolicy] = {}
+        self.calls: Dict[str, Dict[str, int]] = {}
+        self._executors: Dict[str, Executor] = {}
+
+    def register(
+        self,
+        func: Callable,
+        threshold: int,
+        pool: Optional[str] = None,
+        size: Callable[..., int] = input_size,
+    ) -> Callable:
+        """Offload calls to func whose input size reaches threshold (0 keeps them inline)"""
+        pool = pool or self.pool
+        if pool not in POOLS:
+            raise ValueError(f"Unknown offload pool: {pool}")
+        self.policies[func] = OffloadPolicy(threshold, pool, size)
+        return func
+
+    def _executor(self, pool: str) -> Executor:
+        executor = self._executors.get(pool)
+        if executor is None:
+            if pool == "process":
+                # Spawned workers do not inherit the server's threads and locks
+                executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                executor = ThreadPoolExecutor(self.workers, thread_name_prefix="offload")
+            self._executors[pool] = executor
+        return executor
+
+    def _count(self, func: Callable, where: str):
+        counts = self.calls.setdefault(func.__qualname__, {})
+        counts[where] = counts.get(where, 0) + 1
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Call func, off the event loop if it is registered and its input is large enough"""
+        policy = self.policies.get(func)
+        if policy is None or not policy.threshold or policy.size(*args, **kwargs) < policy.threshold:
+            self._count(func, "inline")
+            return func(*args, **kwargs)
+        self._count(func, policy.pool)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(policy.pool), functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = {}
+
+    def stats(self) -> Dict:
+        return {
+            "registered": {
+                func.__qualname__: {"threshold_chars": policy.threshold, "pool": policy.pool}
+                for func, policy in self.policies.items()
+            },
+            "calls": {name: dict(counts) for name, counts in self.calls.items()},
+        }
+
+
+offloader = Offloader(pool=settings.offload_pool, workers=settings.offload_workers)
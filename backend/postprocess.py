@@ -0,0 +1,340 @@
+"""
+Streaming clean-up of insertable responses.
+Strips the preambles ("Here's an improved version:"), markdown headers and
+postambles ("Let me know if...") the system prompts ask the model to leave
+out, sentence by sentence, so text that is kept streams through with at
+most a few characters of lookahead.
+"""
+
+import re
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import settings
+from resilience import LatencyTracker
+
+# A segment ends after sentence punctuation followed by whitespace, or before a newline
+SEGMENT_END = re.compile(r"[.!?:][\"'”’)\]]*(?=\s)|(?=\n)")
+# Punctuation at the end of the buffer may still end a segment once the next character arrives
+TRAILING_PUNCTUATION = re.compile(r"[.!?:][\"'”’)\]]*$")
+
+# Segment openers that may start meta-commentary; anything else streams straight through
+PREAMBLE_OPENERS = (
+    "here's", "here’s", "here is", "here are", "below is", "sure", "certainly", "of course",
+    "absolutely", "okay", "i've ", "i’ve ", "i have ", "the improved", "the revised", "**",
+)
+POSTAMBLE_OPENERS = (
+    "let me know", "i hope", "hope this", "feel free", "if you'd like", "if you’d like",
+    "if you would like", "would you like", "please let me know", "i can also", "i've ", "i’ve ",
+    "i have ", "this version", "this revision", "this rewrite", "this revised", "this improved",
+    "this updated", "this edited", "this polished", "note:", "changes made", "summary of changes", "---", "**",
+)
+
+PREAMBLE = re.compile(
+    r"^(here'?s|here’s|here is|here are|below is|sure|certainly|of course|absolutely|okay"
+    r"|i('ve|’ve| have) (improved|rewritten|revised|written|generated|drafted|created|edited)"
+    r"|the (improved|revised))\b",
+    re.IGNORECASE,
+)
+INTERJECTION = re.compile(r"^(sure|certainly|of course|absolutely|okay)[!.,]?$", re.IGNORECASE)
+META_NOUN = re.compile(r"\b(version|draft|rewrite|revision|text|paragraph|content|passage)\b", re.IGNORECASE)
+# Postambles must talk about the response itself, so closings like "I hope to hear
+# from you soon." or "Let me know by Friday." at the end of a letter are kept
+RESPONSE_REFERENCE = (
+    r"(changes|adjustments|edits|revisions|tweaks|modifications|another version"
+    r"|a different (version|tone|style)|the (version|draft|rewrite|revision|text|tone|wording))"
+)
+POSTAMBLE = re.compile(
+    r"^(i )?hope (this|that|these|it) (helps|is helpful|works for you|meets your needs|is what you)"
+    r"|^(please )?(let me know|feel free to (ask|let me know|reach out)|if you('d|’d| would) like|would you like"
+    rf"|i can also)\b.*\b{RESPONSE_REFERENCE}\b"
+    r"|^(i've|i’ve|i have) (made|kept|improved|revised|focused|changed|tried|adjusted|rewritten|tightened"
+    r"|streamlined|simplified|clarified|polished|restructured|reorganized|edited|condensed|shortened)\b"
+    r".*\b(changes|edits|adjustments|revisions|(the|your) (text|original|draft|version|paragraph|writing"
+    r"|tone|meaning|voice|structure|flow|wording))\b"
+    rf"|^note:.*\b(i('ve|’ve| have)|{RESPONSE_REFERENCE}|original)\b"
+    r"|^(changes made|summary of changes):"
+    r"|^this (revised|improved|rewritten|updated|edited|polished) (version|draft|text|paragraph)\b"
+    r"|^this (version|revision|rewrite) (keeps|maintains|preserves|improves|uses|tightens|focuses|removes"
+    r"|adds|streamlines|enhances|reads)\b"
+    r"|^-{3,}$",
+    re.IGNORECASE,
+)
+META_TITLE = re.compile(r"^(improved|revised|rewritten|updated|edited|final)( version| text| draft)?:?$|^draft:?$", re.IGNORECASE)
+HEADER = re.compile(r"^#{1,6}\s+")
+BOLD = re.compile(r"^\*\*(.+?)\*\*:?$")
+LIST_ITEM = re.compile(r"^([-*+]|\d+[.)])\s")
+
+# Held-back text beyond these sizes is treated as content
+HELD_SEGMENT_MAX_CHARS = 300
+POSTAMBLE_MAX_CHARS = 600
+
+
+class MetaFilter:
+    """Incremental filter over the text of one response.
+
+    Text is split into segments (sentences and lines). A segment streams as
+    soon as its first characters rule out every meta-commentary opener;
+    otherwise it is held until complete and then dropped, cleaned or
+    released. Suspected postambles are held until the response ends or real
+    content follows them.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.tail = ""  # Suspected postamble, dropped if the response ends here
+        self.mode: Optional[str] = None  # None (undecided), "stream" or "hold"
+        self.started = False  # Whether any content has been emitted
+        self.stripped: Dict[str, int] = {}
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.buffer or self.tail)
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        return "".join(self._process(final=False))
+
+    def finish(self) -> str:
+        out = self._process(final=True)
+        if self.tail:
+            if len(self.tail) <= POSTAMBLE_MAX_CHARS:
+                self._count("postamble")
+            else:
+                out.append(self._content(self.tail))
+            self.tail = ""
+        return "".join(out)
+
+    @classmethod
+    def clean(cls, text: str) -> str:
+        """Filter a complete response"""
+        meta_filter = cls()
+        return meta_filter.feed(text) + meta_filter.finish()
+
+    def _count(self, kind: str):
+        self.stripped[kind] = self.stripped.get(kind, 0) + 1
+
+    def _segment_end(self) -> Optional[int]:
+        start = len(self.buffer) - len(self.buffer.lstrip())
+        match = SEGMENT_END.search(self.buffer, start)
+        if match is None or match.end() == start:
+            return None
+        return match.end()
+
+    def _openers(self, line_start: bool) -> Tuple[str, ...]:
+        openers = PREAMBLE_OPENERS if not self.started else POSTAMBLE_OPENERS
+        return openers + ("#",) if line_start else openers
+
+    def _decide(self, final: bool) -> Optional[str]:
+        """Whether the segment at the head of the buffer streams or is held, None if undecided"""
+        head = self.buffer.lstrip()
+        if not head:
+            return None
+        if self.tail:
+            # Segments after a suspected postamble are judged whole
+            return "hold"
+        line_start = not self.started or "\n" in self.buffer[:len(self.buffer) - len(head)]
+        prefix = head[:24].lower()
+        undecided = False
+        for opener in self._openers(line_start):
+            if prefix.startswith(opener):
+                return "hold"
+            if opener.startswith(prefix):
+                undecided = True
+        if undecided and not final and self._segment_end() is None:
+            return None
+        return "stream"
+
+    def _content(self, text: str) -> str:
+        """Emit content, releasing a held tail that turned out not to be the end"""
+        if self.tail:
+            text, self.tail = self.tail + text, ""
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+    def _process(self, final: bool) -> List[str]:
+        out: List[str] = []
+        while self.buffer:
+            if self.mode is None:
+                self.mode = self._decide(final)
+                if self.mode is None:
+                    if final:
+                        # Only whitespace is left
+                        if self.tail:
+                            self.tail += self.buffer
+                        elif self.started:
+                            out.append(self.buffer)
+                        self.buffer = ""
+                    break
+
+            end = self._segment_end()
+            if end is None and final:
+                end = len(self.buffer)
+
+            if self.mode == "stream":
+                if end is None:
+                    # Keep trailing punctuation back so the next segment start is seen
+                    trailing = TRAILING_PUNCTUATION.search(self.buffer)
+                    cut = trailing.start() if trailing else len(self.buffer)
+                    if cut:
+                        out.append(self._content(self.buffer[:cut]))
+                        self.buffer = self.buffer[cut:]
+                    break
+                out.append(self._content(self.buffer[:end]))
+            else:
+                if end is None or (end == len(self.buffer) and not final):
+                    # A held segment is judged with the character that follows it
+                    if len(self.buffer) > HELD_SEGMENT_MAX_CHARS and not self.tail:
+                        # Too long for meta-commentary; stream it after all
+                        self.mode = "stream"
+                        continue
+                    break
+                kept = self._held_segment(self.buffer[:end], self.buffer[end:end + 1])
+                if kept:
+                    out.append(self._content(kept))
+            self.buffer = self.buffer[end:]
+            self.mode = None
+        return [text for text in out if text]
+
+    def _held_segment(self, segment: str, following: str) -> str:
+        """Decide what to keep of a complete held segment"""
+        body = segment.lstrip()
+        leading = segment[:len(segment) - len(body)]
+        stripped = body.strip()
+        bold = BOLD.match(stripped)
+        title = bold.group(1) if bold else stripped
+
+        if HEADER.match(body) and (not self.started or "\n" in leading):
+            title = HEADER.sub("", stripped).strip("*").strip()
+            self._count("header")
+            if META_TITLE.match(title) or PREAMBLE.match(title):
+                return ""
+            return leading + title + body[len(body.rstrip()):]
+
+        if not self.started:
+            # An introduction ends in a colon before a line break, or talks about the text itself
+            introduces = stripped.endswith(":") and following in ("", "\n")
+            if META_TITLE.match(title) or INTERJECTION.match(stripped) or (
+                PREAMBLE.match(title) and (introduces or META_NOUN.search(title))
+            ):
+                self._count("preamble")
+                return ""
+            return segment
+
+        if META_TITLE.match(title) or POSTAMBLE.match(title) or (self.tail and LIST_ITEM.match(stripped)):
+            # Held until the response ends or prose follows; lists continue a postamble
+            self.tail += segment
+            if len(self.tail) > POSTAMBLE_MAX_CHARS:
+                tail, self.tail = self.tail, ""
+                return tail
+            return ""
+        return segment
+
+
+class FilterStats:
+    """Segments stripped and delay added by the filter across streams"""
+
+    def __init__(self):
+        self.streams = 0
+        self.stripped: Dict[str, int] = {}
+        self.delay = LatencyTracker(window=1000)
+
+    def add(self, meta_filter: MetaFilter):
+        self.streams += 1
+        for kind, count in meta_filter.stripped.items():
+            self.stripped[kind] = self.stripped.get(kind, 0) + count
+
+    def summary(self) -> Dict:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000, 2)
+
+        return {
+            "actions": settings.postprocess_actions,
+            "streams": self.streams,
+            "stripped": dict(self.stripped),
+            "added_delay_p50_ms": ms(self.delay.percentile(50)),
+            "added_delay_p95_ms": ms(self.delay.percentile(95)),
+            "added_delay_max_ms": ms(max(self.delay.samples)) if self.delay.samples else None,
+        }
+
+
+filter_stats = FilterStats()
+
+
+class _TimedFilter:
+    """A MetaFilter that records how long output was held back"""
+
+    def __init__(self):
+        self.filter = MetaFilter()
+        self.held_since: Optional[float] = None
+
+    def _emit(self, text: str, now: float) -> str:
+        if text:
+            filter_stats.delay.record(now - self.held_since if self.held_since is not None else 0.0)
+        if not self.filter.pending:
+            self.held_since = None
+        elif self.held_since is None or text:
+            self.held_since = now
+        return text
+
+    def feed(self, text: str) -> str:
+        now = time.monotonic()
+        if self.held_since is None:
+            self.held_since = now
+        return self._emit(self.filter.feed(text), now)
+
+    def finish(self) -> str:
+        text = self.filter.finish()
+        filter_stats.add(self.filter)
+        return self._emit(text, time.monotonic())
+
+
+async def filter_stream(generator: AsyncIterator, action: str) -> AsyncGenerator:
+    """Strip meta-commentary from an agent stream for actions that insert text directly.
+
+    Runs before structure_stream, so offsets describe the filtered text. Drafts,
+    replacements and each variant of a multi-variant stream are filtered separately.
+    """
+    if action not in settings.postprocess_actions:
+        async for item in generator:
+            yield item
+        return
+
+    main = _TimedFilter()
+    filters: Dict[Tuple, MetaFilter] = {}
+    async for item in generator:
+        if isinstance(item, str):
+            text = main.feed(item)
+            if text:
+                yield text
+        elif item.get("event") == "replace":
+            # Flush the draft's held-back text so it is complete until the replacement
+            draft_filter = filters.pop(("draft", None), None)
+            text = draft_filter.finish() if draft_filter else ""
+            if text:
+                yield {"event": "chunk", "content": text, "provisional": True}
+            yield {**item, "content": MetaFilter.clean(item["content"])}
+        elif item.get("event") == "chunk":
+            # Provisional drafts and variants each get their own filter
+            key = ("variant", item["variant"]) if "variant" in item else ("draft", None)
+            if key not in filters:
+                filters[key] = MetaFilter()
+            text = filters[key].feed(item["content"])
+            if text:
+                yield {**item, "content": text}
+        elif item.get("event") == "ranking":
+            # Flush held text so every variant is complete before its ranking
+            for (kind, variant), meta_filter in filters.items():
+                text = meta_filter.finish()
+                if text and kind == "variant":
+                    yield {"event": "chunk", "content": text, "variant": variant}
+            filters = {}
+            yield item
+        else:
+            yield item
+
+    text = main.finish()
+    if text:
+        yield text
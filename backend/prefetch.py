@@ -0,0 +1,136 @@
+"""
+Idle-time prefetch into the response cache.
+The editor sends the paragraph at the cursor while the user is idle; likely
+actions on it are computed at background priority and stored in the
+response cache, so an explicit request for the same text is served
+without waiting for the model. Prefetch spend is capped per time window.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import settings
+from prompts import count_tokens
+from response_cache import context_scope, normalize
+from scheduler import Priority, current_priority
+from usage import BudgetExceededError, current_tenant
+
+logger = logging.getLogger(__name__)
+
+# Tokens assumed per prefetch besides the content: system prompt, tool calls and results
+PREFETCH_OVERHEAD_TOKENS = 1000
+
+
+class Prefetcher:
+    """Runs speculative agent calls at background priority within a token budget"""
+
+    def __init__(
+        self,
+        agent,
+        actions: List[str],
+        token_budget: int = 50000,
+        window_seconds: int = 3600,
+        max_in_flight: int = 2,
+        min_chars: int = 80,
+    ):
+        self.agent = agent
+        self.actions = actions
+        self.token_budget = token_budget
+        self.window_seconds = window_seconds
+        self.max_in_flight = max_in_flight
+        self.min_chars = min_chars
+
+        self.window_start = time.monotonic()
+        self.reserved = 0
+        self.pending: Set[Tuple[str, str]] = set()
+        self.tasks: Set[asyncio.Task] = set()
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped: Dict[str, int] = {}
+
+    def estimate(self, content: str) -> int:
+        """Tokens a prefetch is expected to use: the content in, a rewrite of it out, plus overhead"""
+        return 2 * count_tokens(content) + PREFETCH_OVERHEAD_TOKENS
+
+    def _roll_window(self):
+        now = time.monotonic()
+        if now - self.window_start >= self.window_seconds:
+            self.window_start = now
+            self.reserved = 0
+
+    def _skip(self, reason: str) -> str:
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        return reason
+
+    def submit(self, tenant: str, content: str, context: Dict, actions: Optional[List[str]] = None) -> Dict[str, str]:
+        """Schedule prefetches for a paragraph; returns the outcome for each action"""
+        cache = self.agent.response_cache
+        outcomes: Dict[str, str] = {}
+        for action in actions or self.actions:
+            if action not in self.actions or cache is None or action not in settings.response_cache_actions:
+                outcomes[action] = self._skip("unsupported")
+                continue
+            if len(content.strip()) < self.min_chars:
+                outcomes[action] = self._skip("too_short")
+                continue
+            if cache.lookup(tenant, action, content, context, track=False) is not None:
+                outcomes[action] = self._skip("cached")
+                continue
+            key = (context_scope(action, context, tenant), normalize(content))
+            if key in self.pending:
+                outcomes[action] = self._skip("pending")
+                continue
+            if len(self.tasks) >= self.max_in_flight:
+                outcomes[action] = self._skip("busy")
+                continue
+
+            self._roll_window()
+            tokens = self.estimate(content)
+            if self.token_budget and self.reserved + tokens > self.token_budget:
+                outcomes[action] = self._skip("budget")
+                continue
+            try:
+                # Prefetches count against the tenant's own budget too
+                self.agent.usage.admit(tenant)
+            except BudgetExceededError:
+                outcomes[action] = self._skip("tenant_budget")
+                continue
+
+            self.reserved += tokens
+            self.pending.add(key)
+            self.scheduled += 1
+            task = asyncio.create_task(self._run(tenant, action, content, context, key))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            outcomes[action] = "scheduled"
+        return outcomes
+
+    async def _run(self, tenant: str, action: str, content: str, context: Dict, key: Tuple[str, str]):
+        current_tenant.set(tenant)
+        current_priority.set(Priority.BACKGROUND)
+        try:
+            await self.agent.complete_text(action, content, context, prefetch=True)
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Prefetch {action} failed: {str(e)}")
+        finally:
+            self.pending.discard(key)
+            self.agent.usage.release(tenant)
+
+    def stats(self) -> Dict:
+        self._roll_window()
+        cache = self.agent.response_cache
+        return {
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": len(self.tasks),
+            "skipped": dict(self.skipped),
+            "budget_tokens": self.token_budget,
+            "reserved_tokens": self.reserved,
+            **(cache.prefetch_stats() if cache is not None else {}),
+        }
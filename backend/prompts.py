@@ -0,0 +1,200 @@
+"""
+Prompt compilation and token counting.
+System prompts are built and tokenized once at startup; token counts for
+user content come from a cached tokenizer memoized by content hash, so
+context limits can be checked before a call without re-encoding text.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from config import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Chat formatting overhead per message and per reply (OpenAI chat format)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+SYSTEM_PROMPTS = {
+    "generate": """You are an expert writing assistant. When asked to generate text, provide ONLY the clean, well-written content that should be inserted directly into the document.
+
+DO NOT include:
+- Explanatory text like "Here's a draft" or "Based on your prompt"
+- Meta-commentary about the writing process
+- Markdown headers or formatting (the editor will handle formatting)
+- References to the prompt or instructions
+
+DO provide:
+- Clean, polished prose that directly fulfills the request
+- Natural paragraph breaks using double line breaks
+- Content that flows seamlessly as if written by the user
+
+Available tools:
+- analyze_text_structure: Analyze text structure and organization
+- suggest_improvements: Get specific improvement suggestions
+- extract_key_themes: Identify key themes and topics
+
+Focus on producing clean, insertable content only.""",
+
+    "edit": """You are an expert editor. Help users improve and refine their existing text.
+
+Available tools:
+- analyze_text_structure: Analyze current text structure
+- suggest_improvements: Get targeted improvement suggestions
+- extract_key_themes: Understand content themes
+
+Focus on clarity, coherence, and effective communication. Format your responses using markdown for better readability.""",
+
+    "improve": """You are an expert writing improvement specialist. When asked to improve text, provide ONLY the improved version of the content that should replace the original text in the document.
+
+DO NOT include:
+- Explanatory text about what you changed or why
+- Meta-commentary about the improvement process
+- Markdown headers or formatting (the editor will handle formatting)
+- Analysis or suggestions - just the improved content
+
+DO provide:
+- Clean, polished prose that improves upon the original
+- Natural paragraph breaks using double line breaks
+- Content that flows seamlessly as if written by the user
+- Enhanced clarity, engagement, and readability
+
+Available tools:
+- analyze_text_structure: Analyze text structure and organization
+- suggest_improvements: Get specific improvement suggestions
+- extract_key_themes: Identify key themes and topics
+
+Focus on producing clean, improved content only.""",
+}
+
+
+class TokenCounter:
+    """Token counts from tiktoken, memoized by content hash.
+
+    Falls back to a four-characters-per-token estimate when tiktoken or its
+    encoding files are unavailable (e.g. offline).
+    """
+
+    def __init__(self, model: str, max_entries: int = 8192):
+        self.model = model
+        self.max_entries = max_entries
+        self.encoding = None
+        self.memo: "OrderedDict[bytes, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the tokenizer for the model once"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if tiktoken is None:
+            logger.info("tiktoken not installed - using estimated token counts")
+            return
+        try:
+            try:
+                self.encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable, using estimated token counts: {str(e)}")
+            self.encoding = None
+
+    def _encode_length(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def count(self, text: str) -> int:
+        """Token count for a text"""
+        if not text:
+            return 0
+        self.load()
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            cached = self.memo.get(key)
+            if cached is not None:
+                self.memo.move_to_end(key)
+                self.hits += 1
+                return cached
+        tokens = self._encode_length(text)
+        with self._lock:
+            self.misses += 1
+            self.memo[key] = tokens
+            if len(self.memo) > self.max_entries:
+                self.memo.popitem(last=False)
+        return tokens
+
+    def _slice(self, text: str, budget: int, tail: bool) -> str:
+        self.load()
+        if self.encoding is None:
+            return text[-budget * 4:] if tail else text[:budget * 4]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        tokens = tokens[-budget:] if tail else tokens[:budget]
+        # A cut may split a multi-byte character; drop the partial bytes
+        return self.encoding.decode_bytes(tokens).decode("utf-8", errors="ignore")
+
+    def head(self, text: str, budget: int) -> str:
+        """Leading part of text made of at most budget tokens"""
+        return self._slice(text, budget, tail=False) if budget > 0 else ""
+
+    def tail(self, text: str, budget: int) -> str:
+        """Trailing part of text made of at most budget tokens"""
+        return self._slice(text, budget, tail=True) if budget > 0 else ""
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "tokenizer": self.encoding.name if self.encoding is not None else "estimate",
+            "memo_entries": len(self.memo),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class PromptLibrary:
+    """System messages per action, built and tokenized once"""
+
+    def __init__(self, counter: TokenCounter, prompts: Optional[Dict[str, str]] = None):
+        self.counter = counter
+        self.messages: Dict[str, SystemMessage] = {}
+        self.token_counts: Dict[int, int] = {}  # id(message) -> tokens
+        for action, text in (prompts or SYSTEM_PROMPTS).items():
+            message = SystemMessage(content=text)
+            self.messages[action] = message
+            self.token_counts[id(message)] = counter.count(text)
+
+    def system(self, action: str) -> SystemMessage:
+        """Compiled system message for an action (generate is the default)"""
+        return self.messages.get(action, self.messages["generate"])
+
+    def count_messages(self, messages: List[BaseMessage]) -> int:
+        """Prompt tokens for a chat request, including formatting overhead"""
+        total = TOKENS_PER_REPLY
+        for message in messages:
+            tokens = self.token_counts.get(id(message))
+            if tokens is None:
+                tokens = self.counter.count(str(message.content))
+            total += TOKENS_PER_MESSAGE + tokens
+        return total
+
+
+# Shared counter for the main model's tokenizer
+token_counter = TokenCounter(settings.openai_model)
+
+
+def count_tokens(text: str) -> int:
+    """Token count for a text using the shared counter"""
+    return token_counter.count(text)
@@ -0,0 +1,166 @@
+"""
+Adaptive rate limiting from provider rate-limit headers.
+Each LLM response updates the remaining request and token quota; calls
+wait for a slot whose size tracks the remaining quota, and background
+work is held back first when headroom runs low.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Mapping, Optional
+
+from scheduler import Priority, current_priority
+
+logger = logging.getLogger(__name__)
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# How long to wait before re-checking when no reset time is known
+POLL_SECONDS = 0.5
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse a reset duration such as "1s", "6m0s" or "20ms" into seconds"""
+    if not value:
+        return None
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """Concurrency and token gate sized by the provider's remaining quota"""
+
+    def __init__(self, max_concurrency: int = 16, background_reserve: float = 0.25):
+        self.max_concurrency = max_concurrency
+        self.background_reserve = background_reserve
+
+        self.limit_requests: Optional[int] = None
+        self.limit_tokens: Optional[int] = None
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+
+        self.in_flight: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.delayed: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._changed = asyncio.Event()
+
+    def update(self, headers: Optional[Mapping[str, str]]):
+        """Record the quota reported by a provider response"""
+        if not headers:
+            return
+        headers = {key.lower(): value for key, value in headers.items()}
+        if "x-ratelimit-remaining-requests" not in headers and "x-ratelimit-remaining-tokens" not in headers:
+            return
+
+        now = time.monotonic()
+        self.limit_requests = _int_header(headers, "x-ratelimit-limit-requests") or self.limit_requests
+        self.limit_tokens = _int_header(headers, "x-ratelimit-limit-tokens") or self.limit_tokens
+        self.remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests")
+        self.remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens")
+        self.requests_reset_at = now + (parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0)
+        self.tokens_reset_at = now + (parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0)
+        self._wake()
+
+    def headroom(self, now: Optional[float] = None) -> float:
+        """Fraction of the request and token quota still available (1.0 when unknown or reset)"""
+        now = time.monotonic() if now is None else now
+        fractions = [1.0]
+        if self.remaining_requests is not None and self.limit_requests and now < self.requests_reset_at:
+            fractions.append(self.remaining_requests / self.limit_requests)
+        if self.remaining_tokens is not None and self.limit_tokens and now < self.tokens_reset_at:
+            fractions.append(self.remaining_tokens / self.limit_tokens)
+        return max(0.0, min(fractions))
+
+    def allowed_concurrency(self, priority: Priority, now: Optional[float] = None) -> int:
+        """Calls of a priority class that may be in flight given the current headroom"""
+        now = time.monotonic() if now is None else now
+        limit = self.max_concurrency
+        if self.remaining_requests is not None and now < self.requests_reset_at:
+            limit = min(limit, self.remaining_requests)
+        if priority is Priority.INTERACTIVE:
+            # Interactive calls always get at least one slot to probe the provider
+            return max(1, limit)
+
+        headroom = self.headroom(now)
+        if headroom < self.background_reserve:
+            return 0
+        return max(1, int(limit * headroom))
+
+    def _wait_time(self, tokens: int, priority: Priority) -> Optional[float]:
+        """Seconds to wait before a call may start, or None if it may start now"""
+        now = time.monotonic()
+        pending_reset = max(self.requests_reset_at, self.tokens_reset_at) - now
+        retry_in = pending_reset if pending_reset > 0 else POLL_SECONDS
+
+        if sum(self.in_flight.values()) >= self.allowed_concurrency(priority, now):
+            return retry_in
+        if self.remaining_tokens is not None and now < self.tokens_reset_at and tokens > self.remaining_tokens:
+            return self.tokens_reset_at - now
+        return None
+
+    async def acquire(self, tokens: int = 0, priority: Optional[Priority] = None) -> Priority:
+        """Wait for a slot for a call expected to use about this many tokens"""
+        priority = priority or current_priority.get()
+        waited = False
+        while True:
+            delay = self._wait_time(tokens, priority)
+            if delay is None:
+                break
+            if not waited:
+                waited = True
+                self.delayed[priority] += 1
+            try:
+                await asyncio.wait_for(self._changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        self.in_flight[priority] += 1
+        if self.remaining_tokens is not None:
+            # Reserve the tokens until the next response reports the real quota
+            self.remaining_tokens = max(0, self.remaining_tokens - tokens)
+        return priority
+
+    def release(self, priority: Priority):
+        self.in_flight[priority] = max(0, self.in_flight[priority] - 1)
+        self._wake()
+
+    def _wake(self):
+        """Let waiting calls re-check their slot"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0, priority: Optional[Priority] = None):
+        """Hold a rate-limited slot for the duration of one call"""
+        priority = await self.acquire(tokens, priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "headroom": round(self.headroom(now), 4),
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "allowed_concurrency": {p.value: self.allowed_concurrency(p, now) for p in Priority},
+            "in_flight": {p.value: count for p, count in self.in_flight.items()},
+            "delayed": {p.value: count for p, count in self.delayed.items()},
+        }
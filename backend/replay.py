@@ -0,0 +1,150 @@
+"""
+Record and replay of LLM traffic.
+In record mode the agent's chat models are wrapped so every request,
+response and per-chunk timing is appended to a JSONL cassette; in replay
+mode cassettes are served back with the original (or scaled) timing and
+no network, so pipeline latency can be measured reproducibly.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.utils import message_chunk_to_message
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no recording matches a request"""
+
+
+def request_key(model: str, messages: List[BaseMessage]) -> str:
+    """Stable key for a model and the messages sent to it"""
+    payload = [model] + [[message.type, str(message.content)] for message in messages]
+    return hashlib.blake2b(json.dumps(payload).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def cassette_path(directory: str, model: str) -> Path:
+    return Path(directory) / f"{model.replace('/', '_')}.jsonl"
+
+
+class RecordingChatModel:
+    """Wraps a chat model and records each call with its chunk timing"""
+
+    def __init__(self, llm, model: str, directory: str):
+        self.llm = llm
+        self.model = model
+        self.path = cassette_path(directory, model)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _write(self, messages: List[BaseMessage], message: AIMessage, chunks: List, latency: float):
+        entry = {
+            "key": request_key(self.model, messages),
+            "model": self.model,
+            "request": [[m.type, str(m.content)] for m in messages],
+            "response": {
+                "content": message.content,
+                "tool_calls": message.tool_calls,
+                "usage_metadata": message.usage_metadata,
+                "response_metadata": {k: v for k, v in message.response_metadata.items() if k != "headers"},
+            },
+            "latency": round(latency, 4),
+            "chunks": chunks,
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    async def astream(self, messages: List[BaseMessage], **kwargs) -> AsyncIterator[AIMessageChunk]:
+        started = time.monotonic()
+        chunks = []
+        full: Optional[AIMessageChunk] = None
+        async for chunk in self.llm.astream(messages, **kwargs):
+            chunks.append([round(time.monotonic() - started, 4), chunk.content])
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            self._write(messages, message_chunk_to_message(full), chunks, time.monotonic() - started)
+
+    async def ainvoke(self, messages: List[BaseMessage], **kwargs) -> AIMessage:
+        # Stream underneath so the cassette keeps per-chunk timing
+        full: Optional[AIMessageChunk] = None
+        async for chunk in self.astream(messages, **kwargs):
+            full = chunk if full is None else full + chunk
+        return message_chunk_to_message(full) if full is not None else AIMessage(content="")
+
+
+class ReplayChatModel:
+    """Serves recorded responses with their original timing, scaled by time_scale"""
+
+    def __init__(self, model: str, directory: str, time_scale: float = 1.0):
+        self.model = model
+        self.time_scale = time_scale
+        self.recordings: Dict[str, List[Dict]] = {}
+        self.positions: Dict[str, int] = {}
+
+        path = cassette_path(directory, model)
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.recordings.setdefault(entry["key"], []).append(entry)
+        logger.info(f"Replaying {sum(map(len, self.recordings.values()))} recorded calls for {model}")
+
+    def _next(self, messages: List[BaseMessage]) -> Dict:
+        """Recording for a request; repeated requests cycle through their recordings in order"""
+        key = request_key(self.model, messages)
+        entries = self.recordings.get(key)
+        if not entries:
+            raise CassetteMissError(f"No recording for this {self.model} request (key {key})")
+        position = self.positions.get(key, 0)
+        self.positions[key] = position + 1
+        return entries[position % len(entries)]
+
+    def _message(self, entry: Dict) -> AIMessage:
+        response = entry["response"]
+        return AIMessage(
+            content=response["content"],
+            tool_calls=response.get("tool_calls") or [],
+            usage_metadata=response.get("usage_metadata"),
+            response_metadata=response.get("response_metadata") or {},
+        )
+
+    async def astream(self, messages: List[BaseMessage], **kwargs) -> AsyncIterator[AIMessageChunk]:
+        entry = self._next(messages)
+        chunks = entry.get("chunks") or [[entry["latency"], entry["response"]["content"]]]
+        started = time.monotonic()
+        for index, (offset, content) in enumerate(chunks):
+            delay = offset * self.time_scale - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            last = index == len(chunks) - 1
+            yield AIMessageChunk(
+                content=content,
+                usage_metadata=entry["response"].get("usage_metadata") if last else None,
+            )
+
+    async def ainvoke(self, messages: List[BaseMessage], **kwargs) -> AIMessage:
+        entry = self._next(messages)
+        if self.time_scale > 0:
+            await asyncio.sleep(entry["latency"] * self.time_scale)
+        return self._message(entry)
+
+
+def wrap_for_mode(llm, model: str, mode: str, directory: str, time_scale: float = 1.0):
+    """Apply the configured LLM mode ("live", "record" or "replay") to a chat model"""
+    if mode == "replay":
+        return ReplayChatModel(model, directory, time_scale)
+    if mode == "record" and llm is not None:
+        return RecordingChatModel(llm, model, directory)
+    return llm
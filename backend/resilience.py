@@ -0,0 +1,286 @@
+"""
+Resilience layer for LLM calls.
+Provides per-call timeouts, jittered retries, a circuit breaker and
+optional hedged requests to cut tail latency.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, TypeVar
+
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Provider errors worth retrying (transient network, rate limit and 5xx errors)
+try:
+    import openai
+    RETRYABLE_ERRORS = (
+        asyncio.TimeoutError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+except ImportError:
+    RETRYABLE_ERRORS = (asyncio.TimeoutError, ConnectionError)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls fail fast"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether an error is transient and the call may be retried"""
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker keyed on consecutive failures"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed"""
+        if self.state == "closed":
+            return True
+
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Let a single probe through to test the provider
+            self.state = "half_open"
+            self._probe_in_flight = False
+
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """End a probe that neither proved nor disproved the provider (cancelled or a client error)"""
+        if self.state == "half_open":
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit breaker opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to derive hedging delays"""
+
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+class ResilientCaller:
+    """Wraps LLM calls with timeouts, retries, a circuit breaker and hedging"""
+
+    def __init__(
+        self,
+        timeout: float,
+        max_retries: int,
+        retry_max_wait: float,
+        breaker: CircuitBreaker,
+        hedge: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 1.0,
+        chunk_timeout: Optional[float] = None,
+    ):
+        self.timeout = timeout
+        self.chunk_timeout = chunk_timeout or timeout
+        self.max_retries = max_retries
+        self.retry_max_wait = retry_max_wait
+        self.breaker = breaker
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = LatencyTracker()
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    @classmethod
+    def from_settings(cls, hedge: Optional[bool] = None) -> "ResilientCaller":
+        """Create a caller configured from application settings"""
+        return cls(
+            timeout=settings.llm_timeout_seconds,
+            max_retries=settings.llm_max_retries,
+            retry_max_wait=settings.llm_retry_max_wait_seconds,
+            breaker=CircuitBreaker(
+                settings.circuit_breaker_failure_threshold,
+                settings.circuit_breaker_reset_seconds,
+            ),
+            hedge=settings.llm_hedging if hedge is None else hedge,
+            hedge_percentile=settings.llm_hedge_percentile,
+            hedge_min_delay=settings.llm_hedge_min_delay_seconds,
+            chunk_timeout=settings.llm_chunk_timeout_seconds,
+        )
+
+    def _check_circuit(self) -> bool:
+        """Admit a call through the breaker; returns whether it is the half-open probe"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM provider unavailable (circuit breaker open)")
+        return self.breaker.state == "half_open"
+
+    def _record_error(self, error: BaseException):
+        # Client errors (bad request, context length) say nothing about provider health
+        if is_retryable(error):
+            self.breaker.record_failure()
+
+    async def invoke(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Run a non-streaming call with timeout, jittered retries and optional hedging"""
+        probe = self._check_circuit()
+
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(self.max_retries + 1),
+                wait=wait_random_exponential(multiplier=0.5, max=self.retry_max_wait),
+                retry=retry_if_exception(is_retryable),
+                reraise=True,
+            ):
+                with attempt:
+                    result = await self._attempt(call)
+        except Exception as e:
+            self._record_error(e)
+            raise
+        finally:
+            # A cancelled probe must not leave the breaker half-open forever
+            if probe:
+                self.breaker.release_probe()
+
+        self.breaker.record_success()
+        return result
+
+    async def _attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        if self.hedge:
+            result = await self._hedged(call)
+        else:
+            result = await asyncio.wait_for(call(), self.timeout)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def hedge_delay(self) -> float:
+        """Delay before firing a hedged request, based on observed tail latency"""
+        observed = self.latency.percentile(self.hedge_percentile)
+        if observed is None:
+            return self.hedge_min_delay
+        return max(self.hedge_min_delay, observed)
+
+    async def _hedged(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Fire a second request if the first is slower than the hedge delay"""
+        primary = asyncio.create_task(asyncio.wait_for(call(), self.timeout))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if done:
+                return primary.result()
+
+            self.hedges_fired += 1
+            hedge = asyncio.create_task(asyncio.wait_for(call(), self.timeout))
+            pending.add(hedge)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also reached when the caller is cancelled; no request may outlive it
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, call: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Run a streaming call, retrying only until the first chunk arrives.
+
+        Every chunk must arrive within chunk_timeout of the previous one, and the
+        provider stream is closed as soon as this generator is.
+        """
+        probe = self._check_circuit()
+        iterator = None
+
+        try:
+            attempt = 0
+            while True:
+                start = time.monotonic()
+                iterator = call().__aiter__()
+                try:
+                    first = await asyncio.wait_for(iterator.__anext__(), self.timeout)
+                    self.latency.record(time.monotonic() - start)
+                    break
+                except StopAsyncIteration:
+                    self.breaker.record_success()
+                    return
+                except Exception as e:
+                    await _close(iterator)
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        self._record_error(e)
+                        raise
+                    attempt += 1
+                    delay = random.uniform(0, min(self.retry_max_wait, 0.5 * 2 ** attempt))
+                    logger.warning(f"Retrying stream after {type(e).__name__} (attempt {attempt}) in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+            yield first
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), self.chunk_timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except Exception as e:
+                self._record_error(e)
+                raise
+            self.breaker.record_success()
+        finally:
+            if iterator is not None:
+                await _close(iterator)
+            # Also reached when the probe is cancelled or the consumer closes the stream early
+            if probe:
+                self.breaker.release_probe()
+
+
+async def _close(iterator: AsyncIterator):
+    """Close a provider stream that supports it"""
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
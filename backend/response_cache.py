@@ -0,0 +1,283 @@
+"""
+Response cache for the writing agent.
+Exact matches are keyed by a hash of normalized content; near-duplicates
+(typos, whitespace, an extra sentence) are found with MinHash signatures
+in an LSH index and verified against a similarity threshold. A sample of
+served near-duplicate hits is re-checked with exact shingle similarity to
+measure the false-hit rate of the MinHash estimate.
+"""
+
+import hashlib
+import json
+import random
+import re
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Context keys that change per request without changing the desired output
+VOLATILE_CONTEXT_KEYS = {"cursorPosition", "selection"}
+
+SHINGLE_SIZE = 5
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def normalize(text: str) -> str:
+    """Normalize text so trivial differences map to the same string"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def context_scope(action: str, context: Dict, tenant: str) -> str:
+    """Stable key for the tenant, the action and the parts of context that affect the output.
+
+    Results are never shared across tenants, neither exact nor near-duplicate.
+    """
+    relevant = {k: v for k, v in (context or {}).items() if k not in VOLATILE_CONTEXT_KEYS}
+    encoded = json.dumps(relevant, sort_keys=True, default=str)
+    return hashlib.blake2b(f"{tenant}\x00{action}\x00{encoded}".encode(), digest_size=12).hexdigest()
+
+
+def shingle_hashes(text: str) -> List[int]:
+    """32-bit hashes of overlapping character shingles"""
+    if len(text) <= SHINGLE_SIZE:
+        return [zlib.crc32(text.encode())]
+    return list({zlib.crc32(text[i:i + SHINGLE_SIZE].encode()) for i in range(len(text) - SHINGLE_SIZE + 1)})
+
+
+class MinHasher:
+    """MinHash signatures using universal hashing permutations"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.RandomState(seed) if np is not None else None
+        if rng is not None:
+            self.a = rng.randint(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+            self.b = rng.randint(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+        else:
+            import random
+            generator = random.Random(seed)
+            self.a = [generator.randint(1, MAX_HASH) for _ in range(num_perm)]
+            self.b = [generator.randint(0, MAX_HASH) for _ in range(num_perm)]
+        self.num_perm = num_perm
+
+    def signature(self, hashes: List[int]) -> Tuple[int, ...]:
+        if np is not None:
+            values = np.asarray(hashes, dtype=np.uint64)[:, None]
+            # Products stay below 2**64 because both factors are below 2**32
+            permuted = (values * self.a + self.b) % np.uint64(MERSENNE_PRIME) & np.uint64(MAX_HASH)
+            return tuple(int(v) for v in permuted.min(axis=0))
+        return tuple(
+            min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+            for a, b in zip(self.a, self.b)
+        )
+
+
+def exact_similarity(first: str, second: str) -> float:
+    """Exact Jaccard similarity between the shingle sets of two normalized texts"""
+    a, b = set(shingle_hashes(first)), set(shingle_hashes(second))
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def estimated_similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity between two MinHash signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+class CacheEntry:
+    __slots__ = ("key", "scope", "signature", "normalized", "result", "created", "hits", "prefetched")
+
+    def __init__(
+        self,
+        key: str,
+        scope: str,
+        signature: Optional[Tuple[int, ...]],
+        normalized: Optional[str],
+        result: str,
+        prefetched: bool = False,
+    ):
+        self.key = key
+        self.scope = scope
+        self.signature = signature
+        self.normalized = normalized  # Kept for near-duplicate entries to verify sampled hits
+        self.result = result
+        self.created = time.monotonic()
+        self.hits = 0
+        self.prefetched = prefetched
+
+
+class ResponseCache:
+    """LRU response cache with exact and near-duplicate lookup"""
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_seconds: float = 3600.0,
+        threshold: float = 0.85,
+        num_perm: int = 64,
+        bands: int = 16,
+        min_length: int = 40,
+        verify_rate: float = 0.1,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_length = min_length
+        self.verify_rate = verify_rate
+        self.hasher = MinHasher(num_perm)
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[str]] = {}
+
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.rejected_candidates = 0  # LSH candidates below the estimated similarity threshold
+        self.near_verified = 0  # Served near hits re-checked with exact similarity
+        self.near_false_hits = 0  # Verified near hits whose exact similarity is below the threshold
+        self.near_similarity_total = 0.0
+        self.prefetch_stored = 0
+        self.prefetch_used = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _key(self, scope: str, normalized: str) -> str:
+        return hashlib.blake2b(f"{scope}\x00{normalized}".encode(), digest_size=16).hexdigest()
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield (scope, band, signature[band * self.rows:(band + 1) * self.rows])
+
+    def _signature(self, normalized: str) -> Optional[Tuple[int, ...]]:
+        if self.threshold <= 0 or len(normalized) < self.min_length:
+            return None
+        return self.hasher.signature(shingle_hashes(normalized))
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.created > self.ttl_seconds
+
+    def _evict(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None or entry.signature is None:
+            return
+        for band_key in self._band_keys(entry.scope, entry.signature):
+            bucket = self.buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def _hit(self, entry: CacheEntry):
+        self.entries.move_to_end(entry.key)
+        if entry.prefetched and not entry.hits:
+            self.prefetch_used += 1
+        entry.hits += 1
+
+    def lookup(self, tenant: str, action: str, content: str, context: Dict, track: bool = True) -> Optional[str]:
+        """Return a cached result of the tenant's for identical or near-identical content.
+
+        With track=False the lookup leaves hit counts and LRU order untouched.
+        """
+        scope = context_scope(action, context, tenant)
+        normalized = normalize(content)
+        key = self._key(scope, normalized)
+
+        entry = self.entries.get(key)
+        if entry is not None and not self._expired(entry):
+            if track:
+                self._hit(entry)
+                self.exact_hits += 1
+            return entry.result
+
+        signature = self._signature(normalized)
+        if signature is not None:
+            candidates: Set[str] = set()
+            for band_key in self._band_keys(scope, signature):
+                candidates.update(self.buckets.get(band_key, ()))
+
+            best: Optional[CacheEntry] = None
+            best_similarity = 0.0
+            for candidate_key in candidates:
+                candidate = self.entries.get(candidate_key)
+                if candidate is None or self._expired(candidate):
+                    continue
+                similarity = estimated_similarity(signature, candidate.signature)
+                if similarity < self.threshold:
+                    # LSH collision that fails verification
+                    if track:
+                        self.rejected_candidates += 1
+                elif similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+
+            if best is not None:
+                if track:
+                    self._hit(best)
+                    self.near_hits += 1
+                    self.near_similarity_total += best_similarity
+                    if best.normalized is not None and random.random() < self.verify_rate:
+                        self._verify(normalized, best)
+                return best.result
+
+        if track:
+            self.misses += 1
+        return None
+
+    def _verify(self, normalized: str, entry: CacheEntry):
+        """Check a served near hit against exact similarity"""
+        self.near_verified += 1
+        if exact_similarity(normalized, entry.normalized) < self.threshold:
+            self.near_false_hits += 1
+
+    def store(self, tenant: str, action: str, content: str, context: Dict, result: str, prefetched: bool = False):
+        """Cache a result for the given request; prefetched entries count toward the prefetch hit rate"""
+        scope = context_scope(action, context, tenant)
+        normalized = normalize(content)
+        key = self._key(scope, normalized)
+        self._evict(key)
+
+        signature = self._signature(normalized)
+        entry = CacheEntry(key, scope, signature, normalized if signature is not None else None, result, prefetched)
+        self.entries[key] = entry
+        if prefetched:
+            self.prefetch_stored += 1
+        if entry.signature is not None:
+            for band_key in self._band_keys(scope, entry.signature):
+                self.buckets.setdefault(band_key, set()).add(key)
+
+        while len(self.entries) > self.max_entries:
+            self._evict(next(iter(self.entries)))
+
+    def stats(self) -> Dict:
+        """Hit-rate and false-hit metrics"""
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            "rejected_candidates": self.rejected_candidates,
+            "near_verified": self.near_verified,
+            "near_false_hits": self.near_false_hits,
+            "near_false_hit_rate": round(self.near_false_hits / self.near_verified, 4) if self.near_verified else None,
+            "avg_near_similarity": round(self.near_similarity_total / self.near_hits, 4) if self.near_hits else None,
+            **self.prefetch_stats(),
+        }
+
+    def prefetch_stats(self) -> Dict:
+        """Share of prefetched entries later served to an explicit request"""
+        return {
+            "prefetch_stored": self.prefetch_stored,
+            "prefetch_used": self.prefetch_used,
+            "prefetch_hit_rate": round(self.prefetch_used / self.prefetch_stored, 4) if self.prefetch_stored else 0.0,
+        }
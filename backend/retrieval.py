@@ -0,0 +1,374 @@
+"""
+Lexical retrieval helpers.
+Provides a small incremental BM25 index and builds token-budgeted
+continuation context from long documents.
+"""
+
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from prompts import count_tokens, token_counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Query terms scored per search; a long query (a whole edited passage) keeps its rarest terms
+MAX_QUERY_TERMS = 32
+
+STOPWORDS = {
+    'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'a', 'an', 'is', 'are',
+    'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those', 'it', 'its', 'as', 'from', 'not',
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """Split text into non-empty paragraphs on blank lines"""
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+class _Postings:
+    """Internal ids (ascending) and term frequencies of the documents holding one term"""
+
+    __slots__ = ("ids", "tfs", "df", "max_tf", "min_length")
+
+    def __init__(self):
+        self.ids = array("i")
+        self.tfs = array("i")
+        self.df = 0  # Live documents; ids may still hold removed ones
+        # Bounds over every posting, removed ones included; they cap the term's score
+        self.max_tf = 0
+        self.min_length = 0
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring that supports incremental upserts.
+
+    Postings are compact arrays scored with NumPy when it is installed. Removed
+    documents are tombstoned and dropped in bulk once they make up half the
+    postings. Long queries keep their max_query_terms rarest terms, and search
+    stops admitting new candidates once the remaining terms can no longer lift
+    one into the top k (max-score), so common terms only rescore candidates.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_query_terms: int = MAX_QUERY_TERMS):
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+        self.postings: Dict[str, _Postings] = {}
+        self.ids: Dict[Hashable, int] = {}  # key -> internal id of its current version
+        self.keys: List[Hashable] = []  # internal id -> key
+        self.lengths = array("i")  # internal id -> token count
+        self.live = bytearray()  # internal id -> 1 until removed
+        self.doc_postings: List[_Postings] = []  # Postings of each internal id, in id order
+        self.doc_offsets = array("q", [0])  # internal id -> start in doc_postings
+        self.total_length = 0
+        self.dead_postings = 0
+        self.version = 0  # Bumped on every change; invalidates the cached length norms
+        self._norms = None
+        self._norms_version = -1
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, key: Hashable, text: str):
+        """Index a document, replacing any previous version under the same key"""
+        if key in self.ids:
+            self.remove(key)
+        tokens = tokenize(text)
+        doc = len(self.keys)
+        for term, count in Counter(tokens).items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+            postings.ids.append(doc)
+            postings.tfs.append(count)
+            postings.df += 1
+            postings.max_tf = max(postings.max_tf, count)
+            postings.min_length = min(postings.min_length, len(tokens)) if postings.df > 1 else len(tokens)
+            self.doc_postings.append(postings)
+        self.ids[key] = doc
+        self.keys.append(key)
+        self.lengths.append(len(tokens))
+        self.live.append(1)
+        self.doc_offsets.append(len(self.doc_postings))
+        self.total_length += len(tokens)
+        self.version += 1
+
+    def remove(self, key: Hashable):
+        """Drop a document from the index"""
+        doc = self.ids.pop(key, None)
+        if doc is None:
+            return
+        self.live[doc] = 0
+        self.total_length -= self.lengths[doc]
+        self.version += 1
+        start, end = self.doc_offsets[doc], self.doc_offsets[doc + 1]
+        for postings in self.doc_postings[start:end]:
+            postings.df -= 1
+        self.dead_postings += end - start
+        if self.dead_postings * 2 > len(self.doc_postings):
+            self._compact()
+
+    def _compact(self):
+        """Drop removed documents from the postings and renumber the rest densely"""
+        renumbered = array("i", [-1]) * len(self.keys)
+        keys: List[Hashable] = []
+        lengths = array("i")
+        doc_postings: List[_Postings] = []
+        doc_offsets = array("q", [0])
+        for doc, key in enumerate(self.keys):
+            if not self.live[doc]:
+                continue
+            renumbered[doc] = len(keys)
+            keys.append(key)
+            lengths.append(self.lengths[doc])
+            doc_postings.extend(self.doc_postings[self.doc_offsets[doc]:self.doc_offsets[doc + 1]])
+            doc_offsets.append(len(doc_postings))
+
+        for term in list(self.postings):
+            postings = self.postings[term]
+            if not postings.df:
+                del self.postings[term]
+                continue
+            ids, tfs = array("i"), array("i")
+            for doc, tf in zip(postings.ids, postings.tfs):
+                if self.live[doc]:
+                    ids.append(renumbered[doc])
+                    tfs.append(tf)
+            postings.ids, postings.tfs = ids, tfs
+            postings.max_tf = max(tfs)
+            postings.min_length = min(lengths[doc] for doc in ids)
+
+        self.ids = {key: doc for doc, key in enumerate(keys)}
+        self.keys = keys
+        self.lengths = lengths
+        self.live = bytearray(b"\x01") * len(keys)
+        self.doc_postings = doc_postings
+        self.doc_offsets = doc_offsets
+        self.dead_postings = 0
+        self.version += 1
+
+    def _query_terms(self, query: str) -> List[Tuple[float, _Postings]]:
+        """(idf, postings) of the query's rarest indexed terms, rarest first"""
+        doc_count = len(self.ids)
+        terms = []
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings is None or not postings.df:
+                continue
+            idf = math.log(1 + (doc_count - postings.df + 0.5) / (postings.df + 0.5))
+            terms.append((idf, postings))
+        terms.sort(key=lambda item: item[0], reverse=True)
+        return terms[:self.max_query_terms]
+
+    def search(self, query: str, top_k: int, exclude: Optional[Set[Hashable]] = None) -> List[Tuple[Hashable, float]]:
+        """Return the top_k (key, score) pairs for a query"""
+        if not self.ids or top_k <= 0:
+            return []
+        avg_length = self.total_length / len(self.ids) or 1.0
+        terms = []
+        for idf, postings in self._query_terms(query):
+            # Highest score the term can add: its largest tf in its shortest document
+            length_norm = 1 - self.b + self.b * postings.min_length / avg_length
+            ceiling = idf * postings.max_tf * (self.k1 + 1) / (postings.max_tf + self.k1 * length_norm)
+            terms.append((idf, postings, ceiling))
+        # Most any document can still gain from the terms after each position
+        remaining = [0.0] * len(terms)
+        for position in range(len(terms) - 2, -1, -1):
+            remaining[position] = remaining[position + 1] + terms[position + 1][2]
+        excluded = [self.ids[key] for key in exclude if key in self.ids] if exclude else []
+
+        if np is not None:
+            results = self._search_arrays(terms, remaining, top_k, excluded)
+        else:
+            results = self._search_python(terms, remaining, top_k, excluded)
+        return [(self.keys[doc], score) for doc, score in results]
+
+    def _length_norms(self):
+        """k1-scaled length normalization of every document, cached until the index changes"""
+        if self._norms_version != self.version:
+            avg_length = self.total_length / len(self.ids) or 1.0
+            lengths = np.frombuffer(self.lengths, dtype=np.int32)
+            self._norms = (self.k1 * (1 - self.b + self.b * lengths / avg_length)).astype(np.float32)
+            self._norms_version = self.version
+        return self._norms
+
+    def _search_arrays(self, terms, remaining, top_k: int, excluded: List[int]) -> List[Tuple[int, float]]:
+        norms = self._length_norms()
+        live = np.frombuffer(self.live, dtype=np.uint8) if self.dead_postings else None
+        excluded = np.asarray(excluded, dtype=np.int64)
+        scores = np.zeros(len(self.keys))
+        best = np.empty(0, dtype=np.int64)  # The top_k documents so far, kept without a full scan
+        candidates = None  # Set once no new document can reach the top k
+
+        for (idf, postings, _), bound in zip(terms, remaining):
+            ids = np.frombuffer(postings.ids, dtype=np.int32)
+            tfs = np.frombuffer(postings.tfs, dtype=np.int32)
+            probed = candidates is not None and len(candidates) * 16 < len(ids)
+            if probed:
+                # Few candidates left: look them up instead of reading the whole list
+                found = np.minimum(np.searchsorted(ids, candidates), len(ids) - 1)
+                hit = ids[found] == candidates
+                ids, tfs = candidates[hit], tfs[found[hit]]
+            tfs = tfs.astype(np.float32)
+            contributions = tfs * np.float32(idf * (self.k1 + 1)) / (tfs + norms[ids])
+            if candidates is not None and not probed:
+                contributions *= in_play[ids]
+            if live is not None:
+                contributions *= live[ids]
+            scores[ids] += contributions
+            scores[excluded] = 0.0
+
+            if candidates is not None:
+                if len(candidates) > top_k:
+                    kth = np.partition(scores[candidates], len(candidates) - top_k)[len(candidates) - top_k]
+                    keep = scores[candidates] + bound >= kth
+                    in_play[candidates[~keep]] = 0
+                    candidates = candidates[keep]
+                continue
+
+            # Only documents in this term's postings changed score
+            stale = ids[np.minimum(np.searchsorted(ids, best), len(ids) - 1)] == best
+            best = np.concatenate((best[~stale], ids))
+            if len(best) > top_k:
+                best = best[np.argpartition(-scores[best], top_k - 1)[:top_k]]
+            if len(best) == top_k and scores[best].min() >= bound:
+                kth = scores[best].min()
+                touched = np.flatnonzero(scores)
+                candidates = touched[scores[touched] + bound >= kth]
+                in_play = np.zeros(len(scores), dtype=np.uint8)
+                in_play[candidates] = 1
+
+        if candidates is None:
+            candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(doc), float(scores[doc])) for doc in candidates]
+
+    def _search_python(self, terms, remaining, top_k: int, excluded: List[int]) -> List[Tuple[int, float]]:
+        avg_length = self.total_length / len(self.ids) or 1.0
+        skip = set(excluded)
+        scores: Dict[int, float] = {}
+        admitting = True
+        reached = 0.0
+
+        for (idf, postings, ceiling), bound in zip(terms, remaining):
+            if admitting:
+                matches = zip(postings.ids, postings.tfs)
+            else:
+                matches = []
+                for doc in scores:
+                    found = bisect_left(postings.ids, doc)
+                    if found < len(postings.ids) and postings.ids[found] == doc:
+                        matches.append((doc, postings.tfs[found]))
+            for doc, tf in matches:
+                if not self.live[doc] or doc in skip:
+                    continue
+                length_norm = 1 - self.b + self.b * self.lengths[doc] / avg_length
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+            reached += ceiling
+            if admitting and reached < bound:
+                continue
+            if len(scores) >= top_k:
+                kth = heapq.nlargest(top_k, scores.values())[-1]
+                if kth >= bound:
+                    admitting = False
+                    scores = {doc: score for doc, score in scores.items() if score + bound >= kth}
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def tail_within(text: str, budget: int) -> str:
+    """Trailing part of text that fits the token budget, cut at a word boundary"""
+    if count_tokens(text) <= budget:
+        return text
+    # Re-tokenizing a cut can cost a token more than the slice; shrink until it fits
+    for limit in range(budget, 0, -1):
+        tail = token_counter.tail(text, limit)
+        space = tail.find(" ")
+        tail = tail[space + 1:] if 0 <= space < len(tail) - 1 else tail
+        if count_tokens(tail) <= budget:
+            return tail
+    return ""
+
+
+def head_within(text: str, budget: int) -> str:
+    """Leading part of text that fits the token budget, cut at a word boundary"""
+    if count_tokens(text) <= budget:
+        return text
+    for limit in range(budget, 0, -1):
+        head = token_counter.head(text, limit)
+        space = head.rfind(" ")
+        head = head[:space] if space > 0 else head
+        if count_tokens(head) <= budget:
+            return head
+    return ""
+
+
+def build_continuation_context(
+    preceding_text: str,
+    window_budget: int,
+    retrieval_budget: int,
+    top_k: int,
+) -> Tuple[List[str], str]:
+    """Select the text window before the cursor plus relevant earlier paragraphs.
+
+    The window holds the most recent paragraphs that fit window_budget. When the
+    document is longer than that, earlier paragraphs are ranked with BM25 against
+    the window and the best ones (up to top_k and retrieval_budget) are returned
+    in document order.
+    """
+    paragraphs = split_paragraphs(preceding_text)
+    if not paragraphs:
+        return [], ""
+
+    # Fill the window backwards from the cursor
+    window: List[str] = []
+    used = 0
+    split = len(paragraphs)
+    for paragraph in reversed(paragraphs):
+        cost = count_tokens(paragraph)
+        if used + cost > window_budget:
+            if not window:
+                window.append(tail_within(paragraph, window_budget))
+                split -= 1
+            break
+        window.insert(0, paragraph)
+        used += cost
+        split -= 1
+
+    earlier = paragraphs[:split]
+    if not earlier or retrieval_budget <= 0 or top_k <= 0:
+        return [], "\n\n".join(window)
+
+    index = BM25Index()
+    for position, paragraph in enumerate(earlier):
+        index.add(position, paragraph)
+
+    selected: List[int] = []
+    spent = 0
+    for position, score in index.search(" ".join(window), top_k):
+        cost = count_tokens(earlier[position])
+        if spent + cost > retrieval_budget:
+            continue
+        selected.append(position)
+        spent += cost
+
+    return [earlier[position] for position in sorted(selected)], "\n\n".join(window)
@@ -0,0 +1,174 @@
+"""
+Priority scheduling for LLM calls.
+Interactive editor requests and background work (whole-document
+improvements, batch jobs) share a fixed number of LLM slots; freed slots
+go to the interactive class first, either strictly or by weight, and
+per-class latency is tracked against SLO targets.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import AsyncGenerator, AsyncIterator, Deque, Dict, Optional
+
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
+# Priority of the work being done; set per request or stream
+current_priority: ContextVar[Priority] = ContextVar("current_priority", default=Priority.INTERACTIVE)
+
+
+class ClassMetrics:
+    """Latency samples for one priority class"""
+
+    def __init__(self, slo_p95: float):
+        self.slo_p95 = slo_p95
+        self.queue_wait = LatencyTracker(window=500)
+        self.first_output = LatencyTracker(window=500)
+        self.total = LatencyTracker(window=500)
+        self.completed = 0
+
+    def summary(self) -> Dict:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000, 1)
+
+        first_p95 = self.first_output.percentile(95)
+        return {
+            "completed": self.completed,
+            "queue_wait_p50_ms": ms(self.queue_wait.percentile(50)),
+            "queue_wait_p95_ms": ms(self.queue_wait.percentile(95)),
+            "first_output_p50_ms": ms(self.first_output.percentile(50)),
+            "first_output_p95_ms": ms(first_p95),
+            "total_p95_ms": ms(self.total.percentile(95)),
+            "slo_p95_ms": ms(self.slo_p95),
+            "slo_met": None if first_p95 is None else first_p95 <= self.slo_p95,
+        }
+
+
+class PriorityScheduler:
+    """Fixed pool of LLM slots handed out by priority class.
+
+    In "strict" mode a waiting interactive call always gets the next slot. In
+    "weighted" mode slots are shared by smooth weighted round robin, so
+    background work keeps a small guaranteed share under interactive load.
+    """
+
+    def __init__(
+        self,
+        slots: int = 8,
+        mode: str = "weighted",
+        weights: Optional[Dict[Priority, int]] = None,
+        slo_p95: Optional[Dict[Priority, float]] = None,
+    ):
+        self.slots = slots
+        self.mode = mode
+        self.weights = weights or {Priority.INTERACTIVE: 4, Priority.BACKGROUND: 1}
+        self.available = slots
+        self.waiting: Dict[Priority, Deque[asyncio.Future]] = {priority: deque() for priority in Priority}
+        self.in_flight: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.credits: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        slo_p95 = slo_p95 or {}
+        self.metrics = {priority: ClassMetrics(slo_p95.get(priority, 2.0)) for priority in Priority}
+
+    def _next_class(self) -> Optional[Priority]:
+        """Class that gets the next free slot"""
+        ready = [priority for priority in Priority if self.waiting[priority]]
+        if not ready:
+            return None
+        if self.mode == "strict" or len(ready) == 1:
+            return ready[0]
+        # Smooth weighted round robin over the classes with waiters
+        total = sum(self.weights[priority] for priority in ready)
+        for priority in ready:
+            self.credits[priority] += self.weights[priority]
+        chosen = max(ready, key=lambda priority: self.credits[priority])
+        self.credits[chosen] -= total
+        return chosen
+
+    def _dispatch(self):
+        while self.available > 0:
+            priority = self._next_class()
+            if priority is None:
+                return
+            waiter = self.waiting[priority].popleft()
+            if waiter.done():
+                continue  # Cancelled while queued
+            self.available -= 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: Optional[Priority] = None) -> Priority:
+        """Wait for an LLM slot for the given (or current) priority class"""
+        priority = priority or current_priority.get()
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiting[priority].append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                if waiter in self.waiting[priority]:
+                    self.waiting[priority].remove(waiter)
+            else:
+                # Granted just as we were cancelled; hand the slot on
+                self.available += 1
+                self._dispatch()
+            raise
+        self.in_flight[priority] += 1
+        self.metrics[priority].queue_wait.record(time.monotonic() - started)
+        return priority
+
+    def release(self, priority: Priority):
+        self.in_flight[priority] -= 1
+        self.available += 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[Priority] = None):
+        """Hold an LLM slot for the duration of one call"""
+        priority = await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    async def track_stream(self, generator: AsyncIterator, priority: Priority) -> AsyncGenerator:
+        """Run a stream at a priority, recording time to first output and total latency"""
+        current_priority.set(priority)
+        metrics = self.metrics[priority]
+        started = time.monotonic()
+        first = True
+        async for item in generator:
+            if first:
+                first = False
+                metrics.first_output.record(time.monotonic() - started)
+            yield item
+        metrics.total.record(time.monotonic() - started)
+        metrics.completed += 1
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "slots": self.slots,
+            "available": self.available,
+            "classes": {
+                priority.value: {
+                    "in_flight": self.in_flight[priority],
+                    "waiting": len(self.waiting[priority]),
+                    "weight": self.weights[priority],
+                    **self.metrics[priority].summary(),
+                }
+                for priority in Priority
+            },
+        }
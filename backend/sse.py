@@ -0,0 +1,236 @@
+"""
+Compact Server-Sent Events framing for the streaming endpoints.
+Pre-encodes the constant parts of each event, coalesces chunks into
+frames by size or time window and optionally gzips the stream.
+"""
+
+import asyncio
+import json
+import logging
+import zlib
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Items read ahead of a slow client; when full, the agent generator waits
+PUMP_QUEUE_SIZE = 64
+
+# Event type prefix used for each agent action
+ACTION_EVENT_TYPES = {
+    "generate": "generation",
+    "edit": "edit",
+    "improve": "improve",
+}
+
+
+def dumps(obj) -> bytes:
+    """Encode an object as compact UTF-8 JSON, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class _Done:
+    """Marks the end of the source generator"""
+
+
+class _Failure:
+    """Carries an exception raised by the source generator"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class SSEWriter:
+    """Encodes events for one action type with pre-encoded prefixes"""
+
+    def __init__(self, action_type: str):
+        self.action_type = action_type
+        self._chunk_prefix = b'data: {"type":' + dumps(f"{action_type}_chunk") + b',"content":'
+        self._suffix = b"}\n\n"
+
+    def event(self, event_type: str, **fields) -> bytes:
+        """Encode an arbitrary event as a single SSE message"""
+        payload = {"type": f"{self.action_type}_{event_type}", **fields}
+        return b"data: " + dumps(payload) + b"\n\n"
+
+    def chunk(self, content: str, **fields) -> bytes:
+        """Encode a chunk event; plain chunks skip dict construction entirely"""
+        if fields:
+            return self.event("chunk", content=content, **fields)
+        return self._chunk_prefix + dumps(content) + self._suffix
+
+    def start(self, **fields) -> bytes:
+        return self.event("start", message=f"Starting {self.action_type}...", **fields)
+
+    def complete(self) -> bytes:
+        return self.event("complete", message=f"{self.action_type.title()} completed")
+
+    def error(self, message: str) -> bytes:
+        return b"data: " + dumps({"type": "error", "message": message}) + b"\n\n"
+
+
+class _ChunkBuffer:
+    """Accumulates consecutive chunks that share the same extra fields.
+
+    Chunks with offsets are contiguous, so the merged chunk keeps the first offset.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.size = 0
+        self.fields: Dict = {}
+        self.offset: Optional[int] = None
+        self.deadline: Optional[float] = None
+
+    def add(self, content: str, fields: Dict, offset: Optional[int], deadline: float):
+        if not self.parts:
+            self.fields = fields
+            self.offset = offset
+            self.deadline = deadline
+        self.parts.append(content)
+        self.size += len(content)
+
+    def drain(self, writer: SSEWriter) -> bytes:
+        if not self.parts:
+            return b""
+        fields = self.fields if self.offset is None else {"offset": self.offset, **self.fields}
+        frame = writer.chunk("".join(self.parts), **fields)
+        self.parts = []
+        self.size = 0
+        self.fields = {}
+        self.offset = None
+        self.deadline = None
+        return frame
+
+
+def _as_chunk(item) -> Optional[Tuple[str, Dict, Optional[int]]]:
+    """Return (content, extra fields, offset) if the item is a coalescable chunk"""
+    if isinstance(item, str):
+        return item, {}, None
+    if isinstance(item, dict) and item.get("event") == "chunk":
+        fields = {k: v for k, v in item.items() if k not in ("event", "content", "offset")}
+        return item.get("content", ""), fields, item.get("offset")
+    return None
+
+
+async def coalesce_frames(
+    generator: AsyncIterator,
+    writer: SSEWriter,
+    window_ms: float,
+    max_bytes: int,
+) -> AsyncGenerator[bytes, None]:
+    """Turn agent output into SSE frames, merging chunks by size or time window.
+
+    String chunks and dict chunk events with identical extra fields (ignoring
+    offsets) are joined into one chunk event; any other dict is emitted as its own event after
+    flushing pending text. A frame may contain several events, so each yield
+    is one write on the wire.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=PUMP_QUEUE_SIZE)
+    window = window_ms / 1000
+
+    async def pump():
+        try:
+            async for item in generator:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(_Failure(e))
+            return
+        finally:
+            # Close the source promptly when the client goes away mid-stream
+            aclose = getattr(generator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        await queue.put(_Done)
+
+    task = asyncio.create_task(pump())
+    buffer = _ChunkBuffer()
+    try:
+        while True:
+            timeout = None if buffer.deadline is None else max(0.0, buffer.deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield buffer.drain(writer)
+                continue
+
+            if item is _Done:
+                break
+            if isinstance(item, _Failure):
+                pending = buffer.drain(writer)
+                if pending:
+                    yield pending
+                raise item.error
+
+            chunk = _as_chunk(item)
+            if chunk is None:
+                event = dict(item)
+                event_type = event.pop("event")
+                yield buffer.drain(writer) + writer.event(event_type, **event)
+                continue
+
+            content, fields, offset = chunk
+            if not content:
+                continue
+            if buffer.parts and fields != buffer.fields:
+                yield buffer.drain(writer)
+            buffer.add(content, fields, offset, loop.time() + window)
+            if buffer.size >= max_bytes or window <= 0:
+                yield buffer.drain(writer)
+
+        pending = buffer.drain(writer)
+        if pending:
+            yield pending
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def create_sse_stream(
+    generator: AsyncIterator,
+    action_type: str,
+    stream_id: Optional[str] = None,
+) -> AsyncGenerator[bytes, None]:
+    """Create an SSE formatted byte stream from an agent generator"""
+    writer = SSEWriter(action_type)
+    try:
+        # Send start event, with the id clients use to resume the stream
+        yield writer.start(**({"stream_id": stream_id} if stream_id else {}))
+
+        # Stream coalesced content frames
+        async for frame in coalesce_frames(
+            generator,
+            writer,
+            window_ms=settings.sse_coalesce_ms,
+            max_bytes=settings.sse_coalesce_bytes,
+        ):
+            yield frame
+
+        # Send completion event
+        yield writer.complete()
+
+    except Exception as e:
+        logger.error(f"{action_type} error: {str(e)}")
+        yield writer.error(f"{action_type.title()} failed: {str(e)}")
+
+
+async def gzip_stream(stream: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+    """Gzip a byte stream, sync-flushing after every frame so events are not held back"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for frame in stream:
+        yield compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Check whether the client accepts a gzip-encoded response"""
+    return "gzip" in (accept_encoding or "").lower()
@@ -0,0 +1,307 @@
+"""
+Structured streaming output.
+Annotates streamed text with UTF-16 offsets (matching JavaScript string
+indices) and block boundaries with ProseMirror node hints, and keeps a
+short-lived record of each stream so a reconnecting client can resume at
+an exact offset. Recorded streams are produced by a task of their own, so
+they keep running while the client that started them reconnects, and are
+cancelled once no client has followed them for a short grace period.
+"""
+
+import asyncio
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SEPARATOR = re.compile(r"(\n{2,})")
+
+NODE_PATTERNS = [
+    (re.compile(r"^#{1,6}\s"), "heading"),
+    (re.compile(r"^[-*+]\s"), "bulletList"),
+    (re.compile(r"^\d+[.)]\s"), "orderedList"),
+    (re.compile(r"^>\s?"), "blockquote"),
+    (re.compile(r"^```"), "codeBlock"),
+]
+
+
+def utf16_length(text: str) -> int:
+    """Length of text in UTF-16 code units, as JavaScript counts it"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def utf16_slice(text: str, start: int) -> str:
+    """Suffix of text starting at a UTF-16 code unit offset"""
+    return text.encode("utf-16-le")[start * 2:].decode("utf-16-le", errors="ignore")
+
+
+def node_hint(text: str) -> str:
+    """Guess the ProseMirror node type a block starts with"""
+    for pattern, node in NODE_PATTERNS:
+        if pattern.match(text):
+            return node
+    return "paragraph"
+
+
+class ChunkStructurer:
+    """Splits streamed text into block-aware chunk events with offsets.
+
+    Each block starts with a block event carrying its node hint; chunk events
+    never contain a block separator. Trailing newlines are held back until the
+    next chunk shows whether they form a separator.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.block = -1
+        self.block_open = False
+        self.held = ""
+
+    def feed(self, text: str) -> List[Dict]:
+        text = self.held + text
+        stripped = text.rstrip("\n")
+        self.held = text[len(stripped):]
+        return self._emit(stripped)
+
+    def finish(self) -> List[Dict]:
+        held, self.held = self.held, ""
+        return self._emit(held) if self.block_open else []
+
+    def _emit(self, text: str) -> List[Dict]:
+        events: List[Dict] = []
+        for index, part in enumerate(BLOCK_SEPARATOR.split(text)):
+            if not part:
+                continue
+            if index % 2:
+                # Separator: the next text starts a new block
+                self.offset += utf16_length(part)
+                self.block_open = False
+                continue
+            if not self.block_open:
+                self.block += 1
+                self.block_open = True
+                events.append({"event": "block", "block": self.block, "offset": self.offset, "node": node_hint(part)})
+            events.append({"event": "chunk", "content": part, "offset": self.offset, "block": self.block})
+            self.offset += utf16_length(part)
+        return events
+
+
+class StreamAbortedError(Exception):
+    """Raised to followers of a stream that ended before its output was complete"""
+
+
+class StreamRecord:
+    """Events of one stream, kept so clients can resume after reconnecting"""
+
+    def __init__(self, stream_id: str, action_type: str):
+        self.stream_id = stream_id
+        self.action_type = action_type
+        self.events: List[Dict] = []
+        self.resets = 0  # Replacements so far; each one restarts the event list
+        self.done = False
+        self.error: Optional[str] = None
+        self.followers = 0
+        self.updated = time.monotonic()
+        self.producer: Optional[asyncio.Task] = None
+        self.detach_grace = 0.0
+        self._reaper: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    def append(self, event: Dict):
+        if event.get("event") == "replace":
+            # Everything before a replacement is superseded
+            self.events = []
+            self.resets += 1
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[str] = None):
+        """Mark the stream ended; with an error, followers fail instead of completing"""
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self.updated = time.monotonic()
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def own(self, producer: asyncio.Task, detach_grace: float):
+        """Take the task producing this stream; it is cancelled once unfollowed for detach_grace seconds"""
+        self.producer = producer
+        self.detach_grace = detach_grace
+        if not self.followers:
+            # Also covers a client that never starts reading
+            self._schedule_reaper()
+
+    def cancel(self) -> bool:
+        """Stop producing the stream; returns False if it had already ended"""
+        if self.producer is None or self.producer.done():
+            return False
+        self.producer.cancel()
+        return True
+
+    def _schedule_reaper(self):
+        if self.producer is not None and not self.producer.done():
+            self._reaper = asyncio.get_running_loop().call_later(self.detach_grace, self._reap)
+
+    def _reap(self):
+        self._reaper = None
+        if not self.followers and self.cancel():
+            logger.warning(f"Stream {self.stream_id} has no client, cancelling")
+
+    async def follow(self, offset: int, block: int = -1) -> AsyncGenerator[Dict, None]:
+        """Replay events after a UTF-16 offset and block index, then follow the live stream.
+
+        Raises StreamAbortedError at the end of a stream that did not complete.
+        """
+        resuming = offset > 0 or block >= 0
+        position = 0
+        resets = self.resets
+        self.followers += 1
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        try:
+            while True:
+                if resets != self.resets:
+                    # A replacement restarted the list; it begins with the replace event
+                    position, resets = 0, self.resets
+                while position < len(self.events):
+                    event = self.events[position]
+                    position += 1
+                    if event.get("provisional"):
+                        # Drafts are only shown live; a resuming client waits for the replacement
+                        if resuming:
+                            continue
+                    elif event.get("event") == "chunk":
+                        end = event["offset"] + utf16_length(event["content"])
+                        if end <= offset:
+                            continue
+                        if event["offset"] < offset:
+                            skipped = offset - event["offset"]
+                            event = {**event, "content": utf16_slice(event["content"], skipped), "offset": offset}
+                    elif event.get("event") == "block" and event["block"] <= block:
+                        continue
+                    yield event
+                if self.done:
+                    if self.error:
+                        raise StreamAbortedError(self.error)
+                    return
+                await self._changed.wait()
+        finally:
+            self.followers -= 1
+            if not self.followers:
+                self._schedule_reaper()
+
+
+class StreamRegistry:
+    """Bounded, time-limited registry of recent streams"""
+
+    def __init__(self, max_streams: int = 256, ttl_seconds: float = 300.0, detach_grace_seconds: float = 10.0):
+        self.max_streams = max_streams
+        self.ttl_seconds = ttl_seconds
+        self.detach_grace_seconds = detach_grace_seconds
+        self.records: "OrderedDict[str, StreamRecord]" = OrderedDict()
+        self.producers: Set[asyncio.Task] = set()
+
+    def create(self, action_type: str) -> StreamRecord:
+        self._prune()
+        record = StreamRecord(uuid.uuid4().hex, action_type)
+        self.records[record.stream_id] = record
+        while len(self.records) > self.max_streams:
+            self.records.popitem(last=False)
+        return record
+
+    def produce(self, record: StreamRecord, generator: AsyncIterator) -> asyncio.Task:
+        """Structure a generator into the record from a task that outlives any one connection.
+
+        Clients read the stream with record.follow(). A stream nobody has followed
+        for detach_grace_seconds is cancelled, and later followers get an error.
+        """
+        async def run():
+            events = structure_stream(generator, record)
+            try:
+                async for _ in events:
+                    pass
+            except Exception as e:
+                logger.error(f"Stream {record.stream_id} failed: {str(e)}")
+            finally:
+                await events.aclose()
+
+        def ended(task: asyncio.Task):
+            self.producers.discard(task)
+            if not record.done:
+                # Cancelled before it started, so structure_stream never ran
+                record.finish("Stream ended before completion")
+
+        task = asyncio.create_task(run())
+        self.producers.add(task)
+        task.add_done_callback(ended)
+        record.own(task, self.detach_grace_seconds)
+        return task
+
+    def get(self, stream_id: str) -> Optional[StreamRecord]:
+        self._prune()
+        return self.records.get(stream_id)
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [
+            key for key, record in self.records.items()
+            if record.done and now - record.updated > self.ttl_seconds
+        ]
+        for key in expired:
+            del self.records[key]
+
+
+async def structure_stream(generator: AsyncIterator, record: Optional[StreamRecord] = None) -> AsyncGenerator:
+    """Convert raw agent output into structured events, recording them for resumption"""
+    structurer = ChunkStructurer()
+    # Variant streams interleave several outputs, each with its own offsets
+    variants: Dict[int, ChunkStructurer] = {}
+    completed = False
+    try:
+        async for item in generator:
+            if isinstance(item, str):
+                events = structurer.feed(item)
+            elif item.get("event") == "chunk" and "variant" in item:
+                variant = item["variant"]
+                if variant not in variants:
+                    variants[variant] = ChunkStructurer()
+                events = [{**event, "variant": variant} for event in variants[variant].feed(item["content"])]
+            elif item.get("event") == "ranking":
+                # Flush held-back text so every variant is complete before its ranking
+                events = [
+                    {**event, "variant": variant}
+                    for variant, variant_structurer in variants.items()
+                    for event in variant_structurer.finish()
+                ] + [item]
+            elif item.get("event") == "replace":
+                # The replacement carries the whole text; later chunks continue after it
+                structurer = ChunkStructurer()
+                structurer.feed(item["content"])
+                structurer.finish()
+                events = [item]
+            else:
+                # Provisional drafts and other events carry no offsets
+                events = [item]
+
+            for event in events:
+                if record is not None:
+                    record.append(event)
+                yield event
+
+        for event in structurer.finish():
+            if record is not None:
+                record.append(event)
+            yield event
+        completed = True
+    finally:
+        if record is not None:
+            # A cancelled or failed producer must not look complete to resuming clients
+            record.finish(None if completed else "Stream ended before completion")
@@ -7,6 +7,7 @@ import asyncio
 import json
 from typing import Dict, List, TypedDict, Annotated, Optional
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_core.tools import tool
@@ -33,7 +34,7 @@ else:
 
 # Define the state structure
 class WritingState(TypedDict):
-    messages: Annotated[List[BaseMessage], "The conversation messages"]
+    messages: Annotated[List[BaseMessage], add_messages]  # Nodes return only new messages
     content: str
     context: Dict
     action: str
@@ -60,7 +61,7 @@ def analyze_text_structure(text: str) -> str:
         "structure": "multi-paragraph" if len(paragraphs) > 1 else "single-block"
     }
     
-    return f"Text Analysis: {json.dumps(analysis, indent=2)}"
+    return f"Text Analysis: {json.dumps(analysis, separators=(',', ':'))}"
 
 @tool
 def suggest_improvements(text: str, focus: str = "general") -> str:
@@ -193,6 +194,7 @@ Focus on producing clean, improved content only."""
     system_prompt = system_prompts.get(action, system_prompts["generate"])
     
     # Create the conversation messages if not already present
+    new_messages = []
     if not messages:
         if action == "generate":
             user_message = f"Please help me generate text based on this prompt: {content}"
@@ -209,28 +211,27 @@ Focus on producing clean, improved content only."""
             if context.get("aspect"):
                 user_message += f"\n\n**Specific aspect:** {context['aspect']}"
         
-        messages = [
+        new_messages = [
             SystemMessage(content=system_prompt),
             HumanMessage(content=user_message)
         ]
+        messages = new_messages
     
     # Generate response
     if llm:
         try:
             response = llm.invoke(messages)
-            messages.append(response)
         except Exception as e:
             # Fallback to mock response if API call fails
-            error_response = AIMessage(content=f"⚠️ **API Error:** {str(e)}\n\nFalling back to mock response:\n\n{_generate_mock_response(action, content, context)}")
-            messages.append(error_response)
+            response = AIMessage(content=f"⚠️ **API Error:** {str(e)}\n\nFalling back to mock response:\n\n{_generate_mock_response(action, content, context)}")
     else:
         # Enhanced mock response with proper markdown formatting
         mock_content = _generate_mock_response(action, content, context)
         response = AIMessage(content=mock_content)
-        messages.append(response)
     
+    # The add_messages reducer appends these to the state
     return {
-        "messages": messages,
+        "messages": new_messages + [response],
         "iterations": iterations + 1
     }
 
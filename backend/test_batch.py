@@ -0,0 +1,69 @@
+"""
+Tests for streaming batch input and resuming a batch job.
+Run with: cd backend && pytest test_batch.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from batch import parse_record_stream, read_lines
+from config import settings
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def chunked_sync(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 3, 1000])
+async def test_read_lines_across_chunk_boundaries(size):
+    data = "first\nsecond ünïcode\n\nlast".encode("utf-8")
+    assert [line async for line in read_lines(chunked(data, size))] == ["first", "second ünïcode", "", "last"]
+
+
+@pytest.mark.asyncio
+async def test_result_lines_add_to_skip_ids():
+    lines = [
+        json.dumps({"id": "a", "status": "ok", "result": "done"}),
+        json.dumps({"id": "b", "status": "error", "error": "timeout"}),
+        json.dumps({"id": "a", "content": "one"}),
+        json.dumps({"id": "b", "content": "two"}),
+        "not json",
+    ]
+
+    async def source():
+        for line in lines:
+            yield line
+
+    skip_ids = set()
+    records = [record async for record in parse_record_stream(source(), skip_ids)]
+    assert skip_ids == {"a"}
+    assert [record["id"] for record in records] == ["a", "b", "5"]
+    assert "error" in records[2]
+
+
+def test_batch_resumes_from_previous_output(monkeypatch):
+    monkeypatch.setattr(settings, "usage_ledger_path", "")
+    import main
+
+    previous = "\n".join(json.dumps({"id": str(i), "status": "ok"}) for i in range(500))
+    records = "\n".join(json.dumps({"id": str(i), "action": "improve", "content": "Text."}) for i in range(503))
+    body = (previous + "\n" + records).encode()
+
+    response = TestClient(main.app).post("/api/batch", content=chunked_sync(body, 4096))
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["id"] for line in lines[:-1]) == ["500", "501", "502"]
+    assert lines[-1]["summary"]["skipped"] == 500
@@ -0,0 +1,50 @@
+"""
+Tests for load shedding as seen by a cross-origin client.
+Run with: cd backend && pytest test_monitoring.py
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import settings
+
+ORIGIN = "http://localhost:5173"
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(settings, "usage_ledger_path", "")
+    import main
+    return main
+
+
+def test_shed_response_carries_cors_headers(app, monkeypatch):
+    monkeypatch.setattr(app.load_monitor, "should_shed", lambda background=False: True)
+    response = TestClient(app.app).post("/api/generate", json={"prompt": "hi"}, headers={"Origin": ORIGIN})
+    assert response.status_code == 503
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+    assert response.headers["retry-after"] == str(settings.shed_retry_after_seconds)
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
+
+
+def test_background_work_is_shed_before_interactive(app, monkeypatch):
+    monitor = app.load_monitor
+    monkeypatch.setattr(monitor, "signals", lambda: {"queue_depth": monitor.background_fraction})
+    assert monitor.should_shed(background=True)
+    assert not monitor.should_shed()
+
+
+def test_preflight_is_never_shed(app, monkeypatch):
+    monkeypatch.setattr(app.load_monitor, "should_shed", lambda background=False: True)
+    response = TestClient(app.app).options(
+        "/api/generate",
+        headers={"Origin": ORIGIN, "Access-Control-Request-Method": "POST"},
+    )
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == ORIGIN
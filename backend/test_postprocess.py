@@ -0,0 +1,95 @@
+"""
+Tests for the streaming meta-commentary filter.
+Run with: cd backend && pytest test_postprocess.py
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from postprocess import MetaFilter, filter_stream
+
+LETTER = "Dear Sam,\n\nThanks for the update on the harbor project. The plans look great."
+
+
+def stream(text: str, seed: int = 0) -> str:
+    """Filter text fed in random-sized chunks"""
+    rng = random.Random(seed)
+    meta_filter = MetaFilter()
+    out = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        out.append(meta_filter.feed(text[position:position + size]))
+        position += size
+    out.append(meta_filter.finish())
+    return "".join(out)
+
+
+@pytest.mark.parametrize("closing", [
+    "\n\nI hope to hear from you soon.",
+    " Let me know by Friday.",
+    "\n\nLet me know if you have any questions.\n\nBest,\nAlex",
+    "\n\nI hope this finds you well.",
+    "\n\nFeel free to call me any time.",
+    "\n\nNote: the office closes at 5.",
+    "\n\nI have made arrangements for the visit.",
+    "\n\nThis version of the plan is final.",
+])
+def test_letter_closings_are_kept(closing):
+    text = LETTER + closing
+    assert MetaFilter.clean(text) == text
+    assert stream(text) == text
+
+
+@pytest.mark.parametrize("postamble", [
+    "\n\nLet me know if you'd like any further changes!",
+    "\n\nI hope this helps.",
+    "\n\n---\n\nI've made the following changes:\n- Tightened wording\n- Improved flow",
+    "\n\nThis revised version keeps your original meaning.",
+    "\n\nI've tightened the wording and kept your tone.",
+])
+def test_postambles_are_stripped(postamble):
+    assert MetaFilter.clean(LETTER + postamble) == LETTER
+    assert stream(LETTER + postamble) == LETTER
+
+
+@pytest.mark.parametrize("preamble", [
+    "Sure! Here's an improved version of your text:\n\n",
+    "Here is the revised paragraph:\n\n",
+    "# Improved Version\n\n",
+])
+def test_preambles_are_stripped(preamble):
+    assert MetaFilter.clean(preamble + LETTER) == LETTER
+    assert stream(preamble + LETTER) == LETTER
+
+
+def test_postamble_followed_by_prose_is_kept():
+    text = LETTER + "\n\nI hope this helps. The second phase starts in May."
+    assert MetaFilter.clean(text) == text
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_output_does_not_depend_on_chunking(seed):
+    text = "Here is the revised paragraph:\n\n" + LETTER + "\n\nI hope to hear from you soon.\n\nI hope this helps."
+    assert stream(text, seed) == MetaFilter.clean(text)
+
+
+@pytest.mark.asyncio
+async def test_draft_is_flushed_before_its_replacement():
+    draft = "Sure! Here is a draft:\n\nThe plans look great, thanks for sending them over here."
+
+    async def speculative():
+        for position in range(0, len(draft), 7):
+            yield {"event": "chunk", "content": draft[position:position + 7], "provisional": True}
+        yield {"event": "replace", "content": "The plans look great."}
+
+    events = [event async for event in filter_stream(speculative(), "generate")]
+    assert events[-1] == {"event": "replace", "content": "The plans look great."}
+    assert "".join(event["content"] for event in events[:-1]) == stream(draft)
+    assert all(event["provisional"] for event in events[:-1])
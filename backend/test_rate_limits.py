@@ -0,0 +1,107 @@
+"""
+Tests for the adaptive rate limiter driven by provider rate-limit headers.
+Run with: cd backend && pytest test_rate_limits.py
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import settings
+from rate_limits import AdaptiveRateLimiter, parse_duration
+from scheduler import Priority
+
+
+def headers(remaining_requests: int = 100, remaining_tokens: int = 100000, reset: str = "5s") -> dict:
+    return {
+        "X-RateLimit-Limit-Requests": "100",
+        "X-RateLimit-Limit-Tokens": "100000",
+        "X-RateLimit-Remaining-Requests": str(remaining_requests),
+        "X-RateLimit-Remaining-Tokens": str(remaining_tokens),
+        "X-RateLimit-Reset-Requests": reset,
+        "X-RateLimit-Reset-Tokens": reset,
+    }
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1.0),
+    ("6m0s", 360.0),
+    ("20ms", 0.02),
+    ("1h2m3.5s", 3723.5),
+    ("2.5", 2.5),
+    ("", None),
+    ("soon", None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def test_headers_set_headroom_and_concurrency():
+    limiter = AdaptiveRateLimiter(max_concurrency=16, background_reserve=0.25)
+    limiter.update({"content-type": "application/json"})
+    assert limiter.headroom() == 1.0
+
+    limiter.update(headers(remaining_requests=50, remaining_tokens=80000))
+    assert limiter.headroom() == pytest.approx(0.5)
+    assert limiter.allowed_concurrency(Priority.INTERACTIVE) == 16
+    assert limiter.allowed_concurrency(Priority.BACKGROUND) == 8
+
+
+def test_background_is_held_below_the_reserve_but_interactive_is_not():
+    limiter = AdaptiveRateLimiter(max_concurrency=16, background_reserve=0.25)
+    limiter.update(headers(remaining_requests=0, remaining_tokens=10000))
+    assert limiter.allowed_concurrency(Priority.BACKGROUND) == 0
+    # Interactive calls keep one slot to find out when the quota is back
+    assert limiter.allowed_concurrency(Priority.INTERACTIVE) == 1
+
+
+@pytest.mark.asyncio
+async def test_held_background_call_starts_when_the_quota_resets():
+    limiter = AdaptiveRateLimiter(background_reserve=0.25)
+    limiter.update(headers(remaining_tokens=5000, reset="100ms"))
+    started = time.monotonic()
+    async with limiter.slot(priority=Priority.BACKGROUND):
+        waited = time.monotonic() - started
+    assert 0.08 < waited < 0.5
+    assert limiter.delayed[Priority.BACKGROUND] == 1
+
+
+@pytest.mark.asyncio
+async def test_calls_reserve_their_tokens():
+    limiter = AdaptiveRateLimiter()
+    limiter.update(headers(remaining_tokens=50000, reset="100ms"))
+    await limiter.acquire(30000, Priority.INTERACTIVE)
+    assert limiter.remaining_tokens == 20000
+    # The next call does not fit in what is left until the reset
+    second = asyncio.create_task(limiter.acquire(30000, Priority.INTERACTIVE))
+    await asyncio.sleep(0.05)
+    assert not second.done()
+    await asyncio.wait_for(second, 0.5)
+
+
+@pytest.mark.asyncio
+async def test_release_wakes_a_waiting_call():
+    limiter = AdaptiveRateLimiter(max_concurrency=1)
+    priority = await limiter.acquire(priority=Priority.INTERACTIVE)
+    waiting = asyncio.create_task(limiter.acquire(priority=Priority.INTERACTIVE))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    limiter.release(priority)
+    # Woken by the release rather than the next poll
+    await asyncio.wait_for(waiting, 0.1)
+
+
+def test_each_model_has_its_own_limiter(monkeypatch):
+    monkeypatch.setattr(settings, "usage_ledger_path", "")
+    from agent import WritingAgent
+    agent = WritingAgent()
+    agent.rate_limiter_for("main-model").update(headers(remaining_requests=0))
+    assert agent.rate_limiter_for("main-model") is agent.rate_limiter_for("main-model")
+    assert agent.rate_limiter_for("draft-model").allowed_concurrency(Priority.BACKGROUND) > 0
+    assert agent.rate_limiter_for("main-model").allowed_concurrency(Priority.BACKGROUND) == 0
@@ -0,0 +1,164 @@
+"""
+Tests for the circuit breaker, retries, hedging and stream timeouts.
+Run with: cd backend && pytest test_resilience.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+
+def caller(**options) -> ResilientCaller:
+    options.setdefault("timeout", 0.2)
+    options.setdefault("max_retries", 0)
+    options.setdefault("retry_max_wait", 0.0)
+    options.setdefault("breaker", CircuitBreaker(2, 0.05))
+    return ResilientCaller(**options)
+
+
+async def slow(seconds: float, result: str = "ok") -> str:
+    await asyncio.sleep(seconds)
+    return result
+
+
+async def chunks(*delays: float):
+    for index, delay in enumerate(delays):
+        await asyncio.sleep(delay)
+        yield index
+
+
+def test_breaker_opens_and_lets_one_probe_through():
+    breaker = CircuitBreaker(2, 0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_breaker_half_open_probe_closes_on_success():
+    resilient = caller()
+    resilient.breaker.record_failure()
+    resilient.breaker.record_failure()
+    await asyncio.sleep(0.06)
+    assert await resilient.invoke(lambda: slow(0)) == "ok"
+    assert resilient.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_timeouts_open_the_breaker():
+    resilient = caller(timeout=0.01)
+    for _ in range(2):
+        with pytest.raises(asyncio.TimeoutError):
+            await resilient.invoke(lambda: slow(1))
+    with pytest.raises(CircuitOpenError):
+        await resilient.invoke(lambda: slow(0))
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_open_the_breaker():
+    async def bad_request():
+        raise ValueError("context length exceeded")
+
+    resilient = caller()
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await resilient.invoke(bad_request)
+    assert resilient.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_is_released():
+    resilient = caller()
+    resilient.breaker.record_failure()
+    resilient.breaker.record_failure()
+    await asyncio.sleep(0.06)
+    probe = asyncio.create_task(resilient.invoke(lambda: slow(1)))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert await resilient.invoke(lambda: slow(0)) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise asyncio.TimeoutError()
+        return "ok"
+
+    assert await caller(max_retries=2).invoke(flaky) == "ok"
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_when_primary_is_slow():
+    delays = iter([1.0, 0.01])
+    resilient = caller(timeout=2.0, hedge=True, hedge_min_delay=0.02)
+    assert await resilient.invoke(lambda: slow(next(delays))) == "ok"
+    assert (resilient.hedges_fired, resilient.hedges_won) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_cancels_the_hedged_requests():
+    finished = []
+
+    async def call():
+        await asyncio.sleep(0.1)
+        finished.append(1)
+
+    resilient = caller(timeout=1.0, hedge=True, hedge_min_delay=0.5)
+    task = asyncio.create_task(resilient.invoke(call))
+    await asyncio.sleep(0.02)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0.15)
+    assert finished == []
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_every_chunk():
+    resilient = caller()
+    assert [chunk async for chunk in resilient.stream(lambda: chunks(0, 0, 0))] == [0, 1, 2]
+    assert resilient.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_stream_stalled_after_first_chunk_times_out():
+    resilient = caller(chunk_timeout=0.05)
+    received = []
+    with pytest.raises(asyncio.TimeoutError):
+        async for chunk in resilient.stream(lambda: chunks(0, 0, 10)):
+            received.append(chunk)
+    assert received == [0, 1]
+    assert resilient.breaker.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_closing_a_stream_closes_the_provider_stream():
+    closed = []
+
+    async def provider():
+        try:
+            for index in range(10):
+                yield index
+        finally:
+            closed.append(1)
+
+    stream = caller().stream(provider)
+    assert await stream.__anext__() == 0
+    await stream.aclose()
+    assert closed == [1]
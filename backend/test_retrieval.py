@@ -0,0 +1,98 @@
+"""
+Tests for the incremental BM25 index.
+Run with: cd backend && pytest test_retrieval.py
+"""
+
+import math
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import retrieval
+from retrieval import BM25Index, tokenize
+
+WORDS = [f"w{i}" for i in range(300)]
+
+
+def paragraph(rng: random.Random, words: int) -> str:
+    # Skewed so a few terms are common and most are rare
+    return " ".join(WORDS[min(int(rng.paretovariate(0.8)) - 1, len(WORDS) - 1)] for _ in range(words))
+
+
+def reference_scores(documents, query: str, k1: float = 1.5, b: float = 0.75):
+    """Exhaustive BM25 over the live documents"""
+    counts = {key: Counter(tokenize(text)) for key, text in documents.items()}
+    avg_length = sum(sum(c.values()) for c in counts.values()) / len(counts) or 1.0
+    scores = {}
+    for term in set(tokenize(query)):
+        holders = [key for key, c in counts.items() if term in c]
+        if not holders:
+            continue
+        idf = math.log(1 + (len(counts) - len(holders) + 0.5) / (len(holders) + 0.5))
+        for key in holders:
+            tf = counts[key][term]
+            length_norm = 1 - b + b * sum(counts[key].values()) / avg_length
+            scores[key] = scores.get(key, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * length_norm)
+    return scores
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(retrieval, "np", None)
+    elif retrieval.np is None:
+        pytest.skip("numpy not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_search_matches_exhaustive_bm25(backend, seed):
+    rng = random.Random(seed)
+    index = BM25Index()
+    documents = {}
+    for key in range(400):
+        documents[key] = paragraph(rng, rng.randint(5, 40))
+        index.add(key, documents[key])
+    # Replace and remove enough documents to trigger compaction
+    for key in rng.sample(range(400), 150):
+        documents[key] = paragraph(rng, rng.randint(5, 40))
+        index.add(key, documents[key])
+    for key in rng.sample(range(400), 120):
+        documents.pop(key, None)
+        index.remove(key)
+    assert len(index) == len(documents)
+
+    for _ in range(20):
+        query = paragraph(rng, rng.randint(1, 25))
+        expected = reference_scores(documents, query)
+        exclude = set(rng.sample(sorted(documents), 10))
+        results = index.search(query, 5, exclude)
+        best = sorted((score for key, score in expected.items() if key not in exclude), reverse=True)[:5]
+        assert [score for _, score in results] == pytest.approx(best)
+        for key, score in results:
+            assert key not in exclude
+            assert score == pytest.approx(expected[key])
+
+
+def test_long_queries_keep_their_rarest_terms(backend):
+    index = BM25Index(max_query_terms=1)
+    index.add("common", "harbor boats harbor")
+    index.add("rare", "harbor lighthouse")
+    index.add("other", "harbor boats")
+    assert [key for key, _ in index.search("harbor boats lighthouse", 3)] == ["rare"]
+
+
+def test_empty_index_and_unknown_terms(backend):
+    index = BM25Index()
+    assert index.search("harbor", 3) == []
+    index.add(1, "harbor boats")
+    assert index.search("lighthouse", 3) == []
+    index.remove(1)
+    index.remove(1)
+    assert index.search("harbor", 3) == []
@@ -0,0 +1,168 @@
+"""
+Tests for priority scheduling of LLM slots and how the agent admits calls.
+Run with: cd backend && pytest test_scheduler.py
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import settings
+from resilience import CircuitBreaker, ResilientCaller
+from scheduler import Priority, PriorityScheduler, current_priority
+
+
+class FakeLLM:
+    """Chat model stand-in that answers after a fixed delay"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return AIMessage(content="Done.", response_metadata={})
+
+
+class FakeDraftLLM:
+    """Draft model stand-in that streams words slowly, noting when its stream is closed"""
+
+    def __init__(self, scheduler: PriorityScheduler):
+        self.scheduler = scheduler
+        self.busy_slots = []
+        self.closed = False
+
+    async def astream(self, messages):
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                self.busy_slots.append(self.scheduler.slots - self.scheduler.available)
+                yield AIMessageChunk(content="word ", response_metadata={})
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setattr(settings, "usage_ledger_path", "")
+    from agent import WritingAgent
+    writing_agent = WritingAgent()
+    writing_agent.scheduler = PriorityScheduler(slots=2)
+    return writing_agent
+
+
+def node_state(content: str = "A short paragraph to improve.") -> dict:
+    return {"messages": [], "content": content, "context": {}, "action": "improve", "iterations": 0, "max_iterations": 3}
+
+
+async def run_at(priority: Priority, coroutine):
+    current_priority.set(priority)
+    return await coroutine
+
+
+@pytest.mark.asyncio
+async def test_strict_mode_serves_interactive_first():
+    scheduler = PriorityScheduler(slots=1, mode="strict")
+    order = []
+
+    async def call(priority: Priority, name: str):
+        async with scheduler.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async with scheduler.slot(Priority.BACKGROUND):
+        tasks = [asyncio.create_task(call(Priority.BACKGROUND, "background"))]
+        tasks += [asyncio.create_task(call(Priority.INTERACTIVE, f"interactive-{i}")) for i in range(2)]
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    assert order == ["interactive-0", "interactive-1", "background"]
+
+
+@pytest.mark.asyncio
+async def test_weighted_mode_keeps_a_background_share():
+    scheduler = PriorityScheduler(slots=1, weights={Priority.INTERACTIVE: 2, Priority.BACKGROUND: 1})
+    order = []
+
+    async def call(priority: Priority):
+        async with scheduler.slot(priority):
+            order.append(priority)
+            await asyncio.sleep(0)
+
+    async with scheduler.slot(Priority.INTERACTIVE):
+        tasks = [asyncio.create_task(call(Priority.INTERACTIVE)) for _ in range(4)]
+        tasks += [asyncio.create_task(call(Priority.BACKGROUND)) for _ in range(2)]
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    assert Priority.BACKGROUND in order[:3]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    scheduler = PriorityScheduler(slots=1)
+    async with scheduler.slot(Priority.INTERACTIVE):
+        waiter = asyncio.create_task(scheduler.acquire(Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+    assert scheduler.available == 1
+    assert not scheduler.waiting[Priority.BACKGROUND]
+
+
+@pytest.mark.asyncio
+async def test_held_background_calls_do_not_block_interactive(agent):
+    agent.llm = FakeLLM(0.01)
+    # Low token headroom: background work is held until the quota resets in 5 s
+    agent.rate_limiter.update({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-requests": "500",
+        "x-ratelimit-limit-tokens": "100000",
+        "x-ratelimit-remaining-tokens": "5000",
+        "x-ratelimit-reset-tokens": "5s",
+    })
+    held = [asyncio.create_task(run_at(Priority.BACKGROUND, agent.agent_node(node_state()))) for _ in range(2)]
+    await asyncio.sleep(0.05)
+
+    started = time.monotonic()
+    result = await run_at(Priority.INTERACTIVE, agent.agent_node(node_state()))
+    assert time.monotonic() - started < 1.0
+    assert result["messages"][-1].content == "Done."
+    assert agent.scheduler.available == 2
+
+    for task in held:
+        task.cancel()
+    await asyncio.gather(*held, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_queueing_for_a_slot_does_not_count_against_the_timeout(agent):
+    agent.llm = FakeLLM(0.1)
+    agent.scheduler = PriorityScheduler(slots=1)
+    agent.resilience = ResilientCaller(timeout=0.15, max_retries=0, retry_max_wait=0.0, breaker=CircuitBreaker(3, 30.0))
+
+    results = await asyncio.gather(*(agent.agent_node(node_state()) for _ in range(6)))
+    assert [result["messages"][-1].content for result in results] == ["Done."] * 6
+    assert agent.llm.calls == 6
+    assert agent.resilience.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_speculative_draft_holds_a_slot_and_is_closed(agent):
+    agent.llm = FakeLLM(0.1)
+    agent.draft_llm = FakeDraftLLM(agent.scheduler)
+    events = [event async for event in agent.generate_text_speculative("Write a note")]
+    assert events[-1] == {"event": "replace", "content": "Done."}
+    # The draft counted against the scheduler while both models ran
+    assert max(agent.draft_llm.busy_slots) == 2
+    # The draft stopped once the main model finished, and its stream was closed
+    assert agent.draft_llm.closed
+    assert len(events) < 50
+    assert agent.scheduler.available == 2
@@ -0,0 +1,152 @@
+"""
+Tests for resumable streams and cancelling streams no client follows.
+Run with: cd backend && pytest test_stream_structure.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from stream_structure import StreamAbortedError, StreamRegistry
+
+
+class Source:
+    """Agent output released one piece at a time, recording whether it was closed"""
+
+    def __init__(self):
+        self.pieces: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    async def generate(self):
+        try:
+            while True:
+                piece = await self.pieces.get()
+                if piece is None:
+                    return
+                yield piece
+        finally:
+            self.closed = True
+
+
+async def take(follower, count: int):
+    return [await follower.__anext__() for _ in range(count)]
+
+
+async def collect(follower):
+    return [event async for event in follower]
+
+
+def contents(events):
+    return "".join(event.get("content", "") for event in events if event["event"] == "chunk")
+
+
+@pytest.mark.asyncio
+async def test_resume_after_disconnect_continues_at_offset():
+    registry = StreamRegistry(detach_grace_seconds=1.0)
+    record = registry.create("generate")
+    source = Source()
+    registry.produce(record, source.generate())
+    follower = record.follow(0)
+    source.pieces.put_nowait("Hello wor")
+    block, chunk = await take(follower, 2)
+    assert (block["event"], chunk["content"]) == ("block", "Hello wor")
+    await follower.aclose()
+
+    source.pieces.put_nowait("ld")
+    source.pieces.put_nowait(None)
+    events = [event async for event in record.follow(5, 0)]
+    assert contents(events) == " world"
+    assert record.done and record.error is None
+
+
+@pytest.mark.asyncio
+async def test_unfollowed_stream_is_cancelled_after_the_grace_period():
+    registry = StreamRegistry(detach_grace_seconds=0.05)
+    record = registry.create("generate")
+    source = Source()
+    producer = registry.produce(record, source.generate())
+    follower = record.follow(0)
+    source.pieces.put_nowait("Hello")
+    await take(follower, 2)
+    await follower.aclose()
+
+    await asyncio.sleep(0.1)
+    assert producer.done()
+    assert source.closed
+    assert record.error
+    with pytest.raises(StreamAbortedError):
+        [event async for event in record.follow(5)]
+
+
+@pytest.mark.asyncio
+async def test_stream_never_followed_is_cancelled():
+    registry = StreamRegistry(detach_grace_seconds=0.05)
+    record = registry.create("generate")
+    source = Source()
+    producer = registry.produce(record, source.generate())
+    await asyncio.sleep(0.1)
+    assert producer.done() and source.closed
+
+
+@pytest.mark.asyncio
+async def test_reconnecting_within_the_grace_period_keeps_the_stream():
+    registry = StreamRegistry(detach_grace_seconds=0.1)
+    record = registry.create("generate")
+    source = Source()
+    producer = registry.produce(record, source.generate())
+    follower = record.follow(0)
+    source.pieces.put_nowait("Hello")
+    await take(follower, 2)
+    await follower.aclose()
+
+    await asyncio.sleep(0.05)
+    resumed = asyncio.create_task(collect(record.follow(5, 0)))
+    await asyncio.sleep(0.1)
+    assert not producer.done()
+    source.pieces.put_nowait(" there")
+    source.pieces.put_nowait(None)
+    assert contents(await resumed) == " there"
+    assert record.error is None
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_the_producer():
+    registry = StreamRegistry(detach_grace_seconds=10.0)
+    record = registry.create("generate")
+    source = Source()
+    producer = registry.produce(record, source.generate())
+    source.pieces.put_nowait("Hello")
+    await asyncio.sleep(0.01)
+    assert record.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await producer
+    assert source.closed and record.error
+    assert not record.cancel()
+
+
+@pytest.mark.asyncio
+async def test_stream_cancelled_before_it_starts_still_ends():
+    registry = StreamRegistry(detach_grace_seconds=10.0)
+    record = registry.create("generate")
+    registry.produce(record, Source().generate())
+    assert record.cancel()
+    with pytest.raises(StreamAbortedError):
+        await asyncio.wait_for(collect(record.follow(0)), 1.0)
+
+
+@pytest.mark.asyncio
+async def test_resuming_client_skips_provisional_drafts():
+    registry = StreamRegistry(detach_grace_seconds=1.0)
+    record = registry.create("generate")
+    source = Source()
+    registry.produce(record, source.generate())
+    source.pieces.put_nowait({"event": "chunk", "content": "Draft", "provisional": True})
+    source.pieces.put_nowait({"event": "replace", "content": "Final text"})
+    source.pieces.put_nowait(None)
+    events = [event async for event in record.follow(3)]
+    assert [event["event"] for event in events] == ["replace"]
@@ -0,0 +1,96 @@
+"""
+Local text analysis.
+Structure metrics and keyword themes shared by the agent's tools and the
+variant scorer, plus a cheap score for ranking alternative responses
+without another model call.
+"""
+
+import math
+import re
+from typing import Dict, List, Optional
+
+COMMON_WORDS = {
+    'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'a', 'an', 'is', 'are',
+    'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those',
+}
+
+SENTENCE_END = re.compile(r"[.!?]+(?:\s+|$)")
+
+# Openers and markup the system prompts ask the model to leave out
+META_PREFIX = re.compile(r"^\s*(here'?s|here is|here are|sure|certainly|below is|i've|i have)\b", re.IGNORECASE)
+MARKDOWN_HEADER = re.compile(r"^#{1,6}\s", re.MULTILINE)
+
+# Editor content may arrive as HTML
+HTML_TAG = re.compile(r"<[^>]+>")
+
+# Average sentence length (words) readers find easiest to follow
+TARGET_SENTENCE_WORDS = 18
+
+
+def text_structure(text: str) -> Dict:
+    """Word, character, line and paragraph counts for a text"""
+    lines = text.split('\n')
+    paragraphs = [p for p in text.split('\n\n') if p.strip()]
+    return {
+        "word_count": len(text.split()),
+        "character_count": len(text),
+        "line_count": len(lines),
+        "paragraph_count": len(paragraphs),
+        "structure": "multi-paragraph" if len(paragraphs) > 1 else "single-block"
+    }
+
+
+def key_themes(text: str, limit: int = 5) -> List[str]:
+    """Most frequent content words in a text"""
+    word_freq: Dict[str, int] = {}
+    for word in text.lower().split():
+        clean_word = ''.join(c for c in word if c.isalnum())
+        if len(clean_word) > 3 and clean_word not in COMMON_WORDS:
+            word_freq[clean_word] = word_freq.get(clean_word, 0) + 1
+    return [word for word, _ in sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:limit]]
+
+
+def score_response(text: str, source: str, action: str, error: bool = False) -> Dict:
+    """Score a response in [0, 1] against its source text or prompt.
+
+    Combines theme coverage, length fit (improve keeps roughly the original
+    length), sentence length and a penalty for meta-commentary or headers.
+    """
+    if error or not text.strip():
+        return {"score": 0.0, "error": True}
+
+    structure = text_structure(text)
+    words = structure["word_count"]
+    sentences = max(1, len(SENTENCE_END.findall(text)))
+
+    source = HTML_TAG.sub(" ", source)
+    source_themes = key_themes(source, 10)
+    response_words = {''.join(c for c in word if c.isalnum()) for word in text.lower().split()}
+    coverage = (
+        sum(1 for theme in source_themes if theme in response_words) / len(source_themes)
+        if source_themes else 1.0
+    )
+
+    length_fit: Optional[float] = None
+    if action == "improve":
+        source_words = max(1, len(source.split()))
+        length_fit = math.exp(-abs(math.log(max(1, words) / source_words)))
+
+    sentence_words = words / sentences
+    readability = math.exp(-abs(sentence_words - TARGET_SENTENCE_WORDS) / TARGET_SENTENCE_WORDS)
+
+    clean = 0.0 if META_PREFIX.match(text) or MARKDOWN_HEADER.search(text) else 1.0
+
+    parts = [coverage, readability, clean] + ([length_fit] if length_fit is not None else [])
+    weights = [0.4, 0.2, 0.2] + ([0.2] if length_fit is not None else [])
+    score = sum(part * weight for part, weight in zip(parts, weights)) / sum(weights)
+
+    return {
+        "score": round(score, 4),
+        "theme_coverage": round(coverage, 4),
+        "length_fit": None if length_fit is None else round(length_fit, 4),
+        "avg_sentence_words": round(sentence_words, 1),
+        "clean": bool(clean),
+        **structure,
+    }
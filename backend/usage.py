@@ -0,0 +1,257 @@
+"""
+Per-tenant usage accounting and token budgets.
+LLM token usage and latency are recorded to an append-only SQLite (WAL)
+ledger by a background writer thread, while in-memory totals for the
+current budget window let requests be admitted or rejected without I/O.
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+# Tenant of the request being processed; set per request or stream
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    ts REAL NOT NULL,
+    tenant TEXT NOT NULL,
+    action TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    latency_ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_tenant_ts ON usage (tenant, ts);
+"""
+
+_STOP = object()
+
+
+class BudgetExceededError(Exception):
+    """Raised when a tenant is over its token budget or concurrency limit"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def token_counts(usage_metadata: Optional[Dict]) -> Tuple[int, int, int]:
+    """(input, output, cached input) tokens from a LangChain usage_metadata dict"""
+    if not usage_metadata:
+        return 0, 0, 0
+    details = usage_metadata.get("input_token_details") or {}
+    return (
+        usage_metadata.get("input_tokens", 0),
+        usage_metadata.get("output_tokens", 0),
+        details.get("cache_read", 0) or 0,
+    )
+
+
+class UsageLedger:
+    """Append-only usage ledger with batched writes on a background thread"""
+
+    def __init__(self, path: str, batch_size: int = 256, flush_seconds: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.pending: "queue.Queue" = queue.Queue()
+        self.written = 0
+
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self._thread = threading.Thread(target=self._write_loop, name="usage-ledger", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def append(self, row: Tuple):
+        """Queue a row for writing; never blocks the caller"""
+        self.pending.put(row)
+
+    def _write_loop(self):
+        connection = self._connect()
+        stopping = False
+        while not stopping:
+            batch: List[Tuple] = []
+            try:
+                item = self.pending.get(timeout=self.flush_seconds)
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self.pending.get_nowait()
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany("INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    logger.error(f"Usage ledger write failed, dropped {len(batch)} rows: {str(e)}")
+        connection.close()
+
+    def totals_since(self, since: float) -> Dict[str, int]:
+        """Total tokens per tenant recorded since a timestamp"""
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT tenant, SUM(input_tokens + output_tokens) FROM usage WHERE ts >= ? GROUP BY tenant",
+                (since,),
+            ).fetchall()
+        finally:
+            connection.close()
+        return {tenant: int(total or 0) for tenant, total in rows}
+
+    def close(self):
+        """Flush pending rows and stop the writer thread"""
+        self.pending.put(_STOP)
+        self._thread.join(timeout=10)
+
+
+class TenantSlot:
+    """A concurrency slot taken by admit; releasing it more than once has no effect"""
+
+    def __init__(self, tracker: "UsageTracker", tenant: str):
+        self.tracker = tracker
+        self.tenant = tenant
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.tracker.release(self.tenant)
+
+
+class UsageTracker:
+    """Token budgets and concurrency limits per tenant, backed by an optional ledger"""
+
+    def __init__(
+        self,
+        ledger: Optional[UsageLedger] = None,
+        default_budget: int = 0,
+        budgets: Optional[Dict[str, int]] = None,
+        window_seconds: int = 86400,
+        max_concurrent: int = 0,
+    ):
+        self.ledger = ledger
+        self.default_budget = default_budget
+        self.budgets = budgets or {}
+        self.window_seconds = window_seconds
+        self.max_concurrent = max_concurrent
+        self.window_start = self._window_start()
+        self.used: Dict[str, int] = {}
+        self.cached: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self.active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        if ledger is not None:
+            self.used = ledger.totals_since(self.window_start)
+
+    def _window_start(self) -> float:
+        now = time.time()
+        return now - now % self.window_seconds
+
+    def _roll_window(self):
+        start = self._window_start()
+        if start != self.window_start:
+            self.window_start = start
+            self.used.clear()
+            self.cached.clear()
+            self.requests.clear()
+
+    def budget_for(self, tenant: str) -> int:
+        return self.budgets.get(tenant, self.default_budget)
+
+    def admit(self, tenant: str) -> TenantSlot:
+        """Reserve a concurrency slot, or raise if the tenant is over budget or at its limit"""
+        with self._lock:
+            self._roll_window()
+            budget = self.budget_for(tenant)
+            if budget and self.used.get(tenant, 0) >= budget:
+                retry_after = int(self.window_start + self.window_seconds - time.time()) + 1
+                raise BudgetExceededError(f"Token budget exhausted for tenant {tenant}", retry_after)
+            if self.max_concurrent and self.active.get(tenant, 0) >= self.max_concurrent:
+                raise BudgetExceededError(f"Too many concurrent requests for tenant {tenant}", 1)
+            self.active[tenant] = self.active.get(tenant, 0) + 1
+        return TenantSlot(self, tenant)
+
+    def release(self, tenant: str):
+        """Free a concurrency slot taken by admit"""
+        with self._lock:
+            remaining = self.active.get(tenant, 0) - 1
+            if remaining > 0:
+                self.active[tenant] = remaining
+            else:
+                self.active.pop(tenant, None)
+
+    async def track_stream(self, generator: AsyncIterator, slot: TenantSlot) -> AsyncGenerator:
+        """Run a stream as the slot's tenant, releasing the slot when the stream ends.
+
+        A stream that is never iterated does not release its slot; the response
+        carrying it must release the slot as well (see SlotStreamingResponse in main).
+        """
+        current_tenant.set(slot.tenant)
+        try:
+            async for item in generator:
+                yield item
+        finally:
+            slot.release()
+
+    def record(self, action: str, model: str, usage_metadata: Optional[Dict], latency: float):
+        """Account for one LLM call made by the current tenant"""
+        tenant = current_tenant.get()
+        input_tokens, output_tokens, cached_tokens = token_counts(usage_metadata)
+        with self._lock:
+            self._roll_window()
+            self.used[tenant] = self.used.get(tenant, 0) + input_tokens + output_tokens
+            self.cached[tenant] = self.cached.get(tenant, 0) + cached_tokens
+            self.requests[tenant] = self.requests.get(tenant, 0) + 1
+        if self.ledger is not None:
+            self.ledger.append((
+                time.time(), tenant, action, model,
+                input_tokens, output_tokens, cached_tokens, round(latency * 1000, 2),
+            ))
+
+    def report(self, tenant: str) -> Dict:
+        """Usage and remaining budget for a tenant in the current window"""
+        with self._lock:
+            self._roll_window()
+            budget = self.budget_for(tenant)
+            used = self.used.get(tenant, 0)
+            return {
+                "tenant": tenant,
+                "window_start": self.window_start,
+                "window_seconds": self.window_seconds,
+                "tokens_used": used,
+                "cached_tokens": self.cached.get(tenant, 0),
+                "llm_calls": self.requests.get(tenant, 0),
+                "budget": budget or None,
+                "remaining": max(0, budget - used) if budget else None,
+                "active_requests": self.active.get(tenant, 0),
+            }
+
+    def close(self):
+        if self.ledger is not None:
+            self.ledger.close()
@@ -0,0 +1,141 @@
+"""
+WebSocket transport for the writing agent.
+Multiplexes many concurrent actions over one socket, tagged by request id,
+with cancel messages and bounded send queues for flow control.
+"""
+
+import asyncio
+import logging
+from typing import Dict
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from config import settings
+from sse import ACTION_EVENT_TYPES, dumps
+from stream_structure import structure_stream
+from postprocess import filter_stream
+from scheduler import Priority
+from usage import BudgetExceededError, current_tenant
+
+logger = logging.getLogger(__name__)
+
+
+class WritingSession:
+    """One WebSocket connection carrying concurrent writing requests.
+
+    Client messages:
+        {"type": "request", "id": "...", "action": "generate|edit|improve", "content": "...", "context": {...},
+         "priority": "interactive|background"}
+        {"type": "cancel", "id": "..."}
+        {"type": "ping"}
+
+    Server messages carry the request id plus the same event types as the SSE
+    endpoints, e.g. {"id": "...", "type": "generation_chunk", "content": "...", "offset": 0, "block": 0}.
+    """
+
+    def __init__(self, websocket: WebSocket, agent):
+        self.websocket = websocket
+        self.agent = agent
+        self.tenant = websocket.headers.get("x-tenant-id") or current_tenant.get()
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # Bounded queue: producers wait when the client reads slowly
+        self.outgoing: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+
+    async def run(self):
+        """Serve the connection until the client disconnects"""
+        await self.websocket.accept()
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            while True:
+                message = await self.websocket.receive_json()
+                await self._handle(message)
+        except WebSocketDisconnect:
+            logger.info("WebSocket client disconnected")
+        except Exception as e:
+            logger.error(f"WebSocket session error: {str(e)}")
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+            sender.cancel()
+
+    async def _send_loop(self):
+        while True:
+            message = await self.outgoing.get()
+            await self.websocket.send_text(message)
+
+    async def send(self, request_id, event_type: str, **fields):
+        """Queue a message for the client, waiting if the send queue is full"""
+        payload = {"id": request_id, "type": event_type, **fields}
+        await self.outgoing.put(dumps(payload).decode("utf-8"))
+
+    async def _handle(self, message: Dict):
+        message_type = message.get("type", "request")
+        request_id = message.get("id")
+
+        if message_type == "ping":
+            await self.send(request_id, "pong")
+            return
+
+        if message_type == "cancel":
+            task = self.tasks.get(request_id)
+            if task:
+                task.cancel()
+            return
+
+        if message_type != "request":
+            await self.send(request_id, "error", message=f"Unknown message type: {message_type}")
+            return
+
+        action = message.get("action")
+        try:
+            priority = Priority(message.get("priority") or Priority.INTERACTIVE)
+        except ValueError:
+            await self.send(request_id, "error", message=f"Unknown priority: {message.get('priority')}")
+            return
+        if not request_id:
+            await self.send(None, "error", message="Request id is required")
+        elif request_id in self.tasks:
+            await self.send(request_id, "error", message="Request id already in use")
+        elif action not in ACTION_EVENT_TYPES:
+            await self.send(request_id, "error", message=f"Unknown action: {action}")
+        elif len(self.tasks) >= settings.ws_max_concurrent_requests:
+            await self.send(request_id, "error", message="Too many concurrent requests on this connection")
+        else:
+            try:
+                self.agent.usage.admit(self.tenant)
+            except BudgetExceededError as e:
+                await self.send(request_id, "error", message=str(e), retry_after=e.retry_after)
+                return
+            task = asyncio.create_task(
+                self._run_request(request_id, action, message.get("content", ""), message.get("context") or {}, priority)
+            )
+            self.tasks[request_id] = task
+            task.add_done_callback(lambda _: self._finish(request_id))
+
+    def _finish(self, request_id: str):
+        self.tasks.pop(request_id, None)
+        self.agent.usage.release(self.tenant)
+
+    async def _run_request(self, request_id: str, action: str, content: str, context: Dict, priority: Priority):
+        """Stream one action's events to the client"""
+        event_type = ACTION_EVENT_TYPES[action]
+        current_tenant.set(self.tenant)
+        try:
+            await self.send(request_id, f"{event_type}_start", message=f"Starting {event_type}...")
+            generator = filter_stream(self.agent.stream_action(action, content, context), action)
+            generator = self.agent.scheduler.track_stream(generator, priority)
+            async for event in structure_stream(generator):
+                event = dict(event)
+                await self.send(request_id, f"{event_type}_{event.pop('event')}", **event)
+            await self.send(request_id, f"{event_type}_complete", message=f"{event_type.title()} completed")
+        except asyncio.CancelledError:
+            # Notify without blocking; the client may already be gone
+            payload = {"id": request_id, "type": f"{event_type}_cancelled"}
+            try:
+                self.outgoing.put_nowait(dumps(payload).decode("utf-8"))
+            except asyncio.QueueFull:
+                pass
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket {action} error: {str(e)}")
+            await self.send(request_id, "error", message=f"{event_type.title()} failed: {str(e)}")
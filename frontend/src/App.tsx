@@ -11,7 +11,7 @@ function App() {
     content: "",
   });
 
-  const { isConnected, sendMessage, isGenerating, currentResponse, error } =
+  const { isConnected, sendMessage, isGenerating, subscribe, error } =
     useSSE();
 
   return (
@@ -52,7 +52,7 @@ function App() {
                 }
                 onAIRequest={sendMessage}
                 isGenerating={isGenerating}
-                aiResponse={currentResponse}
+                subscribeToStream={subscribe}
               />
             </div>
           </div>
@@ -1,25 +1,33 @@
 import React, { useState } from "react";
 import { Sparkles, Wand2, RefreshCw } from "lucide-react";
+import { Variant } from "../types";
 
 interface AIPanelProps {
   editor: any;
   onAIRequest: (action: string, content: string, context?: any) => void;
   isGenerating: boolean;
+  variants?: Variant[];
 }
 
-export function AIPanel({ editor, onAIRequest, isGenerating }: AIPanelProps) {
+export function AIPanel({ editor, onAIRequest, isGenerating, variants = [] }: AIPanelProps) {
   const [prompt, setPrompt] = useState("");
+  const [variantCount, setVariantCount] = useState(1);
 
   const handleGenerate = () => {
     if (!prompt.trim()) return;
-    onAIRequest("generate", prompt);
+    onAIRequest("generate", prompt, { variants: variantCount });
     setPrompt("");
   };
 
   const handleImprove = () => {
     if (!editor) return;
     const content = editor.getHTML();
-    onAIRequest("improve", content);
+    onAIRequest("improve", content, { variants: variantCount });
+  };
+
+  const handleUseVariant = (variant: Variant) => {
+    if (!editor) return;
+    editor.chain().focus().insertContent(variant.text).run();
   };
 
   const handleContinue = () => {
@@ -79,6 +87,45 @@ export function AIPanel({ editor, onAIRequest, isGenerating }: AIPanelProps) {
           </button>
         </div>
 
+        <div className="flex items-center justify-between text-sm text-muted-foreground">
+          <label htmlFor="variant-count">Alternatives</label>
+          <select
+            id="variant-count"
+            value={variantCount}
+            onChange={(e) => setVariantCount(Number(e.target.value))}
+            disabled={isGenerating}
+            className="border border-border rounded px-2 py-1 bg-card"
+          >
+            {[1, 2, 3, 4].map((count) => (
+              <option key={count} value={count}>
+                {count}
+              </option>
+            ))}
+          </select>
+        </div>
+
+        {variants.length > 1 && (
+          <div className="space-y-2">
+            <label className="text-sm font-medium text-muted-foreground">
+              Other alternatives
+            </label>
+            {/* The best-ranked variant is already in the document */}
+            {variants.slice(1).map((variant) => (
+              <button
+                key={variant.variant}
+                onClick={() => handleUseVariant(variant)}
+                disabled={isGenerating || variant.error}
+                className="w-full text-left p-2 border border-border rounded hover:bg-accent disabled:opacity-50 text-sm"
+              >
+                <span className="block text-xs text-muted-foreground">
+                  Score {Math.round(variant.score * 100)}
+                </span>
+                <span className="line-clamp-3">{variant.text}</span>
+              </button>
+            ))}
+          </div>
+        )}
+
         {isGenerating && (
           <div className="text-center text-sm text-muted-foreground">
             AI is working on your request...
@@ -12,14 +12,19 @@ import { AIChanges } from "../extensions/AIChanges";
 import { AIGenerations } from "../extensions/AIGenerations";
 import { EditorToolbar } from "./EditorToolbar";
 import { AIPanel } from "./AIPanel";
-import { AIChange } from "../types";
+import { useStreamingSink } from "../hooks/useStreamingSink";
+import { useIdlePrefetch } from "../hooks/useIdlePrefetch";
+import { AIChange, StreamListener, Variant } from "../types";
+
+// Delay before serializing the document after edits
+const CONTENT_CHANGE_DEBOUNCE_MS = 300;
 
 interface WritingEditorProps {
   content: string;
   onContentChange: (content: string) => void;
   onAIRequest: (action: string, content: string, context?: any) => void;
   isGenerating: boolean;
-  aiResponse: string;
+  subscribeToStream: (listener: StreamListener) => () => void;
 }
 
 export function WritingEditor({
@@ -27,8 +32,13 @@ export function WritingEditor({
   onContentChange,
   onAIRequest,
   isGenerating,
-  aiResponse,
+  subscribeToStream,
 }: WritingEditorProps) {
+  // Serializing with getHTML() is O(document), so debounce it instead of
+  // running it on every keystroke and streamed chunk
+  const contentTimerRef = React.useRef<ReturnType<typeof setTimeout>>();
+  React.useEffect(() => () => clearTimeout(contentTimerRef.current), []);
+
   const editor = useEditor({
     extensions: [
       StarterKit,
@@ -66,7 +76,11 @@ export function WritingEditor({
     ],
     content,
     onUpdate: ({ editor }) => {
-      onContentChange(editor.getHTML());
+      clearTimeout(contentTimerRef.current);
+      contentTimerRef.current = setTimeout(
+        () => onContentChange(editor.getHTML()),
+        CONTENT_CHANGE_DEBOUNCE_MS
+      );
     },
     editorProps: {
       attributes: {
@@ -76,23 +90,30 @@ export function WritingEditor({
     },
   });
 
-  // Handle AI response streaming
-  const lastAiResponseRef = React.useRef("");
-  React.useEffect(() => {
-    if (aiResponse && editor && isGenerating) {
-      // Only insert the new part of the response to avoid duplication
-      const newPart = aiResponse.slice(lastAiResponseRef.current.length);
+  // Stream AI output into the editor, batched per animation frame
+  const streamingSink = useStreamingSink(editor);
+  React.useEffect(
+    () => subscribeToStream(streamingSink),
+    [subscribeToStream, streamingSink]
+  );
+
+  // Precompute likely edits of the paragraph at the cursor while the user is idle
+  useIdlePrefetch(editor, isGenerating);
 
-      if (newPart) {
-        // Insert at current cursor position
-        editor.commands.insertContent(newPart);
-        lastAiResponseRef.current = aiResponse;
-      }
-    } else if (!isGenerating) {
-      // Reset when generation is complete
-      lastAiResponseRef.current = "";
-    }
-  }, [aiResponse, editor, isGenerating]);
+  // Ranked alternatives of the last multi-variant request, offered in the panel
+  const [variants, setVariants] = React.useState<Variant[]>([]);
+  React.useEffect(
+    () =>
+      subscribeToStream({
+        onStart: () => setVariants([]),
+        onBlock: () => {},
+        onChunk: () => {},
+        onReplace: () => {},
+        onComplete: () => {},
+        onVariants: setVariants,
+      }),
+    [subscribeToStream]
+  );
 
   if (!editor) {
     return <div className="animate-pulse bg-muted h-[500px] rounded-md" />;
@@ -139,6 +160,7 @@ export function WritingEditor({
           editor={editor}
           onAIRequest={onAIRequest}
           isGenerating={isGenerating}
+          variants={variants}
         />
       </div>
     </div>
@@ -27,7 +27,7 @@ declare module "@tiptap/core" {
       /**
        * Request AI improvements for the entire document
        */
-      requestAIImprovements: (aspect?: string) => ReturnType;
+      requestAIImprovements: (aspect?: string, variants?: number) => ReturnType;
     };
   }
 }
@@ -126,13 +126,17 @@ export const AIChanges = Extension.create<AIChangesOptions>({
         },
 
       requestAIImprovements:
-        (aspect?: string) =>
+        (aspect?: string, variants = 1) =>
         ({ state }) => {
           const fullText = state.doc.textContent;
 
           const context = {
             aspect: aspect || "general",
             fullDocument: true,
+            // Whole-document passes yield LLM slots to interactive edits
+            priority: "background",
+            // Alternatives are produced concurrently and ranked server-side
+            variants,
           };
 
           // Request AI improvements for the entire document
@@ -100,10 +100,17 @@ export const AIGenerations = Extension.create<AIGenerationsOptions>({
           this.storage.currentPrompt = "continue";
           this.storage.generationPosition = from;
 
-          // Create context for AI request
+          // Send the document around the cursor; the server trims it to a
+          // token budget and retrieves relevant earlier paragraphs
           const context = {
             ...options,
             continueFrom: precedingText,
+            precedingText: state.doc.textBetween(0, from, "\n\n"),
+            followingText: state.doc.textBetween(
+              from,
+              Math.min(state.doc.content.size, from + 1000),
+              "\n\n"
+            ),
             cursorPosition: from,
             type: "continuation",
           };
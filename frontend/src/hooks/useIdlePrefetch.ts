@@ -0,0 +1,62 @@
+import { useEffect } from "react";
+import type { Editor } from "@tiptap/core";
+
+// Quiet time before the paragraph at the cursor is sent for prefetch
+const IDLE_MS = 2000;
+// Shorter paragraphs are skipped by the server anyway
+const MIN_PARAGRAPH_CHARS = 80;
+
+/**
+ * Sends the paragraph at the cursor to /api/prefetch once the user is idle.
+ *
+ * The server computes a general edit of it at background priority into its
+ * response cache, so selecting the paragraph and asking for suggestions is
+ * answered from the cache. Stops after a 404, i.e. when prefetch is disabled.
+ */
+export function useIdlePrefetch(
+  editor: Editor | null,
+  isGenerating: boolean,
+  baseUrl: string = "http://localhost:8000"
+) {
+  useEffect(() => {
+    if (!editor || isGenerating) return;
+
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    let lastSent = "";
+    let disabled = false;
+
+    const prefetch = async () => {
+      if (disabled || editor.isDestroyed) return;
+      const paragraph = editor.state.selection.$from.parent.textContent;
+      if (paragraph.length < MIN_PARAGRAPH_CHARS || paragraph === lastSent) return;
+      lastSent = paragraph;
+
+      try {
+        const response = await fetch(`${baseUrl}/api/prefetch`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          // Same context as a selection edit request, so it hits the cache
+          body: JSON.stringify({ content: paragraph, context: { focus: "general" }, actions: ["edit"] }),
+        });
+        if (response.status === 404) {
+          disabled = true;
+        }
+      } catch {
+        // Prefetch is best effort
+      }
+    };
+
+    const onActivity = () => {
+      clearTimeout(timer);
+      timer = setTimeout(prefetch, IDLE_MS);
+    };
+
+    editor.on("update", onActivity);
+    editor.on("selectionUpdate", onActivity);
+    return () => {
+      clearTimeout(timer);
+      editor.off("update", onActivity);
+      editor.off("selectionUpdate", onActivity);
+    };
+  }, [editor, isGenerating, baseUrl]);
+}
@@ -1,10 +1,28 @@
 import { useState, useCallback, useRef } from "react";
+import { AIResponse, StreamListener, Variant } from "../types";
+
+// Reconnects to /api/stream/{id} after a dropped connection
+const MAX_RESUME_ATTEMPTS = 2;
+
+// Listener callbacks that take streamed text or nothing; variants go through emitVariants
+type TextEvent = Exclude<keyof StreamListener, "onVariants">;
+
+interface StreamProgress {
+  streamId: string | null;
+  // UTF-16 offset of the received output, i.e. its JavaScript string length
+  offset: number;
+  // Index of the last block received
+  block: number;
+  done: boolean;
+  // Text received so far for each alternative of a multi-variant request
+  variants: string[];
+}
 
 interface UseSSEReturn {
   isConnected: boolean;
   sendMessage: (action: string, content: string, context?: any) => void;
   isGenerating: boolean;
-  currentResponse: string;
+  subscribe: (listener: StreamListener) => () => void;
   error: string | null;
 }
 
@@ -19,11 +37,149 @@ export function useSSE(
 ): UseSSEReturn {
   const [isConnected, setIsConnected] = useState(true); // SSE is always "connected"
   const [isGenerating, setIsGenerating] = useState(false);
-  const [currentResponse, setCurrentResponse] = useState("");
   const [error, setError] = useState<string | null>(null);
 
   const abortControllerRef = useRef<AbortController | null>(null);
 
+  // Streamed text goes straight to subscribers instead of React state, so
+  // chunks don't trigger re-renders or rebuild the whole response string
+  const listenersRef = useRef(new Set<StreamListener>());
+
+  const subscribe = useCallback((listener: StreamListener) => {
+    listenersRef.current.add(listener);
+    return () => {
+      listenersRef.current.delete(listener);
+    };
+  }, []);
+
+  const emit = useCallback((event: TextEvent, text = "") => {
+    listenersRef.current.forEach((listener) => {
+      const handler: (text: string) => void = listener[event];
+      handler(text);
+    });
+  }, []);
+
+  const emitVariants = useCallback((variants: Variant[]) => {
+    listenersRef.current.forEach((listener) => listener.onVariants?.(variants));
+  }, []);
+
+  const handleEvent = useCallback(
+    (data: AIResponse, progress: StreamProgress, resumed: boolean) => {
+      switch (data.type) {
+        case "generation_start":
+        case "edit_start":
+        case "improve_start":
+          progress.streamId = data.stream_id || progress.streamId;
+          if (!resumed) {
+            console.log("Stream started:", data.message);
+          }
+          break;
+
+        case "generation_block":
+        case "edit_block":
+        case "improve_block":
+          if (data.variant !== undefined) {
+            // Variants are collected and offered together once ranked
+            if (data.block) {
+              progress.variants[data.variant] = (progress.variants[data.variant] || "") + "\n\n";
+            }
+            break;
+          }
+          progress.block = data.block ?? progress.block + 1;
+          emit("onBlock", data.node || "paragraph");
+          break;
+
+        case "generation_chunk":
+        case "edit_chunk":
+        case "improve_chunk":
+          if (data.content && data.variant !== undefined) {
+            progress.variants[data.variant] = (progress.variants[data.variant] || "") + data.content;
+          } else if (data.content) {
+            if (!data.provisional && data.offset !== undefined) {
+              progress.offset = data.offset + data.content.length;
+            }
+            emit("onChunk", data.content);
+          }
+          break;
+
+        case "generation_replace":
+          // Speculative mode: the final text supersedes the draft
+          progress.offset = (data.content || "").length;
+          emit("onReplace", data.content || "");
+          break;
+
+        case "generation_ranking":
+        case "improve_ranking":
+          emitVariants(
+            (data.variants || []).map((score) => ({
+              ...score,
+              text: progress.variants[score.variant] || "",
+            }))
+          );
+          break;
+
+        case "generation_complete":
+        case "edit_complete":
+        case "improve_complete":
+          console.log("Stream completed:", data.message);
+          progress.done = true;
+          emit("onComplete");
+          setIsGenerating(false);
+          break;
+
+        case "error":
+          progress.done = true;
+          setError(data.message || "Unknown error occurred");
+          emit("onComplete");
+          setIsGenerating(false);
+          break;
+
+        default:
+          console.warn("Unknown SSE event type:", data.type);
+      }
+    },
+    [emit, emitVariants]
+  );
+
+  const readStream = useCallback(
+    async (response: Response, progress: StreamProgress, resumed: boolean) => {
+      const reader = response.body?.getReader();
+      if (!reader) {
+        throw new Error("No response body reader");
+      }
+
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      try {
+        while (true) {
+          const { done, value } = await reader.read();
+
+          if (done) break;
+
+          buffer += decoder.decode(value, { stream: true });
+
+          // Process complete SSE messages
+          const lines = buffer.split("\n");
+          buffer = lines.pop() || ""; // Keep incomplete line in buffer
+
+          for (const line of lines) {
+            if (line.startsWith("data: ")) {
+              try {
+                handleEvent(JSON.parse(line.slice(6)), progress, resumed);
+              } catch (parseError) {
+                console.error("Failed to parse SSE data:", parseError);
+              }
+            }
+          }
+        }
+      } finally {
+        reader.releaseLock();
+      }
+    },
+    [handleEvent]
+  );
+
   const sendMessage = useCallback(
     async (action: string, content: string, context?: any) => {
       // Cancel any ongoing request
@@ -31,10 +187,12 @@ export function useSSE(
         abortControllerRef.current.abort();
       }
 
+      // Position in the output, so a dropped stream can resume where it stopped
+      let progress: StreamProgress | null = null;
       try {
         setError(null);
-        setCurrentResponse("");
         setIsGenerating(true);
+        emit("onStart");
 
         // Create abort controller for this request
         const abortController = new AbortController();
@@ -52,12 +210,16 @@ export function useSSE(
           throw new Error(`Unknown action: ${action}`);
         }
 
-        // Prepare request body based on action
+        // Prepare request body based on action; priority and variants are request fields, not context
+        const { priority = "interactive", variants, ...requestContext } = context || {};
         let requestBody: any;
         if (action === "generate") {
-          requestBody = { prompt: content, context };
+          requestBody = { prompt: content, context: requestContext, priority };
         } else {
-          requestBody = { content, context };
+          requestBody = { content, context: requestContext, priority };
+        }
+        if (variants > 1 && action !== "edit") {
+          requestBody.variants = variants;
         }
 
         console.log(`Starting SSE request to ${baseUrl}${endpoint}`);
@@ -77,89 +239,63 @@ export function useSSE(
           throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
 
-        // Handle SSE stream
-        const reader = response.body?.getReader();
-        if (!reader) {
-          throw new Error("No response body reader");
-        }
-
-        const decoder = new TextDecoder();
-        let buffer = "";
-
-        try {
-          while (true) {
-            const { done, value } = await reader.read();
-
-            if (done) break;
-
-            buffer += decoder.decode(value, { stream: true });
-
-            // Process complete SSE messages
-            const lines = buffer.split("\n");
-            buffer = lines.pop() || ""; // Keep incomplete line in buffer
-
-            for (const line of lines) {
-              if (line.startsWith("data: ")) {
-                try {
-                  const data = JSON.parse(line.slice(6)); // Remove 'data: ' prefix
-
-                  switch (data.type) {
-                    case "generation_start":
-                    case "edit_start":
-                    case "improve_start":
-                      console.log("Stream started:", data.message);
-                      break;
-
-                    case "generation_chunk":
-                    case "edit_chunk":
-                    case "improve_chunk":
-                      if (data.content) {
-                        setCurrentResponse((prev) => prev + data.content);
-                      }
-                      break;
-
-                    case "generation_complete":
-                    case "edit_complete":
-                    case "improve_complete":
-                      console.log("Stream completed:", data.message);
-                      setIsGenerating(false);
-                      break;
-
-                    case "error":
-                      setError(data.message || "Unknown error occurred");
-                      setIsGenerating(false);
-                      break;
-
-                    default:
-                      console.warn("Unknown SSE event type:", data.type);
-                  }
-                } catch (parseError) {
-                  console.error("Failed to parse SSE data:", parseError);
-                }
-              }
+        progress = {
+          streamId: null,
+          offset: 0,
+          block: -1,
+          done: false,
+          variants: [],
+        };
+        let body: Response = response;
+        for (let attempt = 0; ; attempt++) {
+          try {
+            await readStream(body, progress, attempt > 0);
+            break;
+          } catch (streamError: any) {
+            if (
+              streamError.name === "AbortError" ||
+              !progress.streamId ||
+              attempt >= MAX_RESUME_ATTEMPTS
+            ) {
+              throw streamError;
+            }
+            console.warn("Stream interrupted, resuming at offset", progress.offset);
+            body = await fetch(
+              `${baseUrl}/api/stream/${progress.streamId}?offset=${progress.offset}&block=${progress.block}`,
+              { headers: { Accept: "text/event-stream" }, signal: abortController.signal }
+            );
+            if (!body.ok) {
+              throw streamError;
             }
           }
-        } finally {
-          reader.releaseLock();
+        }
+        if (!progress.done) {
+          emit("onComplete");
+          setIsGenerating(false);
         }
       } catch (err: any) {
         if (err.name === "AbortError") {
           console.log("Request was aborted");
+          if (progress?.streamId && !progress.done) {
+            // The server keeps producing for reconnects; tell it nobody will
+            fetch(`${baseUrl}/api/stream/${progress.streamId}`, { method: "DELETE" }).catch(() => {});
+          }
         } else {
           console.error("SSE request failed:", err);
           setError(err.message || "Request failed");
         }
+        emit("onComplete");
         setIsGenerating(false);
       }
     },
-    [baseUrl]
+    [baseUrl, emit, readStream]
   );
 
   return {
     isConnected,
     sendMessage,
     isGenerating,
-    currentResponse,
+    subscribe,
     error,
   };
 }
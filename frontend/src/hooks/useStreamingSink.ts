@@ -0,0 +1,143 @@
+import { useEffect, useMemo } from "react";
+import type { Editor } from "@tiptap/core";
+import type { Transaction } from "@tiptap/pm/state";
+import { StreamListener, Variant } from "../types";
+
+const BLOCK = Symbol("block");
+
+/**
+ * Streams AI output into the editor without per-chunk React state.
+ *
+ * Chunks and block boundaries are appended to a buffer and flushed at most
+ * once per animation frame as a single ProseMirror transaction. The inserted range is mapped
+ * through user edits so later chunks and replacements land in the right place.
+ */
+export function useStreamingSink(editor: Editor | null): StreamListener {
+  const sink = useMemo(() => {
+    // Text chunks, with BLOCK marking where the server starts a new block
+    let parts: Array<string | typeof BLOCK> = [];
+    let blocks = 0;
+    let replacement: string | null = null;
+    let start: number | null = null;
+    let end = 0;
+    let frame: number | null = null;
+    let applying = false;
+
+    const flush = () => {
+      frame = null;
+      if (!editor || editor.isDestroyed) return;
+      if (!parts.length && replacement === null) return;
+
+      const { state } = editor.view;
+      if (start === null) {
+        start = end = state.selection.from;
+      }
+
+      const tr = state.tr;
+      const insertText = (text: string) => {
+        // Paragraph breaks become block splits; everything else is plain text
+        text.split(/\n{2,}/).forEach((segment, index) => {
+          if (index > 0) {
+            tr.split(end);
+            end += 2;
+          }
+          if (segment) {
+            tr.insertText(segment, end);
+            end += segment.length;
+          }
+        });
+      };
+
+      if (replacement !== null) {
+        // Drop everything inserted so far and write the replacement instead
+        tr.delete(start, end);
+        end = start;
+        insertText(replacement);
+        replacement = null;
+      }
+      for (const part of parts) {
+        if (part === BLOCK) {
+          // The first block continues the paragraph at the cursor
+          if (blocks++ > 0) {
+            tr.split(end);
+            end += 2;
+          }
+        } else {
+          insertText(part);
+        }
+      }
+      parts = [];
+
+      applying = true;
+      editor.view.dispatch(tr.scrollIntoView());
+      applying = false;
+    };
+
+    const schedule = () => {
+      if (frame === null) {
+        frame = requestAnimationFrame(flush);
+      }
+    };
+
+    const onTransaction = ({ transaction }: { transaction: Transaction }) => {
+      // Keep the streamed range aligned with edits made by the user
+      if (applying || start === null || !transaction.docChanged) return;
+      start = transaction.mapping.map(start, -1);
+      end = transaction.mapping.map(end, 1);
+    };
+
+    const listener: StreamListener & { onTransaction: typeof onTransaction } = {
+      onStart: () => {
+        if (frame !== null) {
+          cancelAnimationFrame(frame);
+          frame = null;
+        }
+        parts = [];
+        blocks = 0;
+        replacement = null;
+        start = null;
+      },
+      onBlock: () => {
+        parts.push(BLOCK);
+        schedule();
+      },
+      onChunk: (text: string) => {
+        parts.push(text);
+        schedule();
+      },
+      onReplace: (text: string) => {
+        parts = [];
+        blocks = 1; // The replacement text opens the first block
+        replacement = text;
+        schedule();
+      },
+      onVariants: (variants: Variant[]) => {
+        // Only the best-ranked alternative is written into the document
+        if (!variants.length) return;
+        parts = [];
+        blocks = 1;
+        replacement = variants[0].text;
+        schedule();
+      },
+      onComplete: () => {
+        if (frame !== null) {
+          cancelAnimationFrame(frame);
+        }
+        flush();
+        start = null;
+      },
+      onTransaction,
+    };
+    return listener;
+  }, [editor]);
+
+  useEffect(() => {
+    if (!editor) return;
+    editor.on("transaction", sink.onTransaction);
+    return () => {
+      editor.off("transaction", sink.onTransaction);
+    };
+  }, [editor, sink]);
+
+  return sink;
+}
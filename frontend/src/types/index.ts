@@ -1,11 +1,21 @@
+export type Priority = "interactive" | "background";
+
 export interface AIRequest {
   action: "generate" | "edit" | "improve";
   content: string;
   context?: {
+    // Scheduling class; sent as the request's priority field
+    priority?: Priority;
+    // Number of alternatives to generate (generate and improve); sent as the variants field
+    variants?: number;
     style?: string;
     length?: string;
     focus?: string;
     aspect?: string;
+    type?: "continuation" | "from_scratch";
+    precedingText?: string;
+    followingText?: string;
+    cursorPosition?: number;
     selection?: {
       from: number;
       to: number;
@@ -17,17 +27,60 @@ export interface AIRequest {
 export interface AIResponse {
   type:
     | "generation_start"
+    | "generation_block"
     | "generation_chunk"
+    | "generation_replace"
+    | "generation_ranking"
     | "generation_complete"
     | "edit_start"
+    | "edit_block"
     | "edit_chunk"
     | "edit_complete"
     | "improve_start"
+    | "improve_block"
     | "improve_chunk"
+    | "improve_ranking"
     | "improve_complete"
     | "error";
   content?: string;
   message?: string;
+  provisional?: boolean;
+  // Id for resuming the stream via /api/stream/{stream_id} (start events)
+  stream_id?: string;
+  // UTF-16 offset of the chunk or block in the full output
+  offset?: number;
+  // Index of the block the chunk or block event belongs to
+  block?: number;
+  // Node type hint for a new block, e.g. "paragraph" or "heading"
+  node?: string;
+  // Alternative the chunk or block belongs to (multi-variant requests)
+  variant?: number;
+  // Variants ordered best first (ranking events)
+  variants?: VariantScore[];
+}
+
+export interface VariantScore {
+  variant: number;
+  score: number;
+  error?: boolean;
+  theme_coverage?: number;
+  length_fit?: number | null;
+  avg_sentence_words?: number;
+  clean?: boolean;
+}
+
+export interface Variant extends VariantScore {
+  text: string;
+}
+
+export interface StreamListener {
+  onStart: () => void;
+  onBlock: (node: string) => void;
+  onChunk: (text: string) => void;
+  onReplace: (text: string) => void;
+  onComplete: () => void;
+  // Ranked alternatives of a multi-variant request, best first
+  onVariants?: (variants: Variant[]) => void;
 }
 
 export interface WritingDocument {
@@ -59,9 +112,23 @@ export interface EditorSelection {
 }
 
 export interface WebSocketMessage {
-  action: string;
-  content: string;
+  type?: "request" | "cancel" | "ping";
+  id?: string;
+  action?: string;
+  content?: string;
   context?: any;
+  priority?: Priority;
+}
+
+export interface WebSocketEvent {
+  id: string | null;
+  type: AIResponse["type"] | "generation_cancelled" | "edit_cancelled" | "improve_cancelled" | "pong";
+  content?: string;
+  message?: string;
+  provisional?: boolean;
+  offset?: number;
+  block?: number;
+  node?: string;
 }
 
 export interface GenerationOptions {